@@ -0,0 +1,54 @@
+"""
+بنچمارک منبع داده نمودارهای RFM: خواندن دوباره فایل‌های rfm_scores با pd.read_excel (مسیر قبلی build_rfm_charts)
+در برابر read_scores_frame روی جدول rfm_scores دیتابیس با نوع‌های فشرده (segment دسته‌ای، int8، float32)؛
+زمان خواندن و حافظه DataFrame هر مسیر گزارش می‌شود.
+
+اجرا از ریشه پروژه:
+    python -m benchmarks.bench_chart_source --rows 500000
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from benchmarks.bench_rfm_scores_writer import _create_rfm_scores
+from core.db_manager import DBSession
+from core.excel_exporter import ExcelExporter
+from core.rfm_charts import read_scores_frame
+from core.rfm_scores import RFM_SCORES_TABLE
+
+
+def _frame_mb(df: pd.DataFrame) -> float:
+    return df.memory_usage(deep=True).sum() / 1024 / 1024
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--db", type=Path, default=None, help="مسیر دیتابیس (پیش‌فرض: فایل موقت)")
+    args = parser.parse_args()
+
+    db_path = args.db or Path(tempfile.mkdtemp()) / "bench_chart_source.db"
+    out_dir = Path(tempfile.mkdtemp())
+    with DBSession(db_path) as db:
+        print(f"ساخت rfm_scores مصنوعی با {args.rows:,} ردیف در {db_path} ...")
+        _create_rfm_scores(db, args.rows)
+        files = ExcelExporter(db, out_dir).export_view_chunked(RFM_SCORES_TABLE, output_base_name="rfm_scores")
+
+        started = time.perf_counter()
+        df_excel = pd.concat([pd.read_excel(f, sheet_name=0) for f in files], ignore_index=True)
+        t_excel = time.perf_counter() - started
+
+        started = time.perf_counter()
+        df_db = read_scores_frame(db)
+        t_db = time.perf_counter() - started
+
+    print(f"\n{'منبع':<34} {'زمان':>9} {'حافظه (MB)':>11}")
+    print(f"{f'pd.read_excel ({len(files)} فایل)':<34} {t_excel:8.2f}s {_frame_mb(df_excel):11.1f}")
+    print(f"{'read_scores_frame (دیتابیس)':<34} {t_db:8.2f}s {_frame_mb(df_db):11.1f}  ({t_excel / t_db:4.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
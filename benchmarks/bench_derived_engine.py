@@ -0,0 +1,74 @@
+"""
+بنچمارک موتور جداول مشتق: SQLite در برابر DuckDB (core.duckdb_engine) برای
+customer_purchases، user_full_data و rfm_data روی داده مصنوعی، با گزارش زمان کنار هم
+و مقایسه خروجی دو موتور (customer_purchases بدون توجه به ترتیب ردیف‌های هم‌تاریخ).
+
+اجرا از ریشه پروژه (نیاز به pip install duckdb):
+    python -m benchmarks.bench_derived_engine --users 200000 --orders 2000000
+    python -m benchmarks.bench_derived_engine --users 1000000 --orders 10000000 --threads 8
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.synthetic import create_wp_database
+from core.customer_purchases import CUSTOMER_PURCHASES_VIEW, create_customer_purchases_view
+from core.db_manager import DBSession
+from core.duckdb_engine import duckdb_available
+from core.rfm_data import RFM_USER_AGG_TABLE, create_rfm_data_table
+from core.user_full_data import USER_FULL_DATA_TABLE, create_user_full_data_table
+import core.duckdb_engine as duckdb_engine
+
+
+def _builders():
+    return {
+        CUSTOMER_PURCHASES_VIEW: lambda db, engine: create_customer_purchases_view(db, materialize=True, engine=engine),
+        USER_FULL_DATA_TABLE: lambda db, engine: create_user_full_data_table(db, engine=engine),
+        # rfm_user_agg بخش وابسته به موتور rfm_data است (recency به زمان اجرا وابسته است)
+        RFM_USER_AGG_TABLE: lambda db, engine: create_rfm_data_table(
+            db, "0", reference_shamsi_date="1404/01/01", incremental=False, derived_engine=engine
+        ),
+    }
+
+
+def _snapshot(db, table: str) -> list[tuple]:
+    return sorted(db.execute(f'SELECT * FROM "{table}"').fetchall(), key=repr)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200_000)
+    parser.add_argument("--orders", type=int, default=2_000_000)
+    parser.add_argument("--extra-keys", type=int, default=10)
+    parser.add_argument("--threads", type=int, default=0, help="تعداد نخ DuckDB (0 = همه هسته‌ها)")
+    parser.add_argument("--db", type=Path, default=None, help="مسیر دیتابیس (پیش‌فرض: فایل موقت)")
+    args = parser.parse_args()
+    if not duckdb_available():
+        raise SystemExit("پکیج duckdb نصب نیست (pip install duckdb).")
+    duckdb_engine.DUCKDB_THREADS = args.threads
+
+    db_path = args.db or Path(tempfile.mkdtemp()) / "bench_derived_engine.db"
+    report = []
+    with DBSession(db_path) as db:
+        print(f"ساخت داده مصنوعی در {db_path} ...")
+        create_wp_database(db, args.users, args.orders, args.extra_keys)
+        print(f"users={args.users:,}  orders={args.orders:,}")
+
+        for table, build in _builders().items():
+            timings, snapshots = {}, {}
+            for engine in ("sqlite", "duckdb"):
+                started = time.perf_counter()
+                if not build(db, engine):
+                    raise SystemExit(f"ساخت {table} با موتور {engine} ناموفق بود.")
+                timings[engine] = time.perf_counter() - started
+                snapshots[engine] = _snapshot(db, table)
+            report.append((table, timings["sqlite"], timings["duckdb"], snapshots["sqlite"] == snapshots["duckdb"]))
+
+    print(f"\n{'جدول':<22} {'SQLite':>10} {'DuckDB':>10}")
+    for table, slow, fast, same in report:
+        print(f"{table:<22} {slow:9.2f}s {fast:9.2f}s  ({slow / fast:4.1f}x)  یکسان: {'بله' if same else 'خیر'}")
+
+
+if __name__ == "__main__":
+    main()
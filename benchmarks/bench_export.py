@@ -0,0 +1,81 @@
+"""
+بنچمارک خروجی Excel چندفایلی (ExcelExporter.export_view_chunked): نوشتن پشت‌سرهم فایل‌ها
+در برابر نوشتن هم‌زمان هر فایل در یک پردازه (EXPORT_WORKERS)، روی جدول مصنوعی شبیه user_orders.
+زمان کل (wall-clock) هر حالت و یکسان بودن نام فایل‌ها گزارش می‌شود.
+
+اجرا از ریشه پروژه:
+    python -m benchmarks.bench_export --rows 3000000 --workers 4
+    python -m benchmarks.bench_export --rows 5000000 --workers 8 --rows-per-file 500000
+"""
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from config import EXCEL_MAX_ROWS_PER_FILE
+from core.db_manager import DBSession
+from core.excel_exporter import ExcelExporter
+
+
+TABLE = "bench_user_orders"
+
+
+def _create_table(db, rows: int) -> None:
+    """جدول مصنوعی با ستون‌های عددی، تاریخ و متن فارسی (مثل خروجی user_orders)."""
+    db.execute(f'DROP TABLE IF EXISTS "{TABLE}"')
+    db.execute(
+        f"""
+        CREATE TABLE "{TABLE}" AS
+        WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < {int(rows)})
+        SELECT
+            n AS order_id,
+            1 + abs(random()) % 500000 AS customer_id,
+            'مشتری ' || (abs(random()) % 500000) AS display_name,
+            'user' || n || '@example.com' AS user_email,
+            datetime('2020-01-01', '+' || (abs(random()) % 2000) || ' days') AS date_created,
+            round((abs(random()) % 100000000) / 100.0, 2) AS total_sales,
+            CASE abs(random()) % 3 WHEN 0 THEN 'wc-completed' WHEN 1 THEN 'wc-processing' ELSE NULL END AS status
+        FROM seq
+        """
+    )
+    db.commit()
+
+
+def _timed_export(db, workers: int, rows_per_file: int) -> tuple[float, list[str]]:
+    out_dir = Path(tempfile.mkdtemp())
+    started = time.perf_counter()
+    paths = ExcelExporter(db, out_dir).export_view_chunked(
+        TABLE,
+        output_base_name="user_orders",
+        max_rows_per_file=rows_per_file,
+        column_formats={"total_sales": "#,##0"},
+        workers=workers,
+    )
+    return time.perf_counter() - started, [p.name for p in paths]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=3_000_000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--rows-per-file", type=int, default=EXCEL_MAX_ROWS_PER_FILE)
+    parser.add_argument("--db", type=Path, default=None, help="مسیر دیتابیس (پیش‌فرض: فایل موقت)")
+    args = parser.parse_args()
+
+    db_path = args.db or Path(tempfile.mkdtemp()) / "bench_export.db"
+    with DBSession(db_path) as db:
+        print(f"ساخت {args.rows:,} ردیف مصنوعی در {db_path} ...")
+        _create_table(db, args.rows)
+
+        t_seq, names_seq = _timed_export(db, 1, args.rows_per_file)
+        t_par, names_par = _timed_export(db, args.workers, args.rows_per_file)
+
+    print(f"\nفایل‌ها: {len(names_seq)}  هسته‌های CPU: {os.cpu_count()}")
+    print(f"{'پشت‌سرهم':<22} {t_seq:8.2f}s")
+    print(f"{f'{args.workers} worker':<22} {t_par:8.2f}s  ({t_seq / t_par:4.1f}x)")
+    print(f"نام فایل‌ها یکسان: {'بله' if names_seq == names_par else 'خیر'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+بنچمارک قالب‌های خروجی (ExcelExporter.export_view): Excel چندفایلی در برابر csv.gz، parquet و arrow
+روی جدول مصنوعی شبیه user_orders؛ زمان نوشتن و حجم کل فایل‌های هر قالب گزارش می‌شود.
+قالب‌های parquet و arrow فقط اگر pyarrow نصب باشد اجرا می‌شوند.
+
+اجرا از ریشه پروژه:
+    python -m benchmarks.bench_export_formats --rows 1000000
+    python -m benchmarks.bench_export_formats --rows 3000000 --formats csv parquet
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.bench_export import TABLE, _create_table
+from core.db_manager import DBSession
+from core.excel_exporter import EXPORT_FORMATS, ExcelExporter, export_format_available
+
+
+def _timed_export(db, export_format: str) -> tuple[float, int, int]:
+    """برمی‌گرداند (زمان، حجم کل بایت، تعداد فایل)."""
+    out_dir = Path(tempfile.mkdtemp())
+    started = time.perf_counter()
+    paths = ExcelExporter(db, out_dir).export_view(
+        TABLE,
+        output_base_name="user_orders",
+        export_format=export_format,
+        column_formats={"total_sales": "#,##0"},
+    )
+    elapsed = time.perf_counter() - started
+    return elapsed, sum(p.stat().st_size for p in paths), len(paths)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--formats", nargs="+", default=list(EXPORT_FORMATS), choices=list(EXPORT_FORMATS))
+    parser.add_argument("--db", type=Path, default=None, help="مسیر دیتابیس (پیش‌فرض: فایل موقت)")
+    args = parser.parse_args()
+
+    formats = [f for f in args.formats if export_format_available(f)]
+    skipped = [f for f in args.formats if f not in formats]
+    db_path = args.db or Path(tempfile.mkdtemp()) / "bench_export_formats.db"
+    with DBSession(db_path) as db:
+        print(f"ساخت {args.rows:,} ردیف مصنوعی در {db_path} ...")
+        _create_table(db, args.rows)
+        results = {fmt: _timed_export(db, fmt) for fmt in formats}
+
+    print(f"\n{'قالب':<10} {'زمان':>9} {'ردیف/ثانیه':>12} {'حجم (MB)':>10} {'فایل':>5}")
+    for fmt, (elapsed, size, files) in results.items():
+        print(f"{fmt:<10} {elapsed:8.2f}s {args.rows / elapsed:12,.0f} {size / 1024 / 1024:10.1f} {files:>5}")
+    if skipped:
+        print(f"اجرا نشد (pyarrow نصب نیست): {', '.join(skipped)}")
+
+
+if __name__ == "__main__":
+    main()
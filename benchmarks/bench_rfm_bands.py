@@ -0,0 +1,93 @@
+"""
+بنچمارک باندهای Quantile و آمار rfm_constant: سه NTILE و سه اسکن آمار جدا (benchmarks.sql_reference)
+در برابر یک بار خواندن rfm_data (_fetch_all_metric_bands) روی جدول rfm_data مصنوعی،
+با مقایسه خروجی دو مسیر؛ و باندهای تقریبی KLL sketch (RFM_QUANTILE_MODE="sketch") با بیشترین خطای رتبه.
+
+اجرا از ریشه پروژه:
+    python -m benchmarks.bench_rfm_bands --users 2000000
+    python -m benchmarks.bench_rfm_bands --users 5000000 --bands 10
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.sql_reference import fetch_metric_bands, fetch_metric_stats
+from config import RFM_QUANTILE_BANDS, RFM_SKETCH_EPSILON
+from core.db_manager import DBSession
+from core.quantile_sketch import build_metric_sketches, k_for_epsilon
+from core.rfm_constants import (
+    _fetch_all_metric_bands,
+    _sketch_metric_bands,
+    _sketch_report_rows,
+)
+from core.rfm_data import RFM_DATA_TABLE
+from core.rfm_numpy import load_metric_arrays
+
+
+METRICS = ["recency_days", "total_orders", "total_spent"]
+
+
+def _create_rfm_data(db, users: int) -> None:
+    """rfm_data مصنوعی: مقادیر تکراری زیاد (مثل داده واقعی) و چند درصد NULL."""
+    db.execute(f'DROP TABLE IF EXISTS "{RFM_DATA_TABLE}"')
+    db.execute(
+        f'CREATE TABLE "{RFM_DATA_TABLE}" (user_id INTEGER, recency_days INTEGER, total_orders INTEGER, total_spent REAL)'
+    )
+    db.execute(
+        f"""
+        INSERT INTO "{RFM_DATA_TABLE}"
+        WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < {int(users)})
+        SELECT
+            n,
+            CASE WHEN abs(random()) % 50 = 0 THEN NULL ELSE abs(random()) % 2000 END,
+            1 + abs(random()) % 3 + (abs(random()) % 100 = 0) * (abs(random()) % 200),
+            CASE WHEN abs(random()) % 50 = 0 THEN NULL ELSE round((abs(random()) % 100000000) / 100.0, 2) END
+        FROM seq
+        """
+    )
+    db.commit()
+
+
+def _bands_sql(db, bands: int):
+    return {m: (fetch_metric_bands(db, m, bands), fetch_metric_stats(db, m)) for m in METRICS}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2_000_000)
+    parser.add_argument("--bands", type=int, default=max(2, int(RFM_QUANTILE_BANDS)))
+    parser.add_argument("--epsilon", type=float, default=RFM_SKETCH_EPSILON, help="خطای رتبه مجاز sketch")
+    parser.add_argument("--db", type=Path, default=None, help="مسیر دیتابیس (پیش‌فرض: فایل موقت)")
+    args = parser.parse_args()
+
+    db_path = args.db or Path(tempfile.mkdtemp()) / "bench_rfm_bands.db"
+    with DBSession(db_path) as db:
+        print(f"ساخت rfm_data مصنوعی با {args.users:,} کاربر در {db_path} ...")
+        _create_rfm_data(db, args.users)
+
+        started = time.perf_counter()
+        by_sql = _bands_sql(db, args.bands)
+        t_sql = time.perf_counter() - started
+
+        started = time.perf_counter()
+        one_pass = _fetch_all_metric_bands(db, METRICS, args.bands)
+        t_one = time.perf_counter() - started
+
+        started = time.perf_counter()
+        sketches = build_metric_sketches(db, RFM_DATA_TABLE, METRICS, k_for_epsilon(args.epsilon))
+        approx = _sketch_metric_bands(sketches, METRICS, args.bands)
+        t_sketch = time.perf_counter() - started
+        report = _sketch_report_rows(approx, load_metric_arrays(db, RFM_DATA_TABLE, METRICS), args.bands)
+        worst = max((max(row[4], row[7]) for row in report), default=0.0)
+
+    print(f"\n{'مسیر':<34} {'زمان':>9}")
+    print(f"{'NTILE + آمار (۶ اسکن جدا)':<34} {t_sql:8.2f}s")
+    print(f"{'یک بار خواندن (np.partition)':<34} {t_one:8.2f}s  ({t_sql / t_one:4.1f}x)")
+    print(f"{'KLL sketch (تقریبی)':<34} {t_sketch:8.2f}s  ({t_sql / t_sketch:4.1f}x)")
+    print(f"یکسان (یک بار خواندن): {'بله' if by_sql == one_pass else 'خیر'}")
+    print(f"sketch: k={k_for_epsilon(args.epsilon)}  بیشترین خطای رتبه={worst:.4%}  (مجاز {args.epsilon:.2%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+بنچمارک ساخت rfm_data: کوئری پنجره‌ای قبلی (GROUP BY + ROW_NUMBER روی همه سفارش‌ها و join)
+در برابر ساخت تک‌پاس (یک GROUP BY با max روی کلید (date_created, order_id)).
+
+اجرا از ریشه پروژه:
+    python -m benchmarks.bench_rfm_data --users 1000000 --orders 10000000
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.synthetic import create_orders, create_users
+from core.db_manager import DBSession
+from core.jalali import register_shamsi_functions
+from core.rfm_data import rfm_user_agg_select_sql
+
+
+def _build(db, table: str, single_scan: bool) -> float:
+    db.execute(f'DROP TABLE IF EXISTS "{table}"')
+    started = time.perf_counter()
+    db.executescript(f'CREATE TABLE "{table}" AS' + rfm_user_agg_select_sql("c.customer_id", None, single_scan))
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200_000)
+    parser.add_argument("--orders", type=int, default=2_000_000)
+    parser.add_argument("--repeat", type=int, default=2)
+    parser.add_argument("--db", type=Path, default=None, help="مسیر دیتابیس (پیش‌فرض: فایل موقت)")
+    args = parser.parse_args()
+
+    db_path = args.db or Path(tempfile.mkdtemp()) / "bench_rfm_data.db"
+    with DBSession(db_path) as db:
+        print(f"ساخت داده مصنوعی در {db_path} ...")
+        create_users(db, args.users)
+        create_orders(db, args.users, args.orders)
+        db.ensure_recommended_indexes()
+        print(f"users={args.users:,}  orders={args.orders:,}")
+
+        register_shamsi_functions(db)
+        # هر روش چند بار به تناوب اجرا می‌شود و بهترین زمان گزارش می‌شود (حذف اثر کش سرد)
+        window = single = float("inf")
+        for _ in range(args.repeat):
+            window = min(window, _build(db, "rfm_window", single_scan=False))
+            single = min(single, _build(db, "rfm_single_scan", single_scan=True))
+
+        rows = db.execute('SELECT COUNT(*) FROM "rfm_single_scan"').fetchone()[0]
+        diff = db.execute(
+            """SELECT COUNT(*) FROM (
+                SELECT * FROM rfm_window EXCEPT SELECT * FROM rfm_single_scan
+                UNION ALL
+                SELECT * FROM rfm_single_scan EXCEPT SELECT * FROM rfm_window
+            )"""
+        ).fetchone()[0]
+        same_schema = db.execute(
+            "SELECT COUNT(DISTINCT replace(sql, name, '')) FROM sqlite_master WHERE name IN ('rfm_window', 'rfm_single_scan')"
+        ).fetchone()[0] == 1
+
+    print(f"آمار rfm - پنجره‌ای (ROW_NUMBER): {window:8.2f} s")
+    print(f"آمار rfm - تک‌پاس:                {single:8.2f} s  ({window / single:.1f}x)")
+    print(f"تعداد ردیف: {rows:,}   ردیف‌های متفاوت: {diff}   ستون‌های یکسان: {'بله' if same_schema else 'خیر'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+بنچمارک موتور RFM: مسیر SQLite / حلقه پایتونی در برابر موتور NumPy (core.rfm_numpy)
+برای دو مرحله روی rfm_data ساخته‌شده با SQLite: باندهای Quantile و آمار rfm_constant، امتیاز و سگمنت rfm_scores.
+خروجی هر مرحله در دو موتور مقایسه می‌شود (مبالغ اعشاری تا میانگین‌های float هم بیت‌به‌بیت چک شوند).
+
+اجرا از ریشه پروژه:
+    python -m benchmarks.bench_rfm_engine --users 100000 --orders 1000000
+    python -m benchmarks.bench_rfm_engine --users 1000000 --orders 10000000
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.sql_reference import fetch_metric_bands, fetch_metric_stats
+from benchmarks.synthetic import create_orders, create_users
+from config import RFM_QUANTILE_BANDS
+from core.db_manager import DBSession
+from core.rfm_data import RFM_DATA_TABLE, create_rfm_data_table
+from core.rfm_numpy import (
+    assign_segments,
+    compile_segment_rules,
+    compile_thresholds,
+    load_metric_arrays,
+    metric_stats,
+    ntile_bands,
+    score_values,
+    to_float,
+)
+
+
+METRICS = ["recency_days", "total_orders", "total_spent"]
+
+# قواعد سگمنت پیش‌فرض rfm_constant (۵ باند)
+SEGMENT_RULES = [
+    ("Champions", 4, 5, 4, 5, 4, 5),
+    ("Loyal Customers", 3, 5, 4, 5, 3, 5),
+    ("Potential Loyalist", 4, 5, 2, 3, 2, 5),
+    ("At Risk", 1, 2, 3, 5, 3, 5),
+    ("Hibernating", 1, 2, 1, 2, 1, 2),
+]
+
+
+def _timed(func):
+    started = time.perf_counter()
+    result = func()
+    return time.perf_counter() - started, result
+
+
+def _constants_sqlite(db, bands: int):
+    return [(fetch_metric_bands(db, m, bands), fetch_metric_stats(db, m)) for m in METRICS]
+
+
+def _constants_numpy(db, bands: int):
+    arrays = load_metric_arrays(db, RFM_DATA_TABLE, METRICS)
+    return [(ntile_bands(arrays[m], bands), metric_stats(arrays[m])) for m in METRICS]
+
+
+def _rules_from_bands(constants, bands: int) -> dict[str, list[tuple[float, float, int]]]:
+    rules = {}
+    for metric, (metric_bands, _stats) in zip(METRICS, constants):
+        rules[metric] = sorted(
+            (lo, hi, bands + 1 - b if metric == "recency_days" else b) for b, lo, hi, _cnt in metric_bands
+        )
+    return rules
+
+
+def _score_by_rules(value, rules: list[tuple[float, float, int]]) -> int:
+    """
+    امتیازدهی ردیف‌به‌ردیف (مرجع مقایسه): اولین بازه منطبق، سپس کمتر از اولین min / بیشتر از آخرین max،
+    سپس نزدیک‌ترین مرکز بازه.
+    """
+    v = to_float(value)
+    if v is None:
+        return 0
+    for min_v, max_v, score in rules:
+        if min_v <= v <= max_v:
+            return score
+    if v < rules[0][0]:
+        return rules[0][2]
+    if v > rules[-1][1]:
+        return rules[-1][2]
+    best_score = rules[0][2]
+    best_dist = float("inf")
+    for min_v, max_v, score in rules:
+        d = abs(v - (min_v + max_v) / 2)
+        if d < best_dist:
+            best_dist = d
+            best_score = score
+    return best_score
+
+
+def _edge_rows(rules) -> list[tuple]:
+    """مرزهای هر بازه، مقدار بین بازه‌ها و مقادیر بیرون از دامنه (برای چک یکسانی رفتار مرزی)."""
+    columns = []
+    for metric in METRICS:
+        values = [None]
+        for lo, hi, _score in rules[metric]:
+            values += [lo, hi, float(np.nextafter(lo, -np.inf)), float(np.nextafter(hi, np.inf)), (lo + hi) / 2]
+        values += [rules[metric][0][0] - 1e9, rules[metric][-1][1] + 1e9]
+        columns.append(values)
+    size = max(len(c) for c in columns)
+    return list(zip(*(c + [c[-1]] * (size - len(c)) for c in columns)))
+
+
+def _scores_python(rows, rules):
+    out = []
+    for recency, orders, spent in rows:
+        r = _score_by_rules(recency, rules["recency_days"])
+        f = _score_by_rules(orders, rules["total_orders"])
+        m = _score_by_rules(spent, rules["total_spent"])
+        segment = "Unclassified"
+        for seg, r_min, r_max, f_min, f_max, m_min, m_max in SEGMENT_RULES:
+            if r_min <= r <= r_max and f_min <= f <= f_max and m_min <= m <= m_max:
+                segment = seg
+                break
+        out.append((r, f, m, segment))
+    return out
+
+
+def _scores_numpy(rows, rules):
+    edges = {metric: compile_thresholds(rules[metric]) for metric in METRICS}
+    columns = [np.array(c, dtype=np.float64) for c in zip(*rows)]
+    r = score_values(columns[0], edges["recency_days"])
+    f = score_values(columns[1], edges["total_orders"])
+    m = score_values(columns[2], edges["total_spent"])
+    segments = assign_segments(r, f, m, compile_segment_rules(SEGMENT_RULES))
+    return list(zip(r.tolist(), f.tolist(), m.tolist(), segments.tolist()))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--orders", type=int, default=1_000_000)
+    parser.add_argument("--db", type=Path, default=None, help="مسیر دیتابیس (پیش‌فرض: فایل موقت)")
+    args = parser.parse_args()
+    bands = max(2, int(RFM_QUANTILE_BANDS))
+
+    db_path = args.db or Path(tempfile.mkdtemp()) / "bench_rfm_engine.db"
+    with DBSession(db_path) as db:
+        print(f"ساخت داده مصنوعی در {db_path} ...")
+        create_users(db, args.users)
+        create_orders(db, args.users, args.orders, fractional=True)
+        db.ensure_recommended_indexes()
+        print(f"users={args.users:,}  orders={args.orders:,}")
+
+        if not create_rfm_data_table(db, "0", reference_shamsi_date="1404/01/01", incremental=False):
+            raise SystemExit("ساخت rfm_data ناموفق بود.")
+
+        t_const_sql, const_sql = _timed(lambda: _constants_sqlite(db, bands))
+        t_const_np, const_np = _timed(lambda: _constants_numpy(db, bands))
+
+        rules = _rules_from_bands(const_sql, bands)
+        metric_rows = db.execute(f'SELECT {", ".join(METRICS)} FROM "{RFM_DATA_TABLE}"').fetchall()
+        metric_rows += _edge_rows(rules)
+        t_score_py, scores_py = _timed(lambda: _scores_python(metric_rows, rules))
+        t_score_np, scores_np = _timed(lambda: _scores_numpy(metric_rows, rules))
+
+    def line(title, slow, fast, same):
+        print(f"{title:<28} SQLite/پایتون: {slow:8.2f} s   NumPy: {fast:8.2f} s  ({slow / fast:5.1f}x)  یکسان: {'بله' if same else 'خیر'}")
+
+    line("rfm_constant (باند و آمار)", t_const_sql, t_const_np, const_sql == const_np)
+    line("rfm_scores (امتیاز و سگمنت)", t_score_py, t_score_np, scores_py == scores_np)
+
+
+if __name__ == "__main__":
+    main()
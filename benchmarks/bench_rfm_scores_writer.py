@@ -0,0 +1,124 @@
+"""
+بنچمارک نوشتن rfm_scores.xlsx روی جدول rfm_scores مصنوعی: openpyxl write_only (مسیر قبلی Excel)
+و xlsxwriter با write_row بدون فرمت (مسیر قبلی دیتابیس) در برابر export_view_chunked
+(constant_memory، برنامه ستونی، RTL، #,##0 و تقسیم در EXCEL_MAX_ROWS_PER_FILE)؛ ردیف در ثانیه هر مسیر.
+
+اجرا از ریشه پروژه:
+    python -m benchmarks.bench_rfm_scores_writer --rows 2000000
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import xlsxwriter
+from openpyxl import Workbook
+
+from config import EXCEL_MAX_ROWS_PER_FILE
+from core.db_manager import DBSession
+from core.excel_exporter import ExcelExporter
+from core.rfm_scores import RFM_SCORES_COLUMNS, RFM_SCORES_TABLE
+from flows import RFM_SCORES_COLUMN_FORMATS
+
+
+def _create_rfm_scores(db, rows: int) -> None:
+    """rfm_scores مصنوعی با همان ستون‌ها (امتیاز، سگمنت، مبالغ و تاریخ‌ها)."""
+    db.execute(f'DROP TABLE IF EXISTS "{RFM_SCORES_TABLE}"')
+    db.execute(
+        f"""
+        CREATE TABLE "{RFM_SCORES_TABLE}" AS
+        WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < {int(rows)})
+        SELECT
+            n AS user_id,
+            1 + abs(random()) % 5 AS r_score,
+            1 + abs(random()) % 5 AS f_score,
+            1 + abs(random()) % 5 AS m_score,
+            '' AS rfm_score,
+            CASE abs(random()) % 4 WHEN 0 THEN 'Champions' WHEN 1 THEN 'At Risk'
+                WHEN 2 THEN 'Hibernating' ELSE 'Loyal Customers' END AS segment,
+            abs(random()) % 2000 AS recency_days,
+            1 + abs(random()) % 20 AS total_orders,
+            round((abs(random()) % 100000000) / 100.0, 2) AS total_spent,
+            round((abs(random()) % 10000000) / 100.0, 2) AS last_order_amount,
+            datetime('2020-01-01', '+' || (abs(random()) % 2000) || ' days') AS last_order_date,
+            '1402/05/17 10:20:30' AS last_order_date_shamsi
+        FROM seq
+        """
+    )
+    db.execute(f'UPDATE "{RFM_SCORES_TABLE}" SET rfm_score = r_score || f_score || m_score')
+    db.commit()
+
+
+def _rows(db):
+    cursor = db.execute(f'SELECT * FROM "{RFM_SCORES_TABLE}" ORDER BY rowid')
+    while True:
+        rows = cursor.fetchmany(10_000)
+        if not rows:
+            break
+        yield from rows
+
+
+def _openpyxl_write_only(db, out_dir: Path) -> float:
+    """مسیر قبلی Excel: Workbook(write_only=True) و ws.append هر ردیف، یک فایل بدون سقف ردیف."""
+    started = time.perf_counter()
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("rfm_scores")
+    ws.append(list(RFM_SCORES_COLUMNS))
+    for row in _rows(db):
+        ws.append(list(row))
+    wb.save(out_dir / "openpyxl.xlsx")
+    return time.perf_counter() - started
+
+
+def _xlsxwriter_write_row(db, out_dir: Path) -> float:
+    """مسیر قبلی دیتابیس: xlsxwriter constant_memory و write_row بدون فرمت، یک فایل."""
+    started = time.perf_counter()
+    wb = xlsxwriter.Workbook(
+        str(out_dir / "write_row.xlsx"), options={"strings_to_urls": False, "constant_memory": True}
+    )
+    ws = wb.add_worksheet("rfm_scores")
+    ws.write_row(0, 0, RFM_SCORES_COLUMNS)
+    for row_idx, row in enumerate(_rows(db), start=1):
+        ws.write_row(row_idx, 0, row)
+    wb.close()
+    return time.perf_counter() - started
+
+
+def _chunked(db, out_dir: Path, rows_per_file: int) -> tuple[float, int]:
+    started = time.perf_counter()
+    paths = ExcelExporter(db, out_dir).export_view_chunked(
+        RFM_SCORES_TABLE,
+        output_base_name="rfm_scores",
+        max_rows_per_file=rows_per_file,
+        column_formats=RFM_SCORES_COLUMN_FORMATS,
+    )
+    return time.perf_counter() - started, len(paths)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--rows-per-file", type=int, default=EXCEL_MAX_ROWS_PER_FILE)
+    parser.add_argument("--db", type=Path, default=None, help="مسیر دیتابیس (پیش‌فرض: فایل موقت)")
+    args = parser.parse_args()
+
+    db_path = args.db or Path(tempfile.mkdtemp()) / "bench_rfm_scores_writer.db"
+    out_dir = Path(tempfile.mkdtemp())
+    with DBSession(db_path) as db:
+        print(f"ساخت rfm_scores مصنوعی با {args.rows:,} ردیف در {db_path} ...")
+        _create_rfm_scores(db, args.rows)
+        t_openpyxl = _openpyxl_write_only(db, out_dir)
+        t_write_row = _xlsxwriter_write_row(db, out_dir)
+        t_chunked, files = _chunked(db, out_dir, args.rows_per_file)
+
+    print(f"\n{'مسیر':<34} {'زمان':>9} {'ردیف/ثانیه':>12}")
+    for label, elapsed in (
+        ("openpyxl write_only (یک فایل)", t_openpyxl),
+        ("xlsxwriter write_row (یک فایل)", t_write_row),
+        (f"export_view_chunked ({files} فایل)", t_chunked),
+    ):
+        print(f"{label:<34} {elapsed:8.2f}s {args.rows / elapsed:12,.0f}  ({t_openpyxl / elapsed:4.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+بنچمارک نوشتن ردیف‌ها در xlsxwriter (خروجی chunked): حلقه قبلی هر سلول (isinstance، فرمت ستون و ws.write)
+در برابر برنامه نوشتن ستونی (_column_writers: write_number / write_string / write_blank از پیش انتخاب‌شده)،
+با گزارش ردیف در ثانیه و مقایسه XML شیت دو خروجی.
+
+اجرا از ریشه پروژه:
+    python -m benchmarks.bench_row_writer --rows 500000
+"""
+import argparse
+import random
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+
+from core.excel_exporter import _column_writers, _ensure_str, _open_chunk_workbook, _write_rows
+
+
+COLUMNS = [
+    "order_id",
+    "customer_id",
+    "display_name",
+    "user_email",
+    "date_created",
+    "date_created_shamsi",
+    "total_sales",
+    "status",
+    "billing_phone",
+    "city",
+    "total_orders",
+    "last_order_amount",
+]
+COLUMN_FORMATS = {"total_sales": "#,##0", "last_order_amount": "#,##0"}
+
+
+def _rows(count: int, seed: int = 1) -> list[tuple]:
+    rnd = random.Random(seed)
+    cities = ["تهران", "مشهد", "اصفهان", "شیراز", None]
+    return [
+        (
+            i,
+            rnd.randint(1, 500_000),
+            f"مشتری {rnd.randint(1, 500_000)}",
+            f"user{i}@example.com",
+            f"2024-0{rnd.randint(1, 9)}-1{rnd.randint(0, 9)} 10:20:30",
+            f"1403/0{rnd.randint(1, 9)}/1{rnd.randint(0, 9)} 10:20:30",
+            round(rnd.uniform(1_000, 50_000_000), 2),
+            rnd.choice(["wc-completed", "wc-processing", None]),
+            f"0912{rnd.randint(1_000_000, 9_999_999)}",
+            rnd.choice(cities),
+            rnd.randint(1, 40),
+            rnd.choice([None, round(rnd.uniform(1_000, 5_000_000), 2)]),
+        )
+        for i in range(count)
+    ]
+
+
+def _write_legacy(path: Path, rows: list[tuple]) -> float:
+    """حلقه قبلی export_view_chunked: برای هر سلول isinstance، انتخاب فرمت ستون و ws.write."""
+    wb, ws, rtl_format, number_formats = _open_chunk_workbook(path, "user_orders", COLUMNS, COLUMN_FORMATS)
+    started = time.perf_counter()
+    for row_idx, row in enumerate(rows):
+        for col_idx, val in enumerate(row):
+            if val is None:
+                ws.write(row_idx + 1, col_idx, "", rtl_format)
+            elif isinstance(val, (int, float)):
+                fmt = number_formats[col_idx] if col_idx < len(number_formats) else rtl_format
+                ws.write(row_idx + 1, col_idx, val, fmt)
+            else:
+                ws.write(row_idx + 1, col_idx, _ensure_str(val), rtl_format)
+    wb.close()
+    return time.perf_counter() - started
+
+
+def _write_planned(path: Path, rows: list[tuple]) -> float:
+    wb, ws, rtl_format, number_formats = _open_chunk_workbook(path, "user_orders", COLUMNS, COLUMN_FORMATS)
+    started = time.perf_counter()
+    _write_rows(_column_writers(ws, len(COLUMNS), rtl_format, number_formats), rows, 1)
+    wb.close()
+    return time.perf_counter() - started
+
+
+def _sheet_xml(path: Path) -> bytes:
+    with zipfile.ZipFile(path) as zf:
+        return zf.read("xl/worksheets/sheet1.xml") + zf.read("xl/styles.xml")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=500_000)
+    args = parser.parse_args()
+
+    rows = _rows(args.rows)
+    out_dir = Path(tempfile.mkdtemp())
+    t_legacy = _write_legacy(out_dir / "legacy.xlsx", rows)
+    t_planned = _write_planned(out_dir / "planned.xlsx", rows)
+
+    print(f"ردیف‌ها: {args.rows:,} × {len(COLUMNS)} ستون")
+    print(f"{'ws.write هر سلول':<24} {t_legacy:7.2f}s  {args.rows / t_legacy:10,.0f} ردیف/ثانیه")
+    print(
+        f"{'برنامه ستونی':<24} {t_planned:7.2f}s  {args.rows / t_planned:10,.0f} ردیف/ثانیه"
+        f"  ({t_legacy / t_planned:4.2f}x)"
+    )
+    same = _sheet_xml(out_dir / "legacy.xlsx") == _sheet_xml(out_dir / "planned.xlsx")
+    print(f"XML شیت یکسان: {'بله' if same else 'خیر'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+بنچمارک خروجی فایل هر سگمنت: یک کوئری فیلترشده (WHERE segment = ? و ORDER BY) برای هر سگمنت
+در برابر یک بار خواندن rfm_scores + user_full_data و پخش ردیف‌ها به نویسنده‌های هم‌زمان (export_fanout)،
+روی جدول‌های مصنوعی؛ زمان کل و یکسان بودن نام فایل‌های دو روش گزارش می‌شود.
+
+اجرا از ریشه پروژه:
+    python -m benchmarks.bench_segment_export --users 1000000
+    python -m benchmarks.bench_segment_export --users 2000000 --format xlsx
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from core.db_manager import DBSession
+from core.excel_exporter import EXPORT_FORMATS, ExcelExporter, _export_cursor, _file_part, resolve_export_format
+from core.rfm_scores import RFM_SCORES_TABLE, segment_contacts_sql
+from core.user_full_data import USER_FULL_DATA_TABLE
+
+
+SEGMENTS = [
+    "Champions",
+    "Loyal Customers",
+    "Potential Loyalist",
+    "New Customers",
+    "Promising",
+    "Need Attention",
+    "About To Sleep",
+    "At Risk",
+    "Hibernating",
+    "Lost",
+]
+
+
+def _create_tables(db, users: int) -> None:
+    """rfm_scores و user_full_data مصنوعی (ستون‌های لازم خروجی سگمنت)."""
+    segment_case = " ".join(f"WHEN {i} THEN '{name}'" for i, name in enumerate(SEGMENTS))
+    db.execute(f'DROP TABLE IF EXISTS "{RFM_SCORES_TABLE}"')
+    db.execute(f'DROP TABLE IF EXISTS "{USER_FULL_DATA_TABLE}"')
+    db.execute(
+        f"""
+        CREATE TABLE "{RFM_SCORES_TABLE}" AS
+        WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < {int(users)})
+        SELECT
+            n AS user_id,
+            1 + abs(random()) % 5 AS r_score,
+            1 + abs(random()) % 5 AS f_score,
+            1 + abs(random()) % 5 AS m_score,
+            '' AS rfm_score,
+            CASE abs(random()) % {len(SEGMENTS)} {segment_case} END AS segment,
+            abs(random()) % 2000 AS recency_days,
+            1 + abs(random()) % 20 AS total_orders,
+            round((abs(random()) % 100000000) / 100.0, 2) AS total_spent,
+            round((abs(random()) % 10000000) / 100.0, 2) AS last_order_amount,
+            datetime('2020-01-01', '+' || (abs(random()) % 2000) || ' days') AS last_order_date,
+            '1400/01/01' AS last_order_date_shamsi
+        FROM seq
+        """
+    )
+    db.execute(f'UPDATE "{RFM_SCORES_TABLE}" SET rfm_score = r_score || f_score || m_score')
+    db.execute(
+        f"""
+        CREATE TABLE "{USER_FULL_DATA_TABLE}" AS
+        WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < {int(users)})
+        SELECT
+            n AS ID,
+            'user' || n || '@example.com' AS user_email,
+            'مشتری ' || n AS display_name,
+            '0912' || (1000000 + abs(random()) % 9000000) AS digits_phone
+        FROM seq
+        """
+    )
+    db.commit()
+
+
+def _per_segment(db, export_format: str) -> tuple[float, dict[str, int]]:
+    """روش ساده: برای هر سگمنت یک کوئری فیلترشده (اسکن، join و مرتب‌سازی جدا)."""
+    out_dir = Path(tempfile.mkdtemp())
+    query = segment_contacts_sql(db)
+    base = query.replace("ORDER BY s.rowid", "")
+    started = time.perf_counter()
+    for segment in db.execute(f'SELECT DISTINCT segment FROM "{RFM_SCORES_TABLE}"').fetchall():
+        segment = segment[0]
+        cursor = db.execute(
+            f"SELECT * FROM ({base}) WHERE segment = '{segment}' ORDER BY user_id"
+        )
+        columns = [desc[0] for desc in cursor.description]
+        _export_cursor(
+            db, None, cursor, columns, out_dir, f"segment_{_file_part(segment)}", export_format, 500_000, None
+        )
+    return time.perf_counter() - started, _file_names(out_dir)
+
+
+def _fanout(db, export_format: str) -> tuple[float, dict[str, int]]:
+    out_dir = Path(tempfile.mkdtemp())
+    started = time.perf_counter()
+    ExcelExporter(db, out_dir).export_fanout(segment_contacts_sql(db), "segment", "segment", export_format)
+    return time.perf_counter() - started, _file_names(out_dir)
+
+
+def _file_names(out_dir: Path) -> list[str]:
+    return sorted(path.name for path in out_dir.iterdir())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--format", default="csv", choices=list(EXPORT_FORMATS))
+    parser.add_argument("--db", type=Path, default=None, help="مسیر دیتابیس (پیش‌فرض: فایل موقت)")
+    args = parser.parse_args()
+
+    export_format = resolve_export_format(args.format)
+    db_path = args.db or Path(tempfile.mkdtemp()) / "bench_segment_export.db"
+    with DBSession(db_path) as db:
+        print(f"ساخت {args.users:,} کاربر مصنوعی در {db_path} ...")
+        _create_tables(db, args.users)
+        t_each, files_each = _per_segment(db, export_format)
+        t_fan, files_fan = _fanout(db, export_format)
+
+    print(f"\nقالب: {export_format}  فایل‌ها: {len(files_fan)}")
+    print(f"{'کوئری جدا برای هر سگمنت':<28} {t_each:8.2f}s")
+    print(f"{'یک بار خواندن (fan-out)':<28} {t_fan:8.2f}s  ({t_each / t_fan:4.1f}x)")
+    print(f"نام فایل‌ها یکسان: {'بله' if files_each == files_fan else 'خیر'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+بنچمارک توابع SQL تبدیل تاریخ شمسی: مسیر قبلی (strptime + jdatetime برای هر ردیف)
+در برابر core.jalali (تبدیل حسابی + کش روز + deterministic).
+
+اجرا از ریشه پروژه:
+    python -m benchmarks.bench_shamsi --users 5000000
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.synthetic import create_users
+from core.db_manager import DBSession
+from core.jalali import (
+    _legacy_to_shamsi,
+    _legacy_unix_to_shamsi,
+    _shamsi_date_text,
+    _shamsi_day_text,
+    register_shamsi_functions,
+)
+
+
+def _legacy_unix(ts_value) -> str:
+    if ts_value is None:
+        return ""
+    try:
+        ts_int = int(str(ts_value).strip())
+    except Exception:
+        return ""
+    return _legacy_unix_to_shamsi(ts_int)
+
+
+def _time_scan(db, sql: str) -> float:
+    _shamsi_date_text.cache_clear()
+    _shamsi_day_text.cache_clear()
+    started = time.perf_counter()
+    for _row in db.execute(sql):
+        pass
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=5_000_000)
+    parser.add_argument("--db", type=Path, default=None, help="مسیر دیتابیس (پیش‌فرض: فایل موقت)")
+    args = parser.parse_args()
+
+    db_path = args.db or Path(tempfile.mkdtemp()) / "bench_shamsi.db"
+    with DBSession(db_path) as db:
+        print(f"ساخت {args.users:,} کاربر مصنوعی در {db_path} ...")
+        create_users(db, args.users)
+
+        register_shamsi_functions(db)
+        db.create_function("legacy_to_shamsi", 1, lambda v: _legacy_to_shamsi(v) if v else "")
+        db.create_function("legacy_unix_to_shamsi", 1, _legacy_unix)
+
+        ts_expr = "CAST(strftime('%s', user_registered) AS INTEGER)"
+        results = [
+            ("to_shamsi", _time_scan(db, "SELECT legacy_to_shamsi(user_registered) FROM users"),
+             _time_scan(db, "SELECT to_shamsi(user_registered) FROM users")),
+            ("unix_to_shamsi", _time_scan(db, f"SELECT legacy_unix_to_shamsi({ts_expr}) FROM users"),
+             _time_scan(db, f"SELECT unix_to_shamsi({ts_expr}) FROM users")),
+        ]
+        mismatches = db.execute(
+            f"""SELECT COUNT(*) FROM users
+            WHERE to_shamsi(user_registered) != legacy_to_shamsi(user_registered)
+               OR unix_to_shamsi({ts_expr}) != legacy_unix_to_shamsi({ts_expr})"""
+        ).fetchone()[0]
+
+    for name, legacy, fast in results:
+        print(f"{name:15s} قبلی: {legacy:8.2f} s   جدید: {fast:8.2f} s   ({legacy / fast:.1f}x)")
+    print(f"ردیف‌های با خروجی متفاوت: {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+بنچمارک ساخت user_full_data: pivot قبلی روی کل usermeta در برابر pivot انتخابی با ایندکس (meta_key, user_id).
+
+اجرا از ریشه پروژه:
+    python -m benchmarks.bench_user_full_data --users 150000 --extra-keys 120   # ~۲۰ میلیون ردیف usermeta
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.synthetic import create_usermeta, create_users
+from core.db_manager import DBSession
+from core.jalali import register_shamsi_functions
+from config import USER_META_PIVOT_KEYS
+from core.user_full_data import (
+    USER_FULL_DATA_TABLE,
+    USERMETA_PIVOT_INDEX,
+    create_user_full_data_table,
+)
+
+
+# pivot قبلی: MAX(CASE ...) روی همه ردیف‌های usermeta
+LEGACY_SQL = """
+DROP TABLE IF EXISTS legacy_user_full_data;
+CREATE TABLE legacy_user_full_data AS
+WITH meta AS (
+    SELECT
+        user_id,
+        MAX(CASE WHEN meta_key = 'nickname' THEN meta_value END) AS nickname,
+        MAX(CASE WHEN meta_key = 'first_name' THEN meta_value END) AS first_name,
+        MAX(CASE WHEN meta_key = 'last_name' THEN meta_value END) AS last_name,
+        MAX(CASE WHEN meta_key = 'billing_first_name' THEN meta_value END) AS billing_first_name,
+        MAX(CASE WHEN meta_key = 'billing_last_name' THEN meta_value END) AS billing_last_name,
+        MAX(CASE WHEN meta_key = 'billing_state' THEN meta_value END) AS billing_state,
+        MAX(CASE WHEN meta_key = 'billing_city' THEN meta_value END) AS billing_city,
+        MAX(CASE WHEN meta_key = 'digits_phone' THEN meta_value END) AS digits_phone_raw,
+        MAX(CASE WHEN meta_key = 'paying_customer' THEN meta_value END) AS paying_customer,
+        MAX(CASE WHEN meta_key = 'wc_last_active' THEN meta_value END) AS wc_last_active,
+        MAX(CASE WHEN meta_key = 'avans_user_score' THEN meta_value END) AS avans_user_score,
+        MAX(CASE WHEN meta_key = 'avans_user_score_valid' THEN meta_value END) AS avans_user_score_valid
+    FROM usermeta
+    GROUP BY user_id
+),
+phone_norm AS (
+    SELECT
+        user_id, nickname, first_name, last_name, billing_first_name, billing_last_name,
+        billing_state, billing_city, paying_customer, wc_last_active,
+        TRIM(
+            REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(COALESCE(digits_phone_raw, ''), '+', ''), ' ', ''), '-', ''), '(', ''), ')', '')
+        ) AS digits_phone_clean
+    FROM meta
+)
+SELECT
+    u.ID AS ID,
+    u.user_email AS user_email,
+    CAST(strftime('%s', u.user_registered) AS INTEGER) AS user_registered_timestamp,
+    to_shamsi(u.user_registered) AS user_registered_shamsi,
+    u.display_name AS display_name,
+    p.nickname AS nickname,
+    p.first_name AS first_name,
+    p.last_name AS last_name,
+    p.billing_first_name AS illing_first_name,
+    p.billing_last_name AS billing_last_name,
+    p.billing_state AS billing_state,
+    p.billing_city AS billing_city,
+    CASE
+        WHEN p.digits_phone_clean = '' THEN ''
+        WHEN p.digits_phone_clean LIKE '0098%' THEN '0' || substr(p.digits_phone_clean, 5)
+        WHEN p.digits_phone_clean LIKE '98%' THEN '0' || substr(p.digits_phone_clean, 3)
+        WHEN p.digits_phone_clean LIKE '9%' THEN '0' || p.digits_phone_clean
+        WHEN p.digits_phone_clean LIKE '0%' THEN p.digits_phone_clean
+        ELSE p.digits_phone_clean
+    END AS digits_phone,
+    p.paying_customer AS paying_customer,
+    p.wc_last_active AS wc_last_active,
+    unix_to_shamsi(p.wc_last_active) AS wc_last_active_shamsi
+FROM users u
+LEFT JOIN phone_norm p ON p.user_id = u.ID;
+"""
+
+
+def _pivot_only_sql(selective: bool) -> str:
+    """فقط مرحله pivot (بدون join با users و UDFها) برای مقایسه مستقیم اسکن usermeta."""
+    cols = ", ".join(f"MAX(CASE WHEN meta_key = '{k}' THEN meta_value END)" for k in USER_META_PIVOT_KEYS)
+    if not selective:
+        return f"SELECT user_id, {cols} FROM usermeta GROUP BY user_id"
+    keys = ", ".join(f"'{k}'" for k in USER_META_PIVOT_KEYS)
+    return (
+        f'SELECT user_id, {cols} FROM usermeta INDEXED BY "{USERMETA_PIVOT_INDEX}" '
+        f"WHERE meta_key IN ({keys}) GROUP BY user_id"
+    )
+
+
+def _time_query(db, sql: str, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _row in db.execute(sql):
+            pass
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=150_000)
+    parser.add_argument("--extra-keys", type=int, default=120, help="تعداد meta_key بی‌ربط برای هر کاربر")
+    parser.add_argument("--repeat", type=int, default=2)
+    parser.add_argument("--db", type=Path, default=None, help="مسیر دیتابیس (پیش‌فرض: فایل موقت)")
+    args = parser.parse_args()
+
+    db_path = args.db or Path(tempfile.mkdtemp()) / "bench_user_full_data.db"
+    with DBSession(db_path) as db:
+        print(f"ساخت داده مصنوعی در {db_path} ...")
+        create_users(db, args.users)
+        meta_rows = create_usermeta(db, args.users, args.extra_keys)
+        db.ensure_recommended_indexes()
+        print(f"users={args.users:,}  usermeta={meta_rows:,}")
+
+        register_shamsi_functions(db)
+        # هر روش چند بار به تناوب اجرا می‌شود و بهترین زمان گزارش می‌شود (حذف اثر کش سرد)
+        legacy = selective = float("inf")
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            db.executescript(LEGACY_SQL)
+            legacy = min(legacy, time.perf_counter() - started)
+
+            started = time.perf_counter()
+            if not create_user_full_data_table(db):
+                raise SystemExit("ساخت user_full_data ناموفق بود.")
+            selective = min(selective, time.perf_counter() - started)
+
+        pivot_legacy = _time_query(db, _pivot_only_sql(False), args.repeat)
+        pivot_selective = _time_query(db, _pivot_only_sql(True), args.repeat)
+
+        diff = db.execute(
+            f"""SELECT COUNT(*) FROM (
+                SELECT * FROM legacy_user_full_data EXCEPT SELECT * FROM "{USER_FULL_DATA_TABLE}"
+                UNION ALL
+                SELECT * FROM "{USER_FULL_DATA_TABLE}" EXCEPT SELECT * FROM legacy_user_full_data
+            )"""
+        ).fetchone()[0]
+
+    print(f"ساخت user_full_data - قبلی (کل usermeta):        {legacy:8.2f} s")
+    print(f"ساخت user_full_data - انتخابی (meta_key, user_id): {selective:8.2f} s  ({legacy / selective:.1f}x)")
+    print(f"فقط pivot - قبلی:   {pivot_legacy:8.2f} s")
+    print(f"فقط pivot - انتخابی: {pivot_selective:8.2f} s  ({pivot_legacy / pivot_selective:.1f}x)")
+    print(f"ردیف‌های متفاوت: {diff}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+پیاده‌سازی مرجع SQL باندهای Quantile و آمار rfm_constant (یک NTILE و یک اسکن آمار برای هر معیار)
+برای مقایسه خروجی و زمان با یک بار خواندن rfm_data با NumPy (core.rfm_constants._fetch_all_metric_bands) در بنچمارک‌ها.
+"""
+from core.db_manager import SQLiteManager
+from core.rfm_data import RFM_DATA_TABLE
+
+
+def fetch_metric_bands(
+    db: SQLiteManager,
+    metric: str,
+    quantile_bands: int,
+) -> list[tuple[int, float, float, int]]:
+    """
+    تقسیم داده‌های هر معیار به باندهای Quantile با NTILE.
+    خروجی: [(bucket, min_val, max_val, cnt), ...]
+    """
+    sql = f"""
+WITH ranked AS (
+    SELECT
+        CAST("{metric}" AS REAL) AS val,
+        NTILE({quantile_bands}) OVER (ORDER BY CAST("{metric}" AS REAL) ASC) AS bucket
+    FROM "{RFM_DATA_TABLE}"
+    WHERE "{metric}" IS NOT NULL
+)
+SELECT
+    bucket,
+    MIN(val) AS min_val,
+    MAX(val) AS max_val,
+    COUNT(*) AS cnt
+FROM ranked
+GROUP BY bucket
+ORDER BY bucket;
+"""
+    rows = db.execute(sql).fetchall()
+    return [(int(r[0]), float(r[1]), float(r[2]), int(r[3])) for r in rows]
+
+
+def fetch_metric_stats(db: SQLiteManager, metric: str) -> tuple[int, float | None, float | None, float | None]:
+    sql = f"""
+SELECT
+    COUNT("{metric}") AS cnt,
+    MIN(CAST("{metric}" AS REAL)) AS min_v,
+    MAX(CAST("{metric}" AS REAL)) AS max_v,
+    AVG(CAST("{metric}" AS REAL)) AS avg_v
+FROM "{RFM_DATA_TABLE}";
+"""
+    cnt, min_v, max_v, avg_v = db.execute(sql).fetchone()
+    return int(cnt or 0), min_v, max_v, avg_v
@@ -0,0 +1,141 @@
+"""
+ساخت داده مصنوعی وردپرس/ووکامرس (users، usermeta، wc_customer_lookup، wc_order_stats)
+در یک دیتابیس SQLite برای بنچمارک‌ها.
+"""
+import random
+from datetime import datetime, timedelta
+
+from core.db_manager import SQLiteManager
+
+
+WANTED_META_KEYS = [
+    "nickname",
+    "first_name",
+    "last_name",
+    "billing_first_name",
+    "billing_last_name",
+    "billing_state",
+    "billing_city",
+    "digits_phone",
+    "billing_phone",
+    "paying_customer",
+    "wc_last_active",
+]
+
+_START = datetime(2019, 1, 1)
+_SPAN_SECONDS = 6 * 365 * 24 * 3600
+
+
+def _random_datetime(rnd: random.Random) -> str:
+    return (_START + timedelta(seconds=rnd.randrange(_SPAN_SECONDS))).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def create_users(db: SQLiteManager, users: int, seed: int = 1) -> None:
+    rnd = random.Random(seed)
+    db.executescript(
+        """
+DROP TABLE IF EXISTS users;
+CREATE TABLE users (
+    ID INTEGER PRIMARY KEY,
+    user_login TEXT,
+    user_email TEXT,
+    user_registered TEXT,
+    display_name TEXT
+);
+"""
+    )
+    db.conn.executemany(
+        "INSERT INTO users VALUES (?, ?, ?, ?, ?)",
+        ((u, f"user{u}", f"u{u}@example.com", _random_datetime(rnd), f"کاربر {u}") for u in range(1, users + 1)),
+    )
+    db.commit()
+
+
+def create_usermeta(db: SQLiteManager, users: int, extra_keys: int = 100, seed: int = 1) -> int:
+    """
+    برای هر کاربر کلیدهای مورد استفاده ابزار و extra_keys کلید بی‌ربط (مثل داده افزونه‌ها) می‌سازد.
+    برمی‌گرداند تعداد ردیف‌های usermeta.
+    """
+    rnd = random.Random(seed)
+    db.executescript(
+        """
+DROP TABLE IF EXISTS usermeta;
+CREATE TABLE usermeta (
+    umeta_id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL DEFAULT 0,
+    meta_key TEXT,
+    meta_value TEXT
+);
+"""
+    )
+
+    def rows():
+        for u in range(1, users + 1):
+            for key in WANTED_META_KEYS:
+                if key == "wc_last_active":
+                    value = str(1_600_000_000 + rnd.randrange(150_000_000))
+                elif key in ("digits_phone", "billing_phone"):
+                    value = f"+98 912 {u % 10_000_000:07d}"
+                else:
+                    value = f"{key}_{u}"
+                yield u, key, value
+            for k in range(extra_keys):
+                yield u, f"plugin_meta_{k}", "a:0:{}"
+
+    db.conn.executemany("INSERT INTO usermeta (user_id, meta_key, meta_value) VALUES (?, ?, ?)", rows())
+    db.commit()
+    return users * (len(WANTED_META_KEYS) + extra_keys)
+
+
+def create_orders(db: SQLiteManager, users: int, orders: int, seed: int = 1, fractional: bool = False) -> None:
+    """
+    wc_customer_lookup (یک مشتری برای هر کاربر) و wc_order_stats با orders سفارش تصادفی.
+    fractional=True: مبالغ دو رقم اعشار دارند (برای مقایسه بیت‌به‌بیت جمع‌های float).
+    """
+    rnd = random.Random(seed)
+    db.executescript(
+        """
+DROP TABLE IF EXISTS wc_customer_lookup;
+CREATE TABLE wc_customer_lookup (
+    customer_id INTEGER PRIMARY KEY,
+    user_id INTEGER,
+    username TEXT
+);
+DROP TABLE IF EXISTS wc_order_stats;
+CREATE TABLE wc_order_stats (
+    order_id INTEGER PRIMARY KEY,
+    parent_id INTEGER NOT NULL DEFAULT 0,
+    date_created TEXT NOT NULL,
+    total_sales REAL NOT NULL DEFAULT 0,
+    status TEXT NOT NULL,
+    customer_id INTEGER NOT NULL
+);
+"""
+    )
+    db.conn.executemany(
+        "INSERT INTO wc_customer_lookup VALUES (?, ?, ?)",
+        ((u + 1000, u, f"user{u}") for u in range(1, users + 1)),
+    )
+    statuses = ["wc-completed"] * 8 + ["wc-cancelled", "wc-processing"]
+    db.conn.executemany(
+        "INSERT INTO wc_order_stats VALUES (?, 0, ?, ?, ?, ?)",
+        (
+            (
+                10_000 + o,
+                _random_datetime(rnd),
+                rnd.randrange(100, 500_000_000) / 100 if fractional else float(rnd.randrange(1, 5_000) * 1000),
+                rnd.choice(statuses),
+                1000 + rnd.randint(1, users),
+            )
+            for o in range(orders)
+        ),
+    )
+    db.commit()
+
+
+def create_wp_database(db: SQLiteManager, users: int, orders: int, extra_meta_keys: int = 10, seed: int = 1) -> None:
+    """ساخت کامل جداول گروه wp همراه ایندکس‌های پیشنهادی."""
+    create_users(db, users, seed)
+    create_usermeta(db, users, extra_meta_keys, seed)
+    create_orders(db, users, orders, seed)
+    db.ensure_recommended_indexes()
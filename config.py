@@ -6,7 +6,17 @@ DUMP_DIR = BASE_DIR / "dump"
 OUTPUT_DIR = BASE_DIR / "output"
 DB_DIR = BASE_DIR / "db"
 
-SQLITE_DB_PATH = DB_DIR / "converted.db"
+# هر اجرا یک دیتابیس موقت (workspace) جدا در این پوشه می‌سازد تا چند دامپ هم‌زمان پردازش شوند
+WORKSPACE_DIR = DB_DIR / "workspaces"
+
+# اتصال مشترک (DBSession) برای کل جریان: حجم کش صفحات (مگابایت) و تعداد prepared statementهای کش‌شده
+SQLITE_SESSION_CACHE_MB = 256
+SQLITE_STATEMENT_CACHE = 256
+
+# حالت گروهی (پردازش موازی همه دامپ‌ها): سقف worker (None = خودکار بر اساس CPU)
+# و حافظه تخمینی هر worker (مگابایت) برای محدود کردن تعداد بر اساس حافظه آزاد
+BATCH_MAX_WORKERS = None
+BATCH_WORKER_MEMORY_MB = 1024
 
 # encoding پیش‌فرض
 DEFAULT_ENCODING = "utf-8"
@@ -23,9 +33,75 @@ EXCEL_SETTINGS = {
 # اگر تعداد ردیف‌ها بیشتر شد، فایل‌های بعدی با شماره (۱، ۲، ۳، ...) ایجاد می‌شوند
 EXCEL_MAX_ROWS_PER_FILE = 500000
 
+# تعداد ردیف هر fetchmany هنگام خروجی Excel (حافظه خروجی به همین اندازه محدود است)
+EXPORT_FETCH_ROWS = 10000
+
+# تعداد پردازه برای نوشتن هم‌زمان فایل‌های chunked یک جدول (هر فایل در یک worker با بازه rowid خودش)؛
+# 1 = نوشتن پشت‌سرهم. فقط برای جداول (نه VIEW)؛ در export_all هر جدول در یک worker.
+# بیشتر از تعداد هسته‌های CPU فایده‌ای ندارد
+EXPORT_WORKERS = 1
+
+# قالب پیش‌فرض خروجی جداول (user_orders، user_full_data، rfm_data، rfm_scores)؛ در هر اجرا قابل تغییر است:
+# "xlsx" = Excel چندفایلی (EXCEL_MAX_ROWS_PER_FILE)، "csv" = یک فایل csv.gz،
+# "parquet" / "arrow" = یک فایل ستونی (نیاز به pyarrow؛ اگر نصب نباشد csv)
+EXPORT_FORMAT = "xlsx"
+
+# customer_purchases به صورت جدول materialize شده (مرتب بر اساس تاریخ، با ایندکس) ساخته شود؛
+# False = همان VIEW قبلی که در هر بار خواندن دوباره join و مرتب می‌شود
+CUSTOMER_PURCHASES_MATERIALIZE = True
+
+# meta_keyهای usermeta که در user_full_data به ستون تبدیل می‌شوند (به همین ترتیب)
+# فقط همین کلیدها از usermeta خوانده می‌شوند؛ digits_phone نرمال می‌شود و wc_last_active ستون شمسی هم دارد
+USER_META_PIVOT_KEYS = [
+    "nickname",
+    "first_name",
+    "last_name",
+    "billing_first_name",
+    "billing_last_name",
+    "billing_state",
+    "billing_city",
+    "digits_phone",
+    "paying_customer",
+    "wc_last_active",
+    "avans_user_score",
+    "avans_user_score_valid",
+]
+
 # تعداد باندهای Quantile برای تحلیل RFM (پیش‌فرض: quintile=5)
 RFM_QUANTILE_BANDS = 5
 
+# ساخت rfm_data با یک پاس GROUP BY (بدون ROW_NUMBER روی همه سفارش‌ها)؛ False = کوئری پنجره‌ای قبلی
+RFM_DATA_SINGLE_SCAN = True
+
+# باندهای Quantile در rfm_constant: "exact" (همان NTILE روی همه کاربران) یا "sketch" (تقریبی و ادغام‌پذیر با KLL؛
+# sketch هر فروشگاه در converted.db ذخیره و در حالت گروهی برای آستانه‌های مشترک همه فروشگاه‌ها ادغام می‌شود)
+RFM_QUANTILE_MODE = "exact"
+# خطای رتبه نرمال‌شده مجاز sketch (0.01 = یک درصد از کاربران)
+RFM_SKETCH_EPSILON = 0.01
+# در حالت sketch شیت sketch_report با اختلاف باندهای تقریبی و دقیق (نیاز به خواندن کامل داده)
+RFM_SKETCH_REPORT = True
+# همان شیت در rfm_constant_combined.xlsx (پردازش گروهی): rfm_data همه فروشگاه‌ها هم‌زمان در حافظه خوانده
+# می‌شود و حافظه با تعداد فروشگاه‌ها بی‌سقف بالا می‌رود، پس پیش‌فرض خاموش است (فقط برای داده کوچک)
+RFM_COMBINED_SKETCH_REPORT = False
+
+# فایل مشتریان هر سگمنت (با نام، ایمیل و موبایل از user_full_data) در پوشه segments خروجی،
+# با یک بار خواندن rfm_scores؛ در مرحله «داده موجود» با سگمنت‌های جدید دوباره ساخته می‌شود
+RFM_SEGMENT_EXPORT = True
+
+# موتور ساخت جداول مشتق (customer_purchases، user_full_data، آمار rfm_data): "sqlite" یا "duckdb"
+# (join و تجمیع چندنخی در DuckDB درون‌پردازه؛ نیاز به پکیج duckdb، در نبود آن همان SQLite)
+DERIVED_ENGINE = "sqlite"
+
+# تعداد نخ‌های DuckDB؛ 0 = پیش‌فرض خود DuckDB (همه هسته‌ها)
+DUCKDB_THREADS = 0
+
+# تاریخ مرجع recency_days (شمسی، مثل 1404/01/20)؛ "0" = لحظه اجرا. با تاریخ ثابت خروجی تکرارپذیر است
+RFM_REFERENCE_SHAMSI_DATE = "0"
+
+# به‌روزرسانی افزایشی RFM: آمار هر کاربر از converted.db آخرین خروجی همین سایت (siteurl یا نام دامپ) برداشته می‌شود
+# و فقط سفارش‌های بعد از watermark (order_id / date_created) ادغام می‌شوند
+RFM_INCREMENTAL = False
+
 # گروه‌های جدول: نام گروه -> لیست جداول مورد انتظار (بدون پیشوند)
 # در فایل دامپ چک می‌شود کدام گروه‌ها به طور کامل وجود دارند
 TABLE_GROUPS = {
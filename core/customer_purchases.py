@@ -1,18 +1,20 @@
 """
 جدول اطلاعات خرید مشتری: ترکیب داده‌های users، usermeta، wc_order_stats و wc_customer_lookup.
 """
+import time
+
+from config import CUSTOMER_PURCHASES_MATERIALIZE
 from core.db_manager import SQLiteManager
+from core.duckdb_engine import DuckDBWorkspace, use_duckdb
 
 
 # نام view/جدول خروجی
 CUSTOMER_PURCHASES_VIEW = "customer_purchases"
 
-# کوئری برای ساخت view اطلاعات خرید مشتری
+# کوئری اطلاعات خرید مشتری
 # بهینه: استفاده از JOIN به‌جای correlated subquery برای usermeta
 # ستون‌ها: نام کاربر، ایمیل، شماره موبایل، شناسه سفارش، تاریخ خرید، مبلغ خرید، وضعیت سفارش
-CREATE_CUSTOMER_PURCHASES_VIEW_SQL = """
-DROP VIEW IF EXISTS "customer_purchases";
-CREATE VIEW "customer_purchases" AS
+CUSTOMER_PURCHASES_SELECT_SQL = """
 SELECT
     u.ID AS user_id,
     u.display_name AS username,
@@ -26,17 +28,101 @@ FROM wc_order_stats AS stats
 JOIN wc_customer_lookup AS customers ON stats.customer_id = customers.customer_id
 JOIN users AS u ON customers.user_id = u.ID
 LEFT JOIN usermeta AS pm ON u.ID = pm.user_id AND pm.meta_key = 'billing_phone'
-ORDER BY stats.date_created DESC;
+ORDER BY stats.date_created DESC
+"""
+
+# کوئری برای ساخت view اطلاعات خرید مشتری
+CREATE_CUSTOMER_PURCHASES_VIEW_SQL = f"""
+CREATE VIEW "{CUSTOMER_PURCHASES_VIEW}" AS
+{CUSTOMER_PURCHASES_SELECT_SQL};
+"""
+
+# ایندکس‌های جدول materialize شده
+CREATE_CUSTOMER_PURCHASES_INDEXES_SQL = f"""
+CREATE INDEX "idx_{CUSTOMER_PURCHASES_VIEW}_purchase_date" ON "{CUSTOMER_PURCHASES_VIEW}" ("purchase_date");
+CREATE INDEX "idx_{CUSTOMER_PURCHASES_VIEW}_user_id" ON "{CUSTOMER_PURCHASES_VIEW}" ("user_id");
 """
 
+# نسخه materialize شده: یک بار ارزیابی و مرتب‌سازی، ذخیره به ترتیب تاریخ (rowid = ترتیب خروجی)
+# تا شمارش و خروجی chunked فقط خواندن ترتیبی جدول باشند
+CREATE_CUSTOMER_PURCHASES_TABLE_SQL = f"""
+CREATE TABLE "{CUSTOMER_PURCHASES_VIEW}" AS
+{CUSTOMER_PURCHASES_SELECT_SQL};
+{CREATE_CUSTOMER_PURCHASES_INDEXES_SQL}"""
+
+
+def _drop_existing(db: SQLiteManager) -> None:
+    """حذف view یا جدول قبلی با همین نام (DROP VIEW روی جدول خطا می‌دهد و برعکس)."""
+    row = db.execute(
+        "SELECT type FROM sqlite_master WHERE name = ? AND type IN ('table', 'view')",
+        (CUSTOMER_PURCHASES_VIEW,),
+    ).fetchone()
+    if row is None:
+        return
+    kind = "VIEW" if row[0] == "view" else "TABLE"
+    db.execute(f'DROP {kind} IF EXISTS "{CUSTOMER_PURCHASES_VIEW}"')
+
+
+def _build_customer_purchases_duckdb(db: SQLiteManager) -> None:
+    """
+    ساخت جدول materialize شده با DuckDB (core.duckdb_engine): join و مرتب‌سازی در DuckDB،
+    ستون‌ها و نوعشان از همان کوئری SQLite (با LIMIT 0). ترتیب ردیف‌های با تاریخ یکسان ممکن است با SQLite فرق کند.
+    """
+    with DuckDBWorkspace(db) as ws:
+        ws.load("wc_order_stats")
+        ws.load("wc_customer_lookup")
+        ws.load("users")
+        ws.load("usermeta", "meta_key = 'billing_phone'")
+        db.execute(
+            f'CREATE TABLE "{CUSTOMER_PURCHASES_VIEW}" AS SELECT * FROM ({CUSTOMER_PURCHASES_SELECT_SQL}) LIMIT 0'
+        )
+        columns = [row[1] for row in db.execute(f'PRAGMA table_info("{CUSTOMER_PURCHASES_VIEW}")').fetchall()]
+        ws.write_rows(CUSTOMER_PURCHASES_SELECT_SQL, CUSTOMER_PURCHASES_VIEW, columns)
+    db.executescript(CREATE_CUSTOMER_PURCHASES_INDEXES_SQL)
+
 
-def create_customer_purchases_view(db: SQLiteManager) -> bool:
+def create_customer_purchases_view(
+    db: SQLiteManager, materialize: bool | None = None, engine: str | None = None
+) -> bool:
     """
     ساخت view اطلاعات خرید مشتری.
+    materialize=True (پیش‌فرض از config): به‌جای view یک جدول مرتب‌شده بر اساس تاریخ با ایندکس ساخته می‌شود
+    engine="duckdb" (یا None و DERIVED_ENGINE="duckdb" در config): این جدول در DuckDB ساخته می‌شود.
     برمی‌گرداند True اگر موفق بود، False در غیر این صورت.
     """
+    if materialize is None:
+        materialize = CUSTOMER_PURCHASES_MATERIALIZE
     try:
-        db.executescript(CREATE_CUSTOMER_PURCHASES_VIEW_SQL)
+        _drop_existing(db)
+        started = time.perf_counter()
+        if materialize:
+            bytes_before = db.used_bytes()
+            if use_duckdb(engine):
+                try:
+                    _build_customer_purchases_duckdb(db)
+                except Exception:
+                    db.conn.rollback()
+                    _drop_existing(db)
+                    db.executescript(CREATE_CUSTOMER_PURCHASES_TABLE_SQL)
+            else:
+                db.executescript(CREATE_CUSTOMER_PURCHASES_TABLE_SQL)
+            db.record_stats(
+                CUSTOMER_PURCHASES_VIEW,
+                db.new_table_row_count(CUSTOMER_PURCHASES_VIEW),
+                byte_size=db.used_bytes() - bytes_before,
+                build_seconds=time.perf_counter() - started,
+                kind="derived",
+            )
+        else:
+            db.executescript(CREATE_CUSTOMER_PURCHASES_VIEW_SQL)
+            # view فقط یک بار شمرده می‌شود؛ مصرف‌کننده‌های بعدی تعداد را از _stats می‌خوانند
+            count = db.execute(f'SELECT COUNT(*) FROM "{CUSTOMER_PURCHASES_VIEW}"').fetchone()[0]
+            db.record_stats(
+                CUSTOMER_PURCHASES_VIEW,
+                count,
+                build_seconds=time.perf_counter() - started,
+                kind="view",
+            )
         db.commit()
         return True
     except Exception:
@@ -44,9 +130,8 @@ def create_customer_purchases_view(db: SQLiteManager) -> bool:
 
 
 def get_customer_purchases_row_count(db: SQLiteManager) -> int:
-    """تعداد رکوردهای view اطلاعات خرید مشتری."""
+    """تعداد رکوردهای view اطلاعات خرید مشتری (از _stats)."""
     try:
-        cursor = db.execute(f'SELECT COUNT(*) FROM "{CUSTOMER_PURCHASES_VIEW}"')
-        return cursor.fetchone()[0]
+        return db.get_row_count(CUSTOMER_PURCHASES_VIEW)
     except Exception:
         return 0
@@ -1,6 +1,13 @@
 import sqlite3
+from datetime import datetime
 from pathlib import Path
 
+from config import SQLITE_SESSION_CACHE_MB, SQLITE_STATEMENT_CACHE
+
+
+# جدول متادیتای آمار: تعداد ردیف، حجم و زمان ساخت هر جدول/ویو که هنگام import و ساخت جداول مشتق پر می‌شود
+STATS_TABLE = "_stats"
+
 
 class SQLiteManager:
     """Manages SQLite database operations."""
@@ -8,15 +15,29 @@ class SQLiteManager:
     def __init__(self, db_path: str | Path):
         self.db_path = Path(db_path)
         self.conn = None
+        self._functions: set[tuple[str, int]] = set()
 
     def connect(self):
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
-        self.conn = sqlite3.connect(str(self.db_path), timeout=30.0)
+        self.conn = sqlite3.connect(
+            str(self.db_path),
+            timeout=30.0,
+            cached_statements=SQLITE_STATEMENT_CACHE,
+        )
         self.conn.execute("PRAGMA busy_timeout=30000")
         self.conn.execute("PRAGMA journal_mode=WAL")
         self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._functions = set()
         return self
 
+    def create_function(self, name: str, num_params: int, func, deterministic: bool = False) -> None:
+        """ثبت تابع SQL روی اتصال فعلی؛ اگر قبلاً ثبت شده باشد دوباره ثبت نمی‌شود."""
+        key = (name, num_params)
+        if key in self._functions:
+            return
+        self.conn.create_function(name, num_params, func, deterministic=deterministic)
+        self._functions.add(key)
+
     def execute(self, sql: str, params=None):
         if params:
             return self.conn.execute(sql, params)
@@ -35,16 +56,132 @@ class SQLiteManager:
         return [row[0] for row in cursor.fetchall()]
 
     def get_table_row_counts(self) -> dict[str, int]:
-        """برمی‌گرداند: {"table_name": row_count} برای جداول کاربری."""
+        """
+        برمی‌گرداند: {"table_name": row_count} برای جداول کاربری.
+        تعداد از جدول _stats خوانده می‌شود؛ فقط برای جدولی که آمار ندارد COUNT(*) اجرا و ثبت می‌شود.
+        """
+        stats = self.get_stats()
         result = {}
         cursor = self.conn.execute(
             "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'"
         )
         for (name,) in cursor.fetchall():
-            count = self.conn.execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()[0]
-            result[name] = count
+            if name.startswith("_"):
+                continue
+            if name in stats and stats[name]["row_count"] is not None:
+                result[name] = stats[name]["row_count"]
+            else:
+                result[name] = self.get_row_count(name)
         return result
 
+    def _ensure_stats_table(self) -> None:
+        self.conn.execute(
+            f"""CREATE TABLE IF NOT EXISTS "{STATS_TABLE}" (
+                name TEXT PRIMARY KEY,
+                kind TEXT,
+                row_count INTEGER,
+                byte_size INTEGER,
+                build_seconds REAL,
+                updated_at TEXT
+            )"""
+        )
+
+    def record_stats(
+        self,
+        name: str,
+        row_count: int | None,
+        byte_size: int | None = None,
+        build_seconds: float | None = None,
+        kind: str = "table",
+    ) -> None:
+        """ثبت/به‌روزرسانی آمار یک جدول یا view در _stats."""
+        self._ensure_stats_table()
+        self.conn.execute(
+            f"""INSERT INTO "{STATS_TABLE}" (name, kind, row_count, byte_size, build_seconds, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET
+                kind = excluded.kind,
+                row_count = excluded.row_count,
+                byte_size = excluded.byte_size,
+                build_seconds = excluded.build_seconds,
+                updated_at = excluded.updated_at""",
+            (
+                name,
+                kind,
+                row_count,
+                byte_size,
+                build_seconds,
+                datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            ),
+        )
+
+    def get_stats(self) -> dict[str, dict]:
+        """برمی‌گرداند: {name: {"kind", "row_count", "byte_size", "build_seconds"}} از جدول _stats."""
+        if not self._table_exists(STATS_TABLE):
+            return {}
+        cursor = self.conn.execute(
+            f'SELECT name, kind, row_count, byte_size, build_seconds FROM "{STATS_TABLE}" ORDER BY name'
+        )
+        return {
+            name: {
+                "kind": kind,
+                "row_count": row_count,
+                "byte_size": byte_size,
+                "build_seconds": build_seconds,
+            }
+            for name, kind, row_count, byte_size, build_seconds in cursor.fetchall()
+        }
+
+    def get_row_count(self, name: str) -> int:
+        """
+        تعداد ردیف از _stats؛ اگر ثبت نشده باشد یک بار COUNT(*) اجرا و نتیجه ثبت می‌شود.
+        """
+        if self._table_exists(STATS_TABLE):
+            row = self.conn.execute(
+                f'SELECT row_count FROM "{STATS_TABLE}" WHERE name = ?', (name,)
+            ).fetchone()
+            if row is not None and row[0] is not None:
+                return int(row[0])
+        count = self.conn.execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()[0]
+        kind = "table" if self._table_exists(name) else "view"
+        self.record_stats(name, count, kind=kind)
+        return count
+
+    def new_table_row_count(self, table_name: str) -> int:
+        """
+        تعداد ردیف جدولی که همین حالا با CREATE TABLE AS ساخته شده است.
+        rowidهای چنین جدولی از ۱ پیوسته‌اند، پس MAX(rowid) بدون پیمایش کامل جدول دقیق است.
+        """
+        row = self.conn.execute(f'SELECT MAX(rowid) FROM "{table_name}"').fetchone()
+        return int(row[0] or 0)
+
+    def used_bytes(self) -> int:
+        """حجم صفحات استفاده‌شده دیتابیس (page_count - freelist_count) به بایت."""
+        page_size = self.conn.execute("PRAGMA page_size").fetchone()[0]
+        page_count = self.conn.execute("PRAGMA page_count").fetchone()[0]
+        freelist = self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return (page_count - freelist) * page_size
+
+    def table_bytes(self, table_names) -> dict[str, int] | None:
+        """
+        حجم صفحات هر جدول (همراه ایندکس‌هایش) با یک پرس‌وجوی dbstat؛
+        None اگر SQLite بدون dbstat کامپایل شده باشد.
+        """
+        names = list(table_names)
+        if not names:
+            return {}
+        placeholders = ", ".join("?" for _ in names)
+        try:
+            rows = self.conn.execute(
+                f"""SELECT m.tbl_name, SUM(s.pgsize) FROM dbstat s
+                JOIN sqlite_master m ON m.name = s.name
+                WHERE m.tbl_name IN ({placeholders}) GROUP BY m.tbl_name""",
+                names,
+            ).fetchall()
+        except sqlite3.OperationalError:
+            return None
+        return {name: int(size) for name, size in rows}
+
     def _table_exists(self, table_name: str) -> bool:
         row = self.conn.execute(
             "SELECT 1 FROM sqlite_master WHERE type='table' AND name=? LIMIT 1",
@@ -111,7 +248,8 @@ class SQLiteManager:
         # usermeta
         if self._create_index_if_possible("idx_usermeta_user_id", "usermeta", ["user_id"]):
             created += 1
-        if self._create_index_if_possible("idx_usermeta_meta_key", "usermeta", ["meta_key"]):
+        # (meta_key, user_id) هم جستجو بر اساس meta_key را پوشش می‌دهد و هم pivot انتخابی user_full_data را
+        if self._create_index_if_possible("idx_usermeta_meta_key_user_id", "usermeta", ["meta_key", "user_id"]):
             created += 1
         if self._create_index_if_possible("idx_usermeta_user_id_meta_key", "usermeta", ["user_id", "meta_key"]):
             created += 1
@@ -130,10 +268,22 @@ class SQLiteManager:
         self.commit()
         return len(tables)
 
+    def backup_to(self, dest_path: str | Path) -> Path:
+        """کپی سازگار دیتابیس (شامل تغییرات WAL) با backup API خود SQLite."""
+        dest_path = Path(dest_path)
+        self.commit()
+        dest = sqlite3.connect(str(dest_path))
+        try:
+            self.conn.backup(dest)
+        finally:
+            dest.close()
+        return dest_path
+
     def close(self):
         if self.conn:
             self.conn.close()
             self.conn = None
+            self._functions = set()
 
     def __enter__(self):
         self.connect()
@@ -143,3 +293,36 @@ class SQLiteManager:
         if exc_type is None:
             self.commit()
         self.close()
+
+
+class DBSession(SQLiteManager):
+    """
+    یک اتصال طولانی‌مدت برای کل جریان کاری.
+    - کش صفحات، توابع ثبت‌شده (مثل to_shamsi) و کش prepared statementها بین مراحل حفظ می‌شوند.
+    - with تودرتو اتصال را نمی‌بندد؛ فقط خروج از بیرونی‌ترین with اتصال را می‌بندد.
+    """
+
+    def __init__(self, db_path: str | Path):
+        super().__init__(db_path)
+        self._depth = 0
+
+    def connect(self):
+        if self.conn is not None:
+            return self
+        super().connect()
+        self.conn.execute(f"PRAGMA cache_size=-{int(SQLITE_SESSION_CACHE_MB) * 1024}")
+        self.conn.execute("PRAGMA temp_store=MEMORY")
+        return self
+
+    def __enter__(self):
+        self.connect()
+        self._depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._depth -= 1
+        if exc_type is None:
+            self.commit()
+        if self._depth <= 0:
+            self._depth = 0
+            self.close()
@@ -0,0 +1,157 @@
+"""
+جدول بعد تاریخ (dim_date) و جمع فروش ماهانه شمسی (sales_by_shamsi_month).
+
+dim_date برای هر روز میلادی در بازه تاریخ سفارش‌ها یک ردیف دارد (سال/ماه/روز شمسی، هفته و شروع هفته/ماه)
+تا گزارش‌های دوره‌ای به‌جای صدا زدن to_shamsi روی هر ردیف و تجزیه رشته، فقط با dim_date join شوند.
+"""
+import time
+from datetime import date, timedelta
+
+from core.db_manager import SQLiteManager
+from core.jalali import jalali_from_ordinal
+
+
+DIM_DATE_TABLE = "dim_date"
+SALES_BY_SHAMSI_MONTH_TABLE = "sales_by_shamsi_month"
+
+# کلید اصلی همان تاریخ میلادی (YYYY-MM-DD) است؛ WITHOUT ROWID یعنی خود جدول ایندکس تاریخ است
+CREATE_DIM_DATE_TABLE_SQL = f"""
+CREATE TABLE "{DIM_DATE_TABLE}" (
+    gregorian_date TEXT PRIMARY KEY,
+    shamsi_date TEXT NOT NULL,
+    shamsi_year INTEGER NOT NULL,
+    shamsi_month INTEGER NOT NULL,
+    shamsi_day INTEGER NOT NULL,
+    shamsi_weekday INTEGER NOT NULL,
+    shamsi_week INTEGER NOT NULL,
+    week_start TEXT NOT NULL,
+    month_start TEXT NOT NULL
+) WITHOUT ROWID
+"""
+
+# یک پاس روی wc_order_stats؛ هر سفارش با کلید اصلی dim_date (۱۰ کاراکتر اول date_created) جفت می‌شود
+CREATE_SALES_BY_SHAMSI_MONTH_SQL = f"""
+CREATE TABLE "{SALES_BY_SHAMSI_MONTH_TABLE}" AS
+SELECT
+    d.shamsi_year AS shamsi_year,
+    d.shamsi_month AS shamsi_month,
+    MIN(d.month_start) AS month_start,
+    COUNT(*) AS orders_count,
+    SUM(o.total_sales) AS total_sales,
+    SUM(CASE WHEN o.status = 'wc-completed' THEN 1 ELSE 0 END) AS completed_orders_count,
+    SUM(CASE WHEN o.status = 'wc-completed' THEN o.total_sales ELSE 0 END) AS completed_sales
+FROM wc_order_stats AS o
+JOIN "{DIM_DATE_TABLE}" AS d ON d.gregorian_date = substr(o.date_created, 1, 10)
+GROUP BY d.shamsi_year, d.shamsi_month
+ORDER BY d.shamsi_year, d.shamsi_month;
+"""
+
+
+def _order_date_range(db: SQLiteManager) -> tuple[date, date] | None:
+    """کمترین و بیشترین تاریخ معتبر سفارش در wc_order_stats (تاریخ‌های نامعتبر مثل 0000-00-00 کنار گذاشته می‌شوند)."""
+    row = db.execute(
+        """SELECT MIN(d), MAX(d) FROM (
+            SELECT date(substr(date_created, 1, 10)) AS d FROM wc_order_stats
+        ) WHERE d IS NOT NULL"""
+    ).fetchone()
+    if not row or row[0] is None:
+        return None
+    return date.fromisoformat(row[0]), date.fromisoformat(row[1])
+
+
+def _dim_date_rows(start: date, end: date):
+    """ردیف‌های dim_date برای هر روز از start تا end (شامل هر دو). هفته شمسی از شنبه شروع می‌شود."""
+    day = start
+    one_day = timedelta(days=1)
+    while day <= end:
+        ordinal = day.toordinal()
+        jy, jm, jd = jalali_from_ordinal(ordinal)
+        # شنبه = 0 ... جمعه = 6
+        weekday = (day.weekday() + 2) % 7
+        day_of_year = (jm - 1) * 31 + jd if jm <= 7 else 186 + (jm - 7) * 30 + jd
+        # هفته ۱ هفته‌ای است که ۱ فروردین در آن است
+        first_day_weekday = (weekday - (day_of_year - 1)) % 7
+        week = (day_of_year - 1 + first_day_weekday) // 7 + 1
+        yield (
+            day.isoformat(),
+            f"{jy:04d}/{jm:02d}/{jd:02d}",
+            jy,
+            jm,
+            jd,
+            weekday,
+            week,
+            date.fromordinal(ordinal - weekday).isoformat(),
+            date.fromordinal(ordinal - jd + 1).isoformat(),
+        )
+        day += one_day
+
+
+def create_dim_date_table(db: SQLiteManager) -> bool:
+    """
+    ساخت جدول dim_date برای بازه تاریخ سفارش‌های wc_order_stats.
+    تبدیل با محاسبه حسابی core.jalali انجام می‌شود (هر روز یک بار، نه هر سفارش).
+    برمی‌گرداند True اگر موفق بود، False در غیر این صورت.
+    """
+    try:
+        db.execute(f'DROP TABLE IF EXISTS "{DIM_DATE_TABLE}"')
+        started = time.perf_counter()
+        bytes_before = db.used_bytes()
+        db.execute(CREATE_DIM_DATE_TABLE_SQL)
+        date_range = _order_date_range(db)
+        row_count = 0
+        if date_range is not None:
+            cursor = db.conn.executemany(
+                f'INSERT INTO "{DIM_DATE_TABLE}" VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                _dim_date_rows(*date_range),
+            )
+            row_count = cursor.rowcount
+        db.record_stats(
+            DIM_DATE_TABLE,
+            row_count,
+            byte_size=db.used_bytes() - bytes_before,
+            build_seconds=time.perf_counter() - started,
+            kind="derived",
+        )
+        db.commit()
+        return True
+    except Exception:
+        return False
+
+
+def create_sales_by_shamsi_month_table(db: SQLiteManager) -> bool:
+    """
+    ساخت جدول sales_by_shamsi_month (تعداد و مبلغ سفارش‌ها به تفکیک سال/ماه شمسی) از wc_order_stats و dim_date.
+    dim_date باید قبلاً ساخته شده باشد.
+    """
+    try:
+        db.execute(f'DROP TABLE IF EXISTS "{SALES_BY_SHAMSI_MONTH_TABLE}"')
+        started = time.perf_counter()
+        bytes_before = db.used_bytes()
+        db.executescript(CREATE_SALES_BY_SHAMSI_MONTH_SQL)
+        db.record_stats(
+            SALES_BY_SHAMSI_MONTH_TABLE,
+            db.new_table_row_count(SALES_BY_SHAMSI_MONTH_TABLE),
+            byte_size=db.used_bytes() - bytes_before,
+            build_seconds=time.perf_counter() - started,
+            kind="derived",
+        )
+        db.commit()
+        return True
+    except Exception:
+        return False
+
+
+def get_dim_date_row_count(db: SQLiteManager) -> int:
+    """تعداد روزهای جدول dim_date (از _stats)."""
+    try:
+        return db.get_row_count(DIM_DATE_TABLE)
+    except Exception:
+        return 0
+
+
+def get_sales_by_shamsi_month_row_count(db: SQLiteManager) -> int:
+    """تعداد ماه‌های جدول sales_by_shamsi_month (از _stats)."""
+    try:
+        return db.get_row_count(SALES_BY_SHAMSI_MONTH_TABLE)
+    except Exception:
+        return 0
@@ -0,0 +1,119 @@
+"""
+موتور تحلیلی ستونی اختیاری (DuckDB، درون‌پردازه و بدون سرور) برای بخش سنگین جداول مشتق.
+
+- جداول لازم دیتابیس موقت (فقط ستون‌های استفاده‌شده) به DuckDB داده می‌شوند: با افزونه sqlite خود DuckDB
+  (ATTACH فقط‌خواندنی) و اگر در دسترس نبود با خواندن chunk به chunk از همان اتصال SQLite
+- joinها و تجمیع‌ها (customer_purchases، پیوت usermeta در user_full_data، آمار هر کاربر rfm_user_agg)
+  چندنخی در DuckDB اجرا و نتیجه در همان جدول‌های دیتابیس موقت نوشته می‌شود
+- ستون‌های وابسته به توابع SQLite (to_shamsi، julianday، strftime) مثل قبل در SQLite ساخته می‌شوند
+
+انتخاب با DERIVED_ENGINE در config است؛ اگر پکیج duckdb نصب نباشد یا اجرای آن خطا بدهد مسیر SQLite اجرا می‌شود.
+"""
+from config import DERIVED_ENGINE, DUCKDB_THREADS
+from core.db_manager import SQLiteManager
+
+try:
+    import duckdb
+except ImportError:  # وابستگی اختیاری
+    duckdb = None
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+
+# تعداد ردیف در هر انتقال SQLite <-> DuckDB
+_TRANSFER_CHUNK = 200_000
+
+# ستون‌های لازم هر جدول منبع و نوع آن در DuckDB
+SOURCE_COLUMNS = {
+    "users": {"ID": "BIGINT", "display_name": "VARCHAR", "user_email": "VARCHAR", "user_registered": "VARCHAR"},
+    "usermeta": {"user_id": "BIGINT", "meta_key": "VARCHAR", "meta_value": "VARCHAR"},
+    "wc_order_stats": {
+        "order_id": "BIGINT",
+        "customer_id": "BIGINT",
+        "date_created": "VARCHAR",
+        "total_sales": "DOUBLE",
+        "status": "VARCHAR",
+    },
+    "wc_customer_lookup": {"customer_id": "BIGINT", "id": "BIGINT", "user_id": "BIGINT"},
+}
+
+
+def duckdb_available() -> bool:
+    """آیا پکیج duckdb نصب است."""
+    return duckdb is not None
+
+
+def use_duckdb(engine: str | None = None) -> bool:
+    """آیا جداول مشتق باید با DuckDB ساخته شوند (engine=None یعنی DERIVED_ENGINE در config)."""
+    return (engine or DERIVED_ENGINE) == "duckdb" and duckdb_available()
+
+
+class DuckDBWorkspace:
+    """
+    اتصال DuckDB در حافظه کنار دیتابیس موقت SQLite.
+    load() جدول منبع را (فقط ستون‌های موجود از SOURCE_COLUMNS، با فیلتر اختیاری) در DuckDB می‌سازد
+    و write_rows() نتیجه یک کوئری DuckDB را در جدولی از SQLite اضافه می‌کند.
+    """
+
+    def __init__(self, db: SQLiteManager, threads: int | None = None):
+        self.db = db
+        threads = DUCKDB_THREADS if threads is None else threads
+        config = {"threads": int(threads)} if threads and int(threads) > 0 else {}
+        self.con = duckdb.connect(":memory:", config=config)
+        self._attached = False
+
+    def __enter__(self):
+        # تغییرات ثبت‌نشده اتصال SQLite از دید افزونه sqlite دیده نمی‌شوند
+        self.db.commit()
+        try:
+            self.con.execute("ATTACH ? AS ws (TYPE sqlite, READ_ONLY)", [str(self.db.db_path)])
+            self._attached = True
+        except Exception:
+            self._attached = False
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.con.close()
+
+    def load(self, table: str, where_sql: str = "") -> list[str]:
+        """ساخت جدول table در DuckDB از جدول هم‌نام SQLite. برمی‌گرداند ستون‌های بارگذاری‌شده."""
+        existing = self.db._table_columns(table)
+        columns = {name: kind for name, kind in SOURCE_COLUMNS[table].items() if name in existing}
+        col_defs = ", ".join(f'"{name}" {kind}' for name, kind in columns.items())
+        col_list = ", ".join(f'"{name}"' for name in columns)
+        self.con.execute(f'DROP TABLE IF EXISTS "{table}"')
+        self.con.execute(f'CREATE TABLE "{table}" ({col_defs})')
+        where = f" WHERE {where_sql}" if where_sql else ""
+        if self._attached:
+            try:
+                self.con.execute(f'INSERT INTO "{table}" SELECT {col_list} FROM ws."{table}"{where}')
+                return list(columns)
+            except Exception:
+                # مقدار ناسازگار با نوع اعلام‌شده ستون در SQLite؛ همان مسیر خواندن از اتصال SQLite
+                self.con.execute(f'DELETE FROM "{table}"')
+        cast_list = ", ".join(f'TRY_CAST("{name}" AS {kind})' for name, kind in columns.items())
+        for chunk in pd.read_sql_query(
+            f'SELECT {col_list} FROM "{table}"{where}', self.db.conn, chunksize=_TRANSFER_CHUNK
+        ):
+            self.con.register("_chunk", chunk)
+            self.con.execute(f'INSERT INTO "{table}" SELECT {cast_list} FROM _chunk')
+            self.con.unregister("_chunk")
+        return list(columns)
+
+    def write_rows(self, select_sql: str, table: str, columns: list[str]) -> int:
+        """اجرای select_sql در DuckDB و افزودن نتیجه (به همان ترتیب) به جدول SQLite. برمی‌گرداند تعداد ردیف."""
+        cursor = self.con.execute(select_sql)
+        col_list = ", ".join(f'"{c}"' for c in columns)
+        placeholders = ", ".join("?" for _ in columns)
+        insert_sql = f'INSERT INTO "{table}" ({col_list}) VALUES ({placeholders})'
+        count = 0
+        while True:
+            rows = cursor.fetchmany(_TRANSFER_CHUNK)
+            if not rows:
+                break
+            self.db.conn.executemany(insert_sql, rows)
+            count += len(rows)
+        return count
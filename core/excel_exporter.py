@@ -1,11 +1,31 @@
+import csv
+import gzip
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 import xlsxwriter
-from openpyxl import Workbook
 
-from config import EXCEL_MAX_ROWS_PER_FILE
+from config import EXCEL_MAX_ROWS_PER_FILE, EXPORT_FETCH_ROWS, EXPORT_FORMAT, EXPORT_WORKERS
 from core.db_manager import SQLiteManager
 
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # وابستگی اختیاری (خروجی parquet / arrow)
+    pa = None
+    pq = None
+
+
+# قالب‌های خروجی و پسوند فایل هر کدام
+EXPORT_FORMATS = {"xlsx": ".xlsx", "csv": ".csv.gz", "parquet": ".parquet", "arrow": ".arrow"}
+
+# سطح فشرده‌سازی gzip فایل‌های CSV (۹ کندتر و فقط کمی کوچک‌تر است)
+_CSV_GZIP_LEVEL = 6
+
+# تعداد ردیف هر row group / record batch در خروجی parquet و arrow
+_ARROW_BATCH_ROWS = 100_000
+
 
 def _ensure_str(val):
     """تبدیل مقدار به رشته با پشتیبانی صحیح از Unicode/فارسی."""
@@ -16,39 +36,689 @@ def _ensure_str(val):
     return str(val)
 
 
+class _ColumnWriters(dict):
+    """
+    نگاشت نوع مقدار => تابع نوشتن یک ستون (row, col, value)؛ نوع‌های دیگر مثل قبل با ws.write
+    به صورت رشته RTL نوشته می‌شوند.
+    """
+
+    def __init__(self, writers: dict, fallback):
+        super().__init__(writers)
+        self._fallback = fallback
+
+    def __missing__(self, value_type):
+        return self._fallback
+
+
+def _column_writers(ws, column_count: int, rtl_format, number_formats: list) -> list[_ColumnWriters]:
+    """
+    برنامه نوشتن هر ستون، یک بار برای هر فایل: عدد => write_number با فرمت عددی ستون،
+    رشته => write_string با RTL، خالی => write_blank با RTL. خروجی سلول‌ها همان ws.write است:
+    رشته خالی یا شروع‌شده با "=" یا "{" (فرمول در ws.write) از همان ws.write می‌گذرد.
+    """
+    write, write_number, write_string, write_blank = ws.write, ws.write_number, ws.write_string, ws.write_blank
+
+    def text(row, col, val):
+        if val and val[0] not in "={":
+            write_string(row, col, val, rtl_format)
+        else:
+            write(row, col, val, rtl_format)
+
+    def blank(row, col, _val):
+        write_blank(row, col, None, rtl_format)
+
+    def other(row, col, val):
+        write(row, col, _ensure_str(val), rtl_format)
+
+    plans = []
+    for col_idx in range(column_count):
+        fmt = number_formats[col_idx] if col_idx < len(number_formats) else rtl_format
+
+        def number(row, col, val, fmt=fmt):
+            write_number(row, col, val, fmt)
+
+        def boolean(row, col, val, fmt=fmt):
+            write(row, col, val, fmt)
+
+        plans.append(_ColumnWriters({int: number, float: number, str: text, type(None): blank, bool: boolean}, other))
+    return plans
+
+
+def _open_chunk_workbook(
+    output_path: Path,
+    sheet_name: str,
+    columns: list[str],
+    column_formats: dict[str, str] | None,
+):
+    """
+    ساخت workbook یک فایل chunk با هدر. برمی‌گرداند (wb, ws, rtl_format, number_formats)؛
+    number_formats برای هر ستون فرمت عددی همان workbook (یا rtl_format).
+    """
+    wb = xlsxwriter.Workbook(
+        str(output_path),
+        options={"strings_to_urls": False, "constant_memory": True},
+    )
+    ws = wb.add_worksheet(sheet_name[:31])
+    ws.right_to_left()  # جهت راست‌به‌چپ برای فارسی
+
+    # فرمت RTL برای نمایش صحیح متن فارسی (فرمت‌ها متعلق به همان workbook هستند)
+    rtl_format = wb.add_format({"reading_order": 2})
+
+    # فرمت‌های عددی اختیاری (کاما استایل و غیره) با RTL
+    format_cache: dict[str, object] = {}
+    number_formats = []
+    for col_name in columns:
+        fmt_str = (column_formats or {}).get(col_name)
+        if fmt_str is None:
+            number_formats.append(rtl_format)
+            continue
+        if fmt_str not in format_cache:
+            format_cache[fmt_str] = wb.add_format({"reading_order": 2, "num_format": fmt_str})
+        number_formats.append(format_cache[fmt_str])
+
+    # هدر
+    for col, val in enumerate(columns):
+        ws.write(0, col, _ensure_str(val), rtl_format)
+    return wb, ws, rtl_format, number_formats
+
+
+def _write_rows(writers: list[_ColumnWriters], rows, first_row: int) -> int:
+    """نوشتن ردیف‌ها از first_row با برنامه ستون‌ها؛ برمی‌گرداند شماره ردیف بعدی."""
+    row_idx = first_row
+    for row in rows:
+        for col_idx, val in enumerate(row):
+            writers[col_idx][type(val)](row_idx, col_idx, val)
+        row_idx += 1
+    return row_idx
+
+
+def _write_rowid_range(
+    db_path: str,
+    table_name: str,
+    first_rowid: int,
+    last_rowid: int,
+    output_path: str,
+    sheet_name: str,
+    columns: list[str],
+    column_formats: dict[str, str] | None,
+) -> str:
+    """
+    نوشتن یک فایل chunk در پردازه جدا: ردیف‌های first_rowid..last_rowid جدول با اتصال فقط‌خواندنی
+    خود worker به دیتابیس. برمی‌گرداند مسیر فایل.
+    """
+    conn = sqlite3.connect(Path(db_path).resolve().as_uri() + "?mode=ro", uri=True)
+    try:
+        cursor = conn.execute(
+            f'SELECT * FROM "{table_name}" WHERE rowid BETWEEN ? AND ? ORDER BY rowid',
+            (first_rowid, last_rowid),
+        )
+        wb, ws, rtl_format, number_formats = _open_chunk_workbook(
+            Path(output_path), sheet_name, columns, column_formats
+        )
+        writers = _column_writers(ws, max(len(columns), len(cursor.description)), rtl_format, number_formats)
+        try:
+            row_idx = 1
+            while True:
+                rows = cursor.fetchmany(EXPORT_FETCH_ROWS)
+                if not rows:
+                    break
+                row_idx = _write_rows(writers, rows, row_idx)
+        finally:
+            wb.close()
+    finally:
+        conn.close()
+    return output_path
+
+
+def export_format_available(export_format: str) -> bool:
+    """قالب خروجی شناخته‌شده است و وابستگی آن نصب است (parquet / arrow به pyarrow نیاز دارند)."""
+    if export_format not in EXPORT_FORMATS:
+        return False
+    return export_format in ("xlsx", "csv") or pa is not None
+
+
+def resolve_export_format(export_format: str | None = None) -> str:
+    """
+    قالب نهایی خروجی: None => EXPORT_FORMAT در config؛ قالب ناشناخته => xlsx؛
+    parquet / arrow بدون pyarrow => csv.
+    """
+    fmt = str(export_format or EXPORT_FORMAT).strip().lower()
+    if fmt not in EXPORT_FORMATS:
+        return "xlsx"
+    if not export_format_available(fmt):
+        return "csv"
+    return fmt
+
+
+def _file_part(value: str) -> str:
+    """بخشی از نام فایل از یک مقدار (مثلاً نام سگمنت): فاصله و نویسه‌های غیرمجاز => "_"."""
+    part = "".join(ch if ch.isalnum() or ch in "-." else "_" for ch in value.strip()).strip("._")
+    return part or "empty"
+
+
+def _output_columns(column_headers: list[str] | None, description) -> list[str]:
+    """نام ستون‌های خروجی: column_headers و برای ستون‌های بیشتر همان نام ستون منبع."""
+    source = [desc[0] for desc in description]
+    headers = list(column_headers or [])[: len(source)]
+    return headers + source[len(headers) :]
+
+
+class _XlsxSink:
+    """
+    فایل‌های 1_{base}.xlsx, 2_{base}.xlsx, ... (xlsxwriter با constant_memory) با حداکثر max_rows ردیف
+    در هر فایل؛ ردیف‌ها دسته به دسته با write می‌رسند و با پر شدن فایل، فایل بعدی شروع می‌شود.
+    """
+
+    def __init__(
+        self,
+        output_dir: Path,
+        output_base_name: str,
+        columns: list[str],
+        column_count: int,
+        max_rows: int,
+        column_formats: dict[str, str] | None,
+    ):
+        self.output_dir = output_dir
+        self.output_base_name = output_base_name
+        self.columns = columns
+        self.column_count = column_count
+        self.max_rows = max_rows
+        self.column_formats = column_formats
+        self.paths: list[Path] = []
+        self._wb = None
+        self._writers = None
+        # شماره ردیف بعدی فایل فعلی (ردیف ۰ هدر است)
+        self._next_row = max_rows + 1
+
+    def write(self, rows) -> None:
+        start = 0
+        while start < len(rows):
+            if self._next_row > self.max_rows:
+                if self._wb is not None:
+                    self._wb.close()
+                output_path = self.output_dir / f"{len(self.paths) + 1}_{self.output_base_name}.xlsx"
+                self._wb, ws, rtl_format, number_formats = _open_chunk_workbook(
+                    output_path, self.output_base_name, self.columns, self.column_formats
+                )
+                self._writers = _column_writers(ws, self.column_count, rtl_format, number_formats)
+                self.paths.append(output_path)
+                self._next_row = 1
+            end = min(len(rows), start + self.max_rows + 1 - self._next_row)
+            self._next_row = _write_rows(self._writers, rows[start:end], self._next_row)
+            start = end
+
+    def close(self) -> list[Path]:
+        if self._wb is not None:
+            self._wb.close()
+            self._wb = None
+        return self.paths
+
+
+class _CsvGzSink:
+    """یک فایل CSV فشرده (gzip، UTF-8) با هدر."""
+
+    def __init__(self, output_path: Path, columns: list[str]):
+        self.path = output_path
+        self._file = gzip.open(output_path, "wt", encoding="utf-8", newline="", compresslevel=_CSV_GZIP_LEVEL)
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(columns)
+
+    def write(self, rows) -> None:
+        self._writer.writerows(rows)
+
+    def close(self) -> list[Path]:
+        self._file.close()
+        return [self.path]
+
+
+def _declared_arrow_types(db, source_name: str) -> list:
+    """
+    نوع Arrow هر ستون جدول/view از نوع اعلام‌شده (PRAGMA table_info، قواعد affinity در SQLite):
+    INT => int64، CHAR/CLOB/TEXT => string، REAL/FLOA/DOUB => float64، بی‌نوع/BLOB/NUMERIC => None.
+    """
+    types = []
+    for row in db.execute(f'PRAGMA table_info("{source_name}")').fetchall():
+        declared = (row[2] or "").upper()
+        if "INT" in declared:
+            types.append(pa.int64())
+        elif any(name in declared for name in ("CHAR", "CLOB", "TEXT")):
+            types.append(pa.string())
+        elif any(name in declared for name in ("REAL", "FLOA", "DOUB")):
+            types.append(pa.float64())
+        else:
+            types.append(None)
+    return types
+
+
+def _arrow_type_of(values: list):
+    """
+    نوع Arrow مقادیر یک ستون: فقط integer => int64، real (با یا بدون integer) => float64،
+    متن/blob/مخلوط => string، همه NULL => None.
+    """
+    try:
+        inferred = pa.array(values).type
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.string()
+    if pa.types.is_null(inferred):
+        return None
+    if pa.types.is_integer(inferred):
+        return pa.int64()
+    if pa.types.is_floating(inferred):
+        return pa.float64()
+    return pa.string()
+
+
+def _wider_arrow_type(current, other):
+    """نوعی که هر دو را بگیرد: int64 و float64 => float64، هر ترکیب دیگر => string."""
+    if other is None or other == current:
+        return current
+    if pa.types.is_integer(current) and pa.types.is_floating(other):
+        return other
+    return pa.string()
+
+
+def _arrow_column(values: list, arrow_type):
+    """
+    آرایه Arrow یک ستون با نوع arrow_type؛ None اگر مقادیر در آن نگنجند (نوع ستون باید گسترده شود).
+    در ستون string مقدار غیرمتنی با _ensure_str به رشته تبدیل می‌شود.
+    """
+    try:
+        if pa.types.is_integer(arrow_type):
+            # با type=int64 مقدار real مثل 2.0 بی‌صدا به 2 تبدیل می‌شد
+            array = pa.array(values)
+            if pa.types.is_null(array.type):
+                return array.cast(arrow_type)
+            return array if array.type == arrow_type else None
+        return pa.array(values, type=arrow_type)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        if not pa.types.is_string(arrow_type):
+            return None
+    return pa.array([v if v is None or isinstance(v, str) else _ensure_str(v) for v in values], type=arrow_type)
+
+
+def _int_positions(values: list) -> bytes | None:
+    """
+    نشانه (یک بایت برای هر ردیف) مقدارهای integer یک دسته از ستون float64؛ None اگر integerی نباشد.
+    integerهای تا 2**53 از float خود دقیق برمی‌گردند.
+    """
+    mask = bytes(type(v) is int for v in values)
+    return mask if 1 in mask else None
+
+
+def _read_arrow_tables(path: Path, export_format: str):
+    """row groupهای فایل parquet یا record batchهای فایل arrow، هر کدام یک Table."""
+    if export_format == "parquet":
+        with pq.ParquetFile(str(path)) as parquet_file:
+            for i in range(parquet_file.num_row_groups):
+                yield parquet_file.read_row_group(i)
+    else:
+        with pa.OSFile(str(path), "rb") as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                yield pa.Table.from_batches([reader.get_batch(i)])
+
+
+class _ColumnarSink:
+    """
+    یک فایل ستونی parquet (zstd) یا arrow IPC (zstd) با pyarrow؛ هر _ARROW_BATCH_ROWS ردیف یک
+    row group / record batch است و حافظه به همین اندازه محدود می‌ماند.
+    نوع ستون‌ها بدون اسکن جدا از اولین دسته ردیف‌ها تعیین می‌شود (فقط integer => int64، real => float64،
+    متن/blob => string)؛ ستونی که در آن دسته همه NULL است نوع type_hints یا string می‌گیرد. اگر دسته‌ای
+    بعداً در نوع ستون نگنجد (مثلاً متن در ستون int64)، نوع گسترده می‌شود و ردیف‌های نوشته‌شده یک بار
+    با نوع جدید بازنویسی می‌شوند. ستون float64 جای integerهای اصلی را نگه می‌دارد (_int_positions) تا
+    در گسترش به string هر مقدار از شکل اصلی‌اش نوشته شود (5 => '5' نه '5.0'، مثل _ensure_str).
+    """
+
+    def __init__(self, output_path: Path, columns: list[str], export_format: str, type_hints: list | None = None):
+        self.path = output_path
+        self.columns = columns
+        self.format = export_format
+        self.type_hints = type_hints or []
+        self.schema = None
+        self._writer = None
+        self._pending: list[tuple] = []
+        # اندیس ستون float64 => نشانه integerهای هر row group نوشته‌شده
+        self._int_masks: dict[int, list] = {}
+
+    def write(self, rows) -> None:
+        self._pending.extend(rows)
+        if len(self._pending) >= _ARROW_BATCH_ROWS:
+            self._flush()
+
+    def _hint(self, i: int):
+        return (self.type_hints[i] if i < len(self.type_hints) else None) or pa.string()
+
+    def _open(self, types: list) -> None:
+        self.schema = pa.schema(list(zip(self.columns, types)))
+        if self.format == "parquet":
+            self._writer = pq.ParquetWriter(str(self.path), self.schema, compression="zstd")
+        else:
+            self._writer = pa.ipc.new_file(
+                str(self.path), self.schema, options=pa.ipc.IpcWriteOptions(compression="zstd")
+            )
+
+    def _widen(self, types: list) -> None:
+        """بازنویسی ردیف‌های نوشته‌شده با نوع‌های گسترده‌تر (فقط وقتی دسته‌ای در نوع ستون نگنجد)."""
+        self._writer.close()
+        written = self.path.with_name(self.path.name + ".widen")
+        self.path.replace(written)
+        old_types = [field.type for field in self.schema]
+        masks = self._int_masks
+        self._int_masks = {
+            i: masks.get(i, []) if old_types[i] == new_type else []
+            for i, new_type in enumerate(types)
+            if pa.types.is_floating(new_type)
+        }
+        self._open(types)
+        for group, table in enumerate(_read_arrow_tables(written, self.format)):
+            arrays = []
+            for i, (col, field) in enumerate(zip(table.columns, self.schema)):
+                if col.type == field.type:
+                    arrays.append(col)
+                    continue
+                values = col.to_pylist()
+                mask = masks[i][group] if i in masks else None
+                if mask is not None:
+                    values = [int(v) if flag else v for v, flag in zip(values, mask)]
+                if i in self._int_masks:
+                    self._int_masks[i].append(_int_positions(values))
+                arrays.append(_arrow_column(values, field.type))
+            self._writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+        written.unlink()
+
+    def _flush(self) -> None:
+        if not self._pending:
+            return
+        values = [list(col) for col in zip(*self._pending)]
+        self._pending = []
+        if self._writer is None:
+            self._open([_arrow_type_of(col) or self._hint(i) for i, col in enumerate(values)])
+            self._int_masks = {i: [] for i, field in enumerate(self.schema) if pa.types.is_floating(field.type)}
+        arrays = [_arrow_column(col, field.type) for col, field in zip(values, self.schema)]
+        if any(array is None for array in arrays):
+            self._widen(
+                [
+                    field.type if array is not None else _wider_arrow_type(field.type, _arrow_type_of(col))
+                    for col, field, array in zip(values, self.schema, arrays)
+                ]
+            )
+            arrays = [_arrow_column(col, field.type) for col, field in zip(values, self.schema)]
+        for i, masks in self._int_masks.items():
+            masks.append(_int_positions(values[i]))
+        self._writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self) -> list[Path]:
+        try:
+            self._flush()
+            if self._writer is None:
+                self._open([self._hint(i) for i in range(len(self.columns))])
+        finally:
+            if self._writer is not None:
+                self._writer.close()
+        return [self.path]
+
+
+def open_chunked_xlsx(
+    output_dir: str | Path,
+    output_base_name: str,
+    columns: list[str],
+    column_formats: dict[str, str] | None = None,
+    max_rows_per_file: int | None = None,
+) -> _XlsxSink:
+    """
+    نویسنده chunked برای ردیف‌هایی که از جدول خوانده نمی‌شوند (مثلاً امتیازهای حساب‌شده در پایتون):
+    write(rows) و در پایان close() که مسیر فایل‌های 1_{base}.xlsx, 2_{base}.xlsx, ... را برمی‌گرداند.
+    همان xlsxwriter با constant_memory، RTL و فرمت‌های عددی export_view_chunked.
+    """
+    return _XlsxSink(
+        Path(output_dir),
+        output_base_name,
+        list(columns),
+        len(columns),
+        max_rows_per_file or EXCEL_MAX_ROWS_PER_FILE,
+        column_formats,
+    )
+
+
+def _open_sink(
+    export_format: str,
+    output_dir: Path,
+    output_base_name: str,
+    columns: list[str],
+    column_count: int,
+    max_rows: int,
+    column_formats: dict[str, str] | None,
+    type_hints: list | None = None,
+):
+    """
+    نویسنده جریانی هر قالب (write(rows) و close() => مسیر فایل‌ها): xlsx => _XlsxSink چندفایلی؛
+    csv / parquet / arrow => یک فایل {base}{پسوند}. type_hints نوع ستون‌های همه‌NULL در parquet / arrow.
+    """
+    if export_format == "xlsx":
+        return _XlsxSink(output_dir, output_base_name, columns, column_count, max_rows, column_formats)
+    output_path = output_dir / f"{output_base_name}{EXPORT_FORMATS[export_format]}"
+    if export_format == "csv":
+        return _CsvGzSink(output_path, columns)
+    return _ColumnarSink(output_path, columns, export_format, type_hints)
+
+
+def _export_cursor(
+    db,
+    source_name: str | None,
+    cursor,
+    columns: list[str],
+    output_dir: Path,
+    output_base_name: str,
+    export_format: str,
+    max_rows: int,
+    column_formats: dict[str, str] | None,
+) -> list[Path]:
+    """
+    نوشتن همه ردیف‌های cursor (fetchmany، حافظه محدود) با نویسنده قالب export_format.
+    source_name (جدول/view منبع cursor یا None برای کوئری) فقط برای نوع اعلام‌شده ستون‌های parquet / arrow
+    خوانده می‌شود. برمی‌گرداند مسیر فایل‌ها.
+    """
+    type_hints = None
+    if export_format in ("parquet", "arrow") and source_name is not None:
+        type_hints = _declared_arrow_types(db, source_name)
+    sink = _open_sink(
+        export_format,
+        output_dir,
+        output_base_name,
+        columns,
+        max(len(columns), len(cursor.description)),
+        max_rows,
+        column_formats,
+        type_hints,
+    )
+    try:
+        while True:
+            rows = cursor.fetchmany(EXPORT_FETCH_ROWS)
+            if not rows:
+                break
+            sink.write(rows)
+    finally:
+        paths = sink.close()
+    return paths
+
+
+def _export_table_file(
+    db_path: str, table_name: str, output_dir: str, export_format: str, max_rows: int
+) -> list[str]:
+    """
+    خروجی یک جدول کامل در پردازه جدا (export_all موازی) با اتصال فقط‌خواندنی خود worker؛
+    همان فایل‌های export_table. برمی‌گرداند مسیر فایل‌ها.
+    """
+    conn = sqlite3.connect(Path(db_path).resolve().as_uri() + "?mode=ro", uri=True)
+    try:
+        cursor = conn.execute(f'SELECT * FROM "{table_name}"')
+        columns = _output_columns(None, cursor.description)
+        paths = _export_cursor(
+            conn, table_name, cursor, columns, Path(output_dir), table_name, export_format, max_rows, None
+        )
+    finally:
+        conn.close()
+    return [str(p) for p in paths]
+
+
 class ExcelExporter:
-    """Exports SQLite tables to Excel files."""
+    """Exports SQLite tables to Excel (or gzip CSV / Parquet / Arrow) files."""
 
     def __init__(self, db_manager: SQLiteManager, output_dir: str | Path):
         self.db = db_manager
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
 
-    def export_table(self, table_name: str, column_headers: list[str] | None = None) -> Path:
-        cursor = self.db.execute(f'SELECT * FROM "{table_name}"')
-        columns = column_headers or [desc[0] for desc in cursor.description]
-        rows = cursor.fetchall()
-
-        wb = Workbook()
-        ws = wb.active
-        ws.title = table_name[:31]
-        ws.append(columns)
-        for row in rows:
-            ws.append(list(row))
-
-        output_path = self.output_dir / f"{table_name}.xlsx"
-        wb.save(str(output_path))
-        return output_path
+    def export_table(
+        self,
+        table_name: str,
+        column_headers: list[str] | None = None,
+        export_format: str | None = None,
+        max_rows_per_file: int | None = None,
+    ) -> list[Path]:
+        """
+        خروجی یک جدول مثل export_view: جریانی با fetchmany (xlsx چندفایلی 1_{table}.xlsx, ... با
+        حداکثر max_rows_per_file ردیف، یا یک فایل csv.gz / parquet / arrow). برمی‌گرداند مسیر فایل‌ها.
+        """
+        return self.export_view(
+            table_name,
+            table_name,
+            export_format=export_format,
+            column_headers=column_headers,
+            max_rows_per_file=max_rows_per_file,
+            workers=1,
+        )
 
-    def export_all(self) -> list[Path]:
+    def export_all(self, export_format: str | None = None, workers: int | None = None) -> list[Path]:
+        """
+        خروجی همه جداول دیتابیس (هر جدول با export_table). workers (None = EXPORT_WORKERS):
+        با بیش از ۱ هر جدول در یک پردازه جدا با اتصال فقط‌خواندنی خودش نوشته می‌شود؛
+        ترتیب خروجی همان ترتیب جداول است.
+        """
         tables = self.db.get_tables()
+        fmt = resolve_export_format(export_format)
+        workers = EXPORT_WORKERS if workers is None else workers
+        if workers and int(workers) > 1 and len(tables) > 1:
+            # workerها با اتصال خودشان می‌خوانند؛ تغییرات ثبت‌نشده از دید آن‌ها پنهان است
+            self.db.commit()
+            with ProcessPoolExecutor(max_workers=min(int(workers), len(tables))) as pool:
+                futures = [
+                    pool.submit(
+                        _export_table_file,
+                        str(self.db.db_path),
+                        table,
+                        str(self.output_dir),
+                        fmt,
+                        EXCEL_MAX_ROWS_PER_FILE,
+                    )
+                    for table in tables
+                ]
+                results = [[Path(p) for p in future.result()] for future in futures]
+        else:
+            results = [self.export_table(table, export_format=fmt) for table in tables]
+
         exported = []
-        for table in tables:
-            path = self.export_table(table)
-            exported.append(path)
-            print(f"  Exported: {table} -> {path.name}")
+        for table, paths in zip(tables, results):
+            for path in paths:
+                print(f"  Exported: {table} -> {path.name}")
+            exported.extend(paths)
         return exported
 
+    def _rowid_ranges(self, table_name: str, max_rows: int) -> list[tuple[int, int]] | None:
+        """
+        بازه‌های rowid هر فایل (max_rows ردیف به ترتیب rowid) با یک اسکن rowid.
+        None اگر منبع VIEW یا جدول WITHOUT ROWID باشد (ترتیب SELECT * با rowid تضمین نیست).
+        """
+        row = self.db.execute(
+            "SELECT sql FROM sqlite_master WHERE type='table' AND name=? LIMIT 1", (table_name,)
+        ).fetchone()
+        if row is None or "WITHOUT ROWID" in (row[0] or "").upper():
+            return None
+        ranges: list[tuple[int, int]] = []
+        cursor = self.db.execute(f'SELECT rowid FROM "{table_name}" ORDER BY rowid')
+        position = 0
+        first = last = None
+        while True:
+            rowids = cursor.fetchmany(EXPORT_FETCH_ROWS)
+            if not rowids:
+                break
+            for (rowid,) in rowids:
+                if position % max_rows == 0:
+                    if first is not None:
+                        ranges.append((first, last))
+                    first = rowid
+                last = rowid
+                position += 1
+        if first is not None:
+            ranges.append((first, last))
+        return ranges
+
+    def _export_ranges_parallel(
+        self,
+        table_name: str,
+        output_base_name: str,
+        ranges: list[tuple[int, int]],
+        workers: int,
+        column_headers: list[str] | None,
+        column_formats: dict[str, str] | None,
+    ) -> list[Path]:
+        """نوشتن هر فایل chunk در یک پردازه جدا؛ ترتیب و نام فایل‌ها همان حالت ترتیبی است."""
+        cursor = self.db.execute(f'SELECT * FROM "{table_name}" LIMIT 0')
+        columns = column_headers or [desc[0] for desc in cursor.description]
+        # workerها با اتصال خودشان می‌خوانند؛ تغییرات ثبت‌نشده از دید آن‌ها پنهان است
+        self.db.commit()
+        paths = [self.output_dir / f"{i}_{output_base_name}.xlsx" for i in range(1, len(ranges) + 1)]
+        with ProcessPoolExecutor(max_workers=min(workers, len(ranges))) as pool:
+            futures = [
+                pool.submit(
+                    _write_rowid_range,
+                    str(self.db.db_path),
+                    table_name,
+                    first,
+                    last,
+                    str(path),
+                    output_base_name,
+                    columns,
+                    column_formats,
+                )
+                for (first, last), path in zip(ranges, paths)
+            ]
+            for future in futures:
+                future.result()
+        return paths
+
+    def export_view(
+        self,
+        view_name: str,
+        output_base_name: str,
+        export_format: str | None = None,
+        column_headers: list[str] | None = None,
+        max_rows_per_file: int | None = None,
+        column_formats: dict[str, str] | None = None,
+        workers: int | None = None,
+    ) -> list[Path]:
+        """
+        خروجی جدول/view در قالب export_format (None = EXPORT_FORMAT در config، با resolve_export_format):
+        xlsx => همان export_view_chunked (فایل‌های 1_{base}.xlsx, ...)؛ csv / parquet / arrow => یک فایل
+        {base}.csv.gz / {base}.parquet / {base}.arrow بدون سقف ردیف، جریانی با fetchmany.
+        column_formats و workers فقط برای xlsx هستند.
+        """
+        fmt = resolve_export_format(export_format)
+        if fmt == "xlsx":
+            return self.export_view_chunked(
+                view_name,
+                output_base_name,
+                column_headers=column_headers,
+                max_rows_per_file=max_rows_per_file,
+                column_formats=column_formats,
+                workers=workers,
+            )
+        cursor = self.db.execute(f'SELECT * FROM "{view_name}"')
+        columns = _output_columns(column_headers, cursor.description)
+        return _export_cursor(
+            self.db, view_name, cursor, columns, self.output_dir, output_base_name, fmt, None, None
+        )
+
     def export_view_chunked(
         self,
         view_name: str,
@@ -56,86 +726,98 @@ class ExcelExporter:
         column_headers: list[str] | None = None,
         max_rows_per_file: int | None = None,
         column_formats: dict[str, str] | None = None,
+        workers: int | None = None,
     ) -> list[Path]:
         """
         خروجی view به چند فایل Excel با حداکثر ردیف مشخص.
         نام فایل‌ها: 1_{base}.xlsx, 2_{base}.xlsx, ...
+        view فقط یک بار با یک cursor خوانده می‌شود (fetchmany، بدون LIMIT/OFFSET) و با رسیدن به
+        max_rows_per_file فایل بعدی شروع می‌شود؛ حافظه مستقل از تعداد ردیف‌ها است.
         از xlsxwriter برای پشتیبانی صحیح از Unicode و متن فارسی استفاده می‌شود.
         column_formats: نام ستون -> رشته فرمت عددی xlsxwriter (مثلاً "#,##0.00" برای کاما استایل).
+        workers: تعداد پردازه نوشتن فایل‌ها (None = EXPORT_WORKERS در config)؛ با بیش از ۱ و جدول rowid‌دار
+        هر فایل با بازه rowid خودش در یک worker نوشته می‌شود (همان نام‌ها و فرمت‌ها).
         """
         max_rows = max_rows_per_file or EXCEL_MAX_ROWS_PER_FILE
-        total = self.db.execute(f'SELECT COUNT(*) FROM "{view_name}"').fetchone()[0]
-        if total == 0:
-            return []
-
-        exported = []
-        file_index = 1
-        offset = 0
-
-        # فرمت RTL برای نمایش صحیح متن فارسی
-        rtl_format = None
-
-        while offset < total:
-            limit = min(max_rows, total - offset)
-            cursor = self.db.execute(
-                f'SELECT * FROM "{view_name}" LIMIT ? OFFSET ?',
-                (limit, offset),
-            )
-            columns = column_headers or [desc[0] for desc in cursor.description]
-            rows = cursor.fetchall()
+        workers = EXPORT_WORKERS if workers is None else workers
+        if workers and int(workers) > 1:
+            ranges = self._rowid_ranges(view_name, max_rows)
+            if ranges is not None and len(ranges) > 1:
+                return self._export_ranges_parallel(
+                    view_name, output_base_name, ranges, int(workers), column_headers, column_formats
+                )
+        cursor = self.db.execute(f'SELECT * FROM "{view_name}"')
+        columns = column_headers or [desc[0] for desc in cursor.description]
+        return _export_cursor(
+            self.db,
+            view_name,
+            cursor,
+            columns,
+            self.output_dir,
+            output_base_name,
+            "xlsx",
+            max_rows,
+            column_formats,
+        )
 
-            filename = f"{file_index}_{output_base_name}.xlsx"
-            output_path = self.output_dir / filename
+    def export_fanout(
+        self,
+        query: str,
+        key_column: str,
+        output_base_name: str,
+        export_format: str | None = None,
+        column_headers: list[str] | None = None,
+        max_rows_per_file: int | None = None,
+        column_formats: dict[str, str] | None = None,
+    ) -> dict[object, list[Path]]:
+        """
+        خروجی جدا برای هر مقدار key_column (مثلاً هر سگمنت) با یک بار خواندن query: هر دسته fetchmany
+        بر اساس کلید گروه‌بندی و به نویسنده همان کلید داده می‌شود؛ نویسنده‌ها هم‌زمان باز هستند
+        (N کوئری فیلترشده و N مرتب‌سازی لازم نیست) و در xlsx هر کدام با max_rows_per_file فایل بعدی را شروع می‌کند.
+        نام فایل‌ها: 1_{base}_{key}.xlsx, ... یا {base}_{key}.csv.gz / .parquet / .arrow.
+        ترتیب ردیف‌های هر فایل همان ترتیب query است. برمی‌گرداند {کلید خام: مسیر فایل‌ها} به ترتیب اولین ردیف هر کلید
+        (None و '' دو کلید جدا می‌مانند).
+        """
+        fmt = resolve_export_format(export_format)
+        max_rows = max_rows_per_file or EXCEL_MAX_ROWS_PER_FILE
+        cursor = self.db.execute(query)
+        source_columns = [desc[0] for desc in cursor.description]
+        key_idx = source_columns.index(key_column)
+        columns = _output_columns(column_headers, cursor.description)
+        # نوع ستون‌های همه‌NULL هر فایل parquet / arrow از اولین دسته کل کوئری (بدون اسکن دوم query)
+        type_hints = None
 
-            wb = xlsxwriter.Workbook(
-                str(output_path),
-                options={"strings_to_urls": False, "constant_memory": True},
-            )
-            ws = wb.add_worksheet(output_base_name[:31])
-            ws.right_to_left()  # جهت راست‌به‌چپ برای فارسی
-
-            if rtl_format is None:
-                rtl_format = wb.add_format({"reading_order": 2})  # RTL
-
-            # فرمت‌های عددی اختیاری (کاما استایل و غیره) با RTL
-            format_cache: dict[str, object] = {}
-            if column_formats:
-                for fmt_str in column_formats.values():
-                    if fmt_str not in format_cache:
-                        format_cache[fmt_str] = wb.add_format(
-                            {"reading_order": 2, "num_format": fmt_str}
+        sinks: dict[object, object] = {}
+        used_names: set[str] = set()
+        try:
+            while True:
+                rows = cursor.fetchmany(EXPORT_FETCH_ROWS)
+                if not rows:
+                    break
+                if type_hints is None and fmt in ("parquet", "arrow"):
+                    type_hints = [_arrow_type_of(list(col)) for col in zip(*rows)]
+                groups: dict[object, list[tuple]] = {}
+                for row in rows:
+                    groups.setdefault(row[key_idx], []).append(row)
+                for key, group in groups.items():
+                    sink = sinks.get(key)
+                    if sink is None:
+                        # دو کلید با یک نام فایل (مثلاً "At Risk" و "At_Risk") شماره می‌گیرند
+                        name = f"{output_base_name}_{_file_part(_ensure_str(key))}"
+                        if name in used_names:
+                            name = f"{name}_{len(sinks) + 1}"
+                        used_names.add(name)
+                        sink = sinks[key] = _open_sink(
+                            fmt,
+                            self.output_dir,
+                            name,
+                            columns,
+                            len(columns),
+                            max_rows,
+                            column_formats,
+                            type_hints,
                         )
-
-            # هدر
-            for col, val in enumerate(columns):
-                ws.write(0, col, _ensure_str(val), rtl_format)
-
-            # داده‌ها
-            for row_idx, row in enumerate(rows):
-                for col_idx, val in enumerate(row):
-                    if val is None:
-                        cell_val = ""
-                        fmt = rtl_format
-                    elif isinstance(val, (int, float)):
-                        cell_val = val
-                        col_name = columns[col_idx] if col_idx < len(columns) else None
-                        if (
-                            column_formats
-                            and col_name
-                            and col_name in column_formats
-                        ):
-                            fmt = format_cache[column_formats[col_name]]
-                        else:
-                            fmt = rtl_format
-                    else:
-                        cell_val = _ensure_str(val)
-                        fmt = rtl_format
-                    ws.write(row_idx + 1, col_idx, cell_val, fmt)
-
-            wb.close()
-            exported.append(output_path)
-
-            offset += limit
-            file_index += 1
-
+                    sink.write(group)
+        finally:
+            exported = {key: sink.close() for key, sink in sinks.items()}
         return exported
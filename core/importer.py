@@ -2,7 +2,9 @@
 وارد کردن جداول از دامپ MySQL به دیتابیس موقت SQLite.
 بهینه برای فایل‌های بزرگ (تا ۱ گیگ) - استریم و پردازش بدون بارگذاری کل فایل.
 """
+import re
 import sqlite3
+import time
 from pathlib import Path
 
 from config import TABLE_GROUPS
@@ -12,6 +14,18 @@ from core.dump_reader import DumpReader
 from utils.helpers import remove_table_prefix
 
 
+# مقدار siteurl در INSERT جدول options وردپرس: (option_id, 'siteurl', 'value', ...)
+_SITEURL_RE = re.compile(r"'siteurl'\s*,\s*'((?:[^'\\]|\\.)*)'")
+
+
+def _close_segment(db: SQLiteManager, table_stats: dict[str, list], segment: tuple) -> None:
+    """افزودن زمان و تغییر صفحات یک دنباله INSERT پشت‌سرهم (segment) به آمار جدولش."""
+    target, started, bytes_before = segment
+    stats = table_stats.setdefault(target, [0, 0, 0.0])
+    stats[1] += db.used_bytes() - bytes_before
+    stats[2] += time.perf_counter() - started
+
+
 class DumpImporter:
     """وارد کردن جداول انتخاب‌شده از دامپ MySQL به SQLite."""
 
@@ -20,10 +34,13 @@ class DumpImporter:
         db_path,
         dump_reader: DumpReader = None,
         converter: MySQLToSQLiteConverter = None,
+        session: SQLiteManager = None,
     ):
         self.db_path = db_path
         self.reader = dump_reader or DumpReader()
         self.converter = converter or MySQLToSQLiteConverter()
+        # اگر session داده شود، import روی همان اتصال مشترک انجام می‌شود
+        self.session = session
 
     def import_complete_groups(
         self,
@@ -34,7 +51,8 @@ class DumpImporter:
     ) -> dict:
         """
         جداول گروه‌های کامل را از دامپ به دیتابیس موقت وارد می‌کند.
-        برمی‌گرداند: {"tables_created": n, "inserts_count": n, "errors": [...]}
+        برمی‌گرداند: {"tables_created": n, "inserts_count": n, "errors": [...], "site_url": str | None}
+        site_url مقدار siteurl جدول options است (خود جدول وارد نمی‌شود) تا خروجی‌های هر سایت از هم جدا باشند.
         """
         groups = table_groups or TABLE_GROUPS
         wanted_normalized = set()
@@ -43,14 +61,20 @@ class DumpImporter:
                 wanted_normalized.update(groups[g])
 
         if not wanted_normalized:
-            return {"tables_created": 0, "inserts_count": 0, "errors": []}
+            return {"tables_created": 0, "inserts_count": 0, "errors": [], "site_url": None}
 
         # نگاشت: نام جدول در دامپ (با پیشوند) -> نام نرمال (بدون پیشوند)
         tables_created = set()
         inserts_count = 0
         errors = []
+        site_url = None
+        # آمار هر جدول در حین import: {table: [rows, bytes, seconds]}
+        table_stats: dict[str, list] = {}
+        # INSERTهای هر جدول در دامپ پشت‌سرهم‌اند؛ زمان و تغییر صفحات فقط در مرز جدول‌ها اندازه گرفته می‌شود
+        # (نه برای هر INSERT): segment = (جدول جاری، زمان شروع، حجم صفحات در شروع)
+        segment = None
 
-        with SQLiteManager(self.db_path) as db:
+        with self.session or SQLiteManager(self.db_path) as db:
             db.conn.execute("PRAGMA synchronous = OFF")
             # تغییر journal_mode ممکن است در بعضی شرایط lock بدهد؛
             # در این حالت import را بدون تغییر journal_mode ادامه می‌دهیم.
@@ -82,23 +106,50 @@ class DumpImporter:
                         if not raw_name:
                             continue
                         target = remove_table_prefix(raw_name, prefix)
+                        if target == "options" and site_url is None:
+                            match = _SITEURL_RE.search(stmt)
+                            if match:
+                                site_url = match.group(1)
+                        if segment is not None and segment[0] != target:
+                            _close_segment(db, table_stats, segment)
+                            segment = None
                         if target not in wanted_normalized:
                             continue
+                        if segment is None:
+                            segment = (target, time.perf_counter(), db.used_bytes())
                         try:
                             converted = self.converter.convert(stmt, target).rstrip(";")
-                            db.conn.execute(converted)
+                            cursor = db.conn.execute(converted)
+                            table_stats.setdefault(target, [0, 0, 0.0])[0] += max(cursor.rowcount, 0)
                             inserts_count += 1
                         except Exception as e:
                             errors.append(f"INSERT {target}: {e}")
 
+                if segment is not None:
+                    _close_segment(db, table_stats, segment)
+                # حجم دقیق هر جدول با یک پرس‌وجوی dbstat؛ بدون dbstat همان تغییر صفحات مرز جدول‌ها
+                sizes = db.table_bytes(tables_created)
+                for target in tables_created:
+                    rows, size, seconds = table_stats.get(target, [0, 0, 0.0])
+                    if sizes is not None:
+                        size = sizes.get(target, 0)
+                    db.record_stats(target, rows, byte_size=size, build_seconds=seconds, kind="import")
+
             finally:
                 try:
                     db.conn.commit()
                 except Exception:
                     pass
+                # برگرداندن تنظیمات عادی برای مراحل بعدی روی همان اتصال
+                try:
+                    db.conn.execute("PRAGMA journal_mode = WAL")
+                    db.conn.execute("PRAGMA synchronous = NORMAL")
+                except sqlite3.OperationalError:
+                    pass
 
         return {
             "tables_created": len(tables_created),
             "inserts_count": inserts_count,
             "errors": errors,
+            "site_url": site_url,
         }
@@ -0,0 +1,173 @@
+"""
+تبدیل سریع تاریخ میلادی به شمسی برای توابع SQL (to_shamsi و unix_to_shamsi).
+
+- تبدیل روز با محاسبه حسابی روی شماره روز (همان الگوریتم jalali.c که jdatetime دارد) بدون ساختن شیء datetime
+- کش LRU بر اساس خود تاریخ (روز)؛ بخش ساعت جدا اضافه می‌شود، پس همه رکوردهای یک روز یک بار محاسبه می‌شوند
+- ورودی‌هایی که در قالب سریع نمی‌گنجند به همان مسیر قبلی (strptime + jdatetime) می‌روند تا خروجی عیناً یکسان بماند
+"""
+from bisect import bisect_right
+from datetime import date, datetime
+from functools import lru_cache
+
+import jdatetime
+
+
+# بازه سال میلادی مسیر سریع؛ بیرون از آن همان مسیر jdatetime استفاده می‌شود
+_MIN_FAST_YEAR = 1622
+_MAX_FAST_YEAR = 2999
+
+# مجموع روزهای ماه‌های قبل (میلادی غیرکبیسه و شمسی)
+_G_MONTH_START = (0, 31, 59, 90, 120, 151, 181, 212, 243, 273, 304, 334)
+_J_MONTH_START = (0, 31, 62, 93, 124, 155, 186, 216, 246, 276, 306, 336)
+
+_DAYS_IN_MONTH = (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+
+def _is_leap_gregorian(gy: int) -> bool:
+    return gy % 4 == 0 and (gy % 100 != 0 or gy % 400 == 0)
+
+
+def _gregorian_day_number(gy: int, gm: int, gd: int) -> int:
+    """تعداد روز از 1600-01-01 میلادی (همان شمارش jalali.c که jdatetime استفاده می‌کند)."""
+    y = gy - 1600
+    n = 365 * y + (y + 3) // 4 - (y + 99) // 100 + (y + 399) // 400 + _G_MONTH_START[gm - 1] + gd - 1
+    if gm > 2 and _is_leap_gregorian(gy):
+        n += 1
+    return n
+
+
+def _jalali_from_day_number(day_no: int) -> tuple[int, int, int]:
+    """شماره روز (از 1600-01-01) به (سال، ماه، روز) جلالی با چرخه ۳۳ ساله jalali.c."""
+    j_np, day_no = divmod(day_no - 79, 12053)
+    jy = 979 + 33 * j_np + 4 * (day_no // 1461)
+    day_no %= 1461
+    if day_no >= 366:
+        day_no -= 1
+        jy += day_no // 365
+        day_no %= 365
+    jm = bisect_right(_J_MONTH_START, day_no)
+    return jy, jm, day_no - _J_MONTH_START[jm - 1] + 1
+
+
+def gregorian_to_jalali(gy: int, gm: int, gd: int) -> tuple[int, int, int]:
+    """تبدیل حسابی تاریخ میلادی به (سال، ماه، روز) جلالی."""
+    return _jalali_from_day_number(_gregorian_day_number(gy, gm, gd))
+
+
+# ordinal پایتون (date.toordinal) برای 1600-01-01؛ شماره روز jalali.c = ordinal - این مقدار
+_ORDINAL_OFFSET = date(1600, 1, 1).toordinal()
+
+
+def jalali_from_ordinal(ordinal: int) -> tuple[int, int, int]:
+    """تبدیل ordinal تاریخ میلادی (date.toordinal) به (سال، ماه، روز) جلالی."""
+    return _jalali_from_day_number(ordinal - _ORDINAL_OFFSET)
+
+
+def _is_valid_gregorian(gy: int, gm: int, gd: int) -> bool:
+    if not (_MIN_FAST_YEAR <= gy <= _MAX_FAST_YEAR and 1 <= gm <= 12 and gd >= 1):
+        return False
+    if gm == 2 and _is_leap_gregorian(gy):
+        return gd <= 29
+    return gd <= _DAYS_IN_MONTH[gm - 1]
+
+
+# شماره روز 1970-01-01 و بازه روزهای مسیر سریع برای unix timestamp
+_EPOCH_DAY_NUMBER = _gregorian_day_number(1970, 1, 1)
+_MIN_FAST_DAY = _gregorian_day_number(_MIN_FAST_YEAR, 1, 1) - _EPOCH_DAY_NUMBER
+_MAX_FAST_DAY = _gregorian_day_number(_MAX_FAST_YEAR, 12, 31) - _EPOCH_DAY_NUMBER
+
+
+@lru_cache(maxsize=65536)
+def _shamsi_date_text(date_text: str) -> str | None:
+    """'YYYY-MM-DD' میلادی به 'YYYY/MM/DD' شمسی؛ None اگر در قالب/بازه مسیر سریع نباشد."""
+    if not (date_text[:4].isdigit() and date_text[5:7].isdigit() and date_text[8:10].isdigit()):
+        return None
+    gy, gm, gd = int(date_text[:4]), int(date_text[5:7]), int(date_text[8:10])
+    if not _is_valid_gregorian(gy, gm, gd):
+        return None
+    jy, jm, jd = gregorian_to_jalali(gy, gm, gd)
+    return f"{jy:04d}/{jm:02d}/{jd:02d}"
+
+
+@lru_cache(maxsize=65536)
+def _shamsi_day_text(days_since_epoch: int) -> str | None:
+    """روز n ام بعد از 1970-01-01 (UTC) به 'YYYY/MM/DD' شمسی."""
+    if not _MIN_FAST_DAY <= days_since_epoch <= _MAX_FAST_DAY:
+        return None
+    jy, jm, jd = _jalali_from_day_number(_EPOCH_DAY_NUMBER + days_since_epoch)
+    return f"{jy:04d}/{jm:02d}/{jd:02d}"
+
+
+def _legacy_to_shamsi(dt_text: str) -> str:
+    try:
+        dt = datetime.strptime(dt_text, "%Y-%m-%d %H:%M:%S")
+    except Exception:
+        return ""
+    jdt = jdatetime.datetime.fromgregorian(datetime=dt)
+    return jdt.strftime("%Y/%m/%d %H:%M:%S")
+
+
+def to_shamsi(dt_text: str | None) -> str:
+    """تبدیل datetime میلادی (YYYY-MM-DD HH:MM:SS) به تاریخ شمسی."""
+    if not dt_text:
+        return ""
+    if (
+        isinstance(dt_text, str)
+        and len(dt_text) == 19
+        and dt_text[4] == "-"
+        and dt_text[7] == "-"
+        and dt_text[10] == " "
+        and dt_text[13] == ":"
+        and dt_text[16] == ":"
+    ):
+        hh, mm, ss = dt_text[11:13], dt_text[14:16], dt_text[17:19]
+        if (
+            hh.isdigit()
+            and mm.isdigit()
+            and ss.isdigit()
+            and int(hh) < 24
+            and int(mm) < 60
+            and int(ss) < 60
+        ):
+            date_part = _shamsi_date_text(dt_text[:10])
+            if date_part is not None:
+                return f"{date_part} {dt_text[11:]}"
+    return _legacy_to_shamsi(dt_text)
+
+
+def _legacy_unix_to_shamsi(ts_int: int) -> str:
+    try:
+        dt = datetime.utcfromtimestamp(ts_int)
+    except Exception:
+        return ""
+    jdt = jdatetime.datetime.fromgregorian(datetime=dt)
+    return jdt.strftime("%Y/%m/%d %H:%M:%S")
+
+
+def unix_to_shamsi(ts_value) -> str:
+    """تبدیل unix timestamp (ثانیه) به تاریخ شمسی."""
+    if ts_value is None:
+        return ""
+    if type(ts_value) is int:
+        ts_int = ts_value
+    else:
+        try:
+            ts_int = int(str(ts_value).strip())
+        except Exception:
+            return ""
+    days, seconds = divmod(ts_int, 86400)
+    date_part = _shamsi_day_text(days)
+    if date_part is None:
+        return _legacy_unix_to_shamsi(ts_int)
+    hh, rest = divmod(seconds, 3600)
+    mm, ss = divmod(rest, 60)
+    return f"{date_part} {hh:02d}:{mm:02d}:{ss:02d}"
+
+
+def register_shamsi_functions(db) -> None:
+    """
+    ثبت to_shamsi و unix_to_shamsi روی اتصال به صورت deterministic
+    تا SQLite بتواند نتیجه را در یک کوئری دوباره استفاده کند و در ایندکس/ستون محاسباتی به کار ببرد.
+    """
+    db.create_function("to_shamsi", 1, to_shamsi, deterministic=True)
+    db.create_function("unix_to_shamsi", 1, unix_to_shamsi, deterministic=True)
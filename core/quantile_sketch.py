@@ -0,0 +1,199 @@
+"""
+Quantile تقریبی و ادغام‌پذیر (KLL sketch) برای باندهای rfm_constant روی داده خیلی بزرگ یا چند فروشگاه.
+
+- هر sketch حداکثر حدود 3k مقدار نگه می‌دارد؛ خطای رتبه نرمال‌شده حدود 1.65/k است
+  (k از RFM_SKETCH_EPSILON در config حساب می‌شود)
+- sketch هر بخش (chunk/فروشگاه) جدا ساخته و با merge ادغام می‌شود؛ نتیجه ادغام همان دقت را دارد
+- count، min، max و جمع مقادیر دقیق نگه داشته می‌شوند (باند اول از min و باند آخر تا max)
+- sketch هر فروشگاه در جدول rfm_sketches دیتابیس خروجی (converted.db) ذخیره می‌شود تا بعداً ادغام شود
+"""
+import json
+import math
+
+import numpy as np
+
+from core.db_manager import SQLiteManager
+
+
+RFM_SKETCHES_TABLE = "rfm_sketches"
+
+# خطای رتبه KLL با احتمال ۹۹٪ حدود 1.65/k است
+_KLL_ERROR_FACTOR = 1.65
+_KLL_MIN_K = 8
+# نسبت ظرفیت هر سطح به سطح بالاتر
+_KLL_CAPACITY_RATIO = 2 / 3
+
+# تعداد ردیف هر بخش هنگام ساخت sketch از جدول (هر بخش sketch جدا و سپس merge)
+_SKETCH_CHUNK = 200_000
+
+CREATE_RFM_SKETCHES_SQL = f"""
+CREATE TABLE "{RFM_SKETCHES_TABLE}" (
+    metric TEXT PRIMARY KEY,
+    k INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    payload TEXT NOT NULL
+)
+"""
+
+
+def k_for_epsilon(epsilon: float) -> int:
+    """پارامتر k برای خطای رتبه نرمال‌شده epsilon (مثلاً 0.01 = یک درصد)."""
+    return max(_KLL_MIN_K, math.ceil(_KLL_ERROR_FACTOR / max(float(epsilon), 1e-6)))
+
+
+class KLLSketch:
+    """
+    KLL sketch برای مقادیر float.
+    سطح h از compactors مقادیری با وزن 2**h است؛ با پر شدن یک سطح، مقادیر مرتب و یکی در میان
+    (با آفست تصادفی) به سطح بالاتر می‌روند. مجموع وزن‌ها همیشه برابر count است.
+    """
+
+    def __init__(self, k: int = 200, seed: int = 0):
+        self.k = max(_KLL_MIN_K, int(k))
+        self.count = 0
+        self.min = None
+        self.max = None
+        self.total = 0.0
+        self.compactors: list[np.ndarray] = [np.empty(0, dtype=np.float64)]
+        self._rng = np.random.default_rng(seed)
+
+    @property
+    def epsilon(self) -> float:
+        """خطای رتبه نرمال‌شده تقریبی این sketch."""
+        return _KLL_ERROR_FACTOR / self.k
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.compactors) - level - 1
+        return max(2, math.ceil(self.k * _KLL_CAPACITY_RATIO**depth))
+
+    def _size(self) -> int:
+        return sum(len(c) for c in self.compactors)
+
+    def _compress(self) -> None:
+        while self._size() > sum(self._capacity(h) for h in range(len(self.compactors))):
+            for level, items in enumerate(self.compactors):
+                if len(items) >= self._capacity(level):
+                    break
+            if level + 1 == len(self.compactors):
+                self.compactors.append(np.empty(0, dtype=np.float64))
+            items = np.sort(self.compactors[level])
+            # تعداد فرد: یک مقدار در همین سطح می‌ماند تا مجموع وزن حفظ شود
+            keep = items[-1:] if len(items) % 2 else items[:0]
+            pairs = items[: len(items) - len(keep)]
+            promoted = pairs[int(self._rng.integers(2)) :: 2]
+            self.compactors[level] = keep
+            self.compactors[level + 1] = np.concatenate([self.compactors[level + 1], promoted])
+
+    def update(self, values: np.ndarray) -> None:
+        """افزودن آرایه‌ای از مقادیر (بدون NaN)."""
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            return
+        self.count += len(values)
+        self.total += float(np.cumsum(values)[-1])
+        low, high = float(values.min()), float(values.max())
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+        self.compactors[0] = np.concatenate([self.compactors[0], values])
+        self._compress()
+
+    def merge(self, other: "KLLSketch") -> None:
+        """ادغام sketch دیگر (مثلاً فروشگاه یا بخش دیگر) در همین sketch."""
+        if other.count == 0:
+            return
+        self.k = min(self.k, other.k)
+        self.count += other.count
+        self.total += other.total
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        while len(self.compactors) < len(other.compactors):
+            self.compactors.append(np.empty(0, dtype=np.float64))
+        for level, items in enumerate(other.compactors):
+            self.compactors[level] = np.concatenate([self.compactors[level], items])
+        self._compress()
+
+    def _weighted_items(self) -> tuple[np.ndarray, np.ndarray]:
+        """مقادیر مرتب و وزن تجمعی آن‌ها."""
+        values = np.concatenate(self.compactors)
+        weights = np.concatenate([np.full(len(c), 2**h, dtype=np.int64) for h, c in enumerate(self.compactors)])
+        order = np.argsort(values, kind="stable")
+        return values[order], np.cumsum(weights[order])
+
+    def values_at_ranks(self, ranks: list[int]) -> list[float]:
+        """
+        مقدار تقریبی در رتبه‌های صفرمبنا (مثل اندیس در آرایه مرتب همه مقادیر).
+        رتبه 0 و count-1 همان min و max دقیق هستند.
+        """
+        if self.count == 0:
+            return []
+        values, cum_weights = self._weighted_items()
+        result = []
+        for rank in ranks:
+            if rank <= 0:
+                result.append(self.min)
+            elif rank >= self.count - 1:
+                result.append(self.max)
+            else:
+                pos = int(np.searchsorted(cum_weights, rank, side="right"))
+                result.append(float(values[min(pos, len(values) - 1)]))
+        return result
+
+    def to_dict(self) -> dict:
+        return {
+            "k": self.k,
+            "count": self.count,
+            "min": self.min,
+            "max": self.max,
+            "total": self.total,
+            "compactors": [c.tolist() for c in self.compactors],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "KLLSketch":
+        sketch = cls(data["k"])
+        sketch.count = int(data["count"])
+        sketch.min = data["min"]
+        sketch.max = data["max"]
+        sketch.total = float(data["total"])
+        sketch.compactors = [np.array(c, dtype=np.float64) for c in data["compactors"]] or [np.empty(0)]
+        return sketch
+
+
+def build_metric_sketches(db: SQLiteManager, table: str, metrics: list[str], k: int) -> dict[str, KLLSketch]:
+    """
+    sketch هر معیار (CAST AS REAL، بدون NULL) از جدول: هر بخش _SKETCH_CHUNK ردیفی
+    sketch جدا دارد و بخش‌ها ادغام می‌شوند؛ حافظه مستقل از تعداد ردیف‌ها است.
+    """
+    sketches = {metric: KLLSketch(k) for metric in metrics}
+    cols = ", ".join(f'CAST("{m}" AS REAL)' for m in metrics)
+    cursor = db.execute(f'SELECT {cols} FROM "{table}"')
+    seed = 0
+    while True:
+        rows = cursor.fetchmany(_SKETCH_CHUNK)
+        if not rows:
+            break
+        seed += 1
+        for metric, values in zip(metrics, zip(*rows)):
+            arr = np.array(values, dtype=np.float64)
+            part = KLLSketch(k, seed=seed)
+            part.update(arr[~np.isnan(arr)])
+            sketches[metric].merge(part)
+    return sketches
+
+
+def save_metric_sketches(db: SQLiteManager, sketches: dict[str, KLLSketch]) -> None:
+    """ذخیره sketch هر معیار در جدول rfm_sketches (جایگزین قبلی)."""
+    db.execute(f'DROP TABLE IF EXISTS "{RFM_SKETCHES_TABLE}"')
+    db.execute(CREATE_RFM_SKETCHES_SQL)
+    db.conn.executemany(
+        f'INSERT INTO "{RFM_SKETCHES_TABLE}" (metric, k, count, payload) VALUES (?, ?, ?, ?)',
+        ((metric, s.k, s.count, json.dumps(s.to_dict())) for metric, s in sketches.items()),
+    )
+
+
+def load_metric_sketches(db: SQLiteManager) -> dict[str, KLLSketch]:
+    """sketchهای ذخیره‌شده در rfm_sketches؛ اگر جدول نباشد {}."""
+    if not db._table_exists(RFM_SKETCHES_TABLE):
+        return {}
+    rows = db.execute(f'SELECT metric, payload FROM "{RFM_SKETCHES_TABLE}"').fetchall()
+    return {metric: KLLSketch.from_dict(json.loads(payload)) for metric, payload in rows}
@@ -1,112 +1,182 @@
 """
-ساخت نمودارهای RFM از روی rfm_scores.xlsx و rfm_constant.xlsx.
+ساخت نمودارهای RFM از DataFrame امتیازها (ساخته‌شده در همان اجرا)، جدول rfm_scores در converted.db
+یا در نبود آن‌ها فایل rfm_scores.xlsx (یا 1_rfm_scores.xlsx, ...) و rfm_constant.xlsx.
+ستون‌ها با نوع فشرده نگه داشته می‌شوند (segment دسته‌ای، امتیازها int8، مبالغ float32).
 خروجی در پوشه charts داخل پوشه خروجی.
 """
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 import matplotlib
 matplotlib.use("Agg")
 import matplotlib.pyplot as plt
 import squarify
-from openpyxl import load_workbook
+from pandas.api.types import union_categoricals
 
+from core.db_manager import DBSession
+from core.rfm_numpy import (
+    RFM_SCORE_COLUMNS,
+    SegmentLookup,
+    assign_segments,
+    compile_thresholds,
+    load_segment_rules,
+    load_thresholds,
+    score_values,
+    to_float,
+)
+from core.rfm_scores import RFM_SCORES_TABLE
+from utils.helpers import find_chunk_files
 
-def _to_int(value):
-    if value is None:
-        return None
-    try:
-        return int(float(str(value).strip()))
-    except (ValueError, TypeError):
-        return None
+
+def _metric_column(series: pd.Series) -> np.ndarray:
+    """ستون معیار به آرایه float (مقدار خالی/نامعتبر => NaN) با همان تبدیل to_float."""
+    if pd.api.types.is_numeric_dtype(series):
+        return series.to_numpy(dtype=np.float64, na_value=np.nan)
+    return np.array([np.nan if v is None else v for v in map(to_float, series.where(series.notna(), None))])
+
+
+def _assign_scores(df: pd.DataFrame, thresholds: dict[str, list[tuple[float, float, int]]]) -> pd.DataFrame:
+    """ستون‌های r_score/f_score/m_score را با آستانه‌های کامپایل‌شده (searchsorted) به df اضافه می‌کند."""
+    df = df.copy()
+    for metric, score_column in RFM_SCORE_COLUMNS.items():
+        df[score_column] = score_values(_metric_column(df[metric]), compile_thresholds(thresholds[metric]))
+    return df
+
+
+def _assign_segment(df: pd.DataFrame, rules: SegmentLookup) -> pd.DataFrame:
+    """ستون segment را با اندیس‌گذاری در جدول lookup قواعد (اولین قاعده منطبق) به df اضافه می‌کند."""
+    scores = df[["r_score", "f_score", "m_score"]]
+    missing = scores.isna().any(axis=1).to_numpy()
+    r, f, m = (scores[c].fillna(-1).to_numpy(dtype=np.int64) for c in ("r_score", "f_score", "m_score"))
+    segments = assign_segments(r, f, m, rules)
+    segments[missing] = "Unclassified"
+    df = df.copy()
+    df["segment"] = segments
+    return df
+
+
+# ستون‌هایی از rfm_scores که نمودارها لازم دارند
+CHART_COLUMNS = ("r_score", "f_score", "m_score", "segment", "recency_days", "total_orders", "total_spent")
+
+# نوع فشرده هر ستون عددی نمودار: integer با downcast به کوچک‌ترین نوع صحیح (ستونی که مقدار خالی دارد float32)
+_COMPACT_KINDS = {
+    "r_score": "integer",
+    "f_score": "integer",
+    "m_score": "integer",
+    "recency_days": "integer",
+    "total_orders": "integer",
+    "total_spent": "float",
+}
+
+# تعداد ردیف هر دسته هنگام خواندن rfm_scores از دیتابیس
+_FRAME_CHUNK = 200_000
 
 
-def _load_segment_rules(constant_path: Path) -> list[tuple[str, int, int, int, int, int, int]]:
+def compact_scores_frame(df: pd.DataFrame) -> pd.DataFrame:
     """
-    خواندن شیت segment_rules از rfm_constant.xlsx.
-    برمی‌گرداند: [(segment, r_min, r_max, f_min, f_max, m_min, m_max), ...]
+    فقط ستون‌های CHART_COLUMNS موجود در df با نوع فشرده: segment دسته‌ای (category)، امتیازها int8،
+    روزها/تعداد سفارش کوچک‌ترین نوع صحیح و مبالغ float32. مقدار نامعتبر عددی => NaN.
     """
-    wb = load_workbook(constant_path, read_only=True, data_only=True)
-    if "segment_rules" not in wb.sheetnames:
-        wb.close()
-        return []
-    ws = wb["segment_rules"]
-    header = next(ws.iter_rows(min_row=1, max_row=1, values_only=True), None)
-    if not header:
-        wb.close()
-        return []
-    headers = [str(c).strip() if c is not None else "" for c in header]
-    idx = {h: i for i, h in enumerate(headers)}
-    required = ["segment", "r_min", "r_max", "f_min", "f_max", "m_min", "m_max"]
-    if not all(k in idx for k in required):
-        wb.close()
-        return []
-    rules = []
-    for row in ws.iter_rows(min_row=2, values_only=True):
-        seg = row[idx["segment"]] if idx["segment"] < len(row) else None
-        if seg is None:
+    compact = pd.DataFrame(index=df.index)
+    for column in CHART_COLUMNS:
+        if column not in df.columns:
             continue
-        seg = str(seg).strip()
-        r_min = _to_int(row[idx["r_min"]] if idx["r_min"] < len(row) else None)
-        r_max = _to_int(row[idx["r_max"]] if idx["r_max"] < len(row) else None)
-        f_min = _to_int(row[idx["f_min"]] if idx["f_min"] < len(row) else None)
-        f_max = _to_int(row[idx["f_max"]] if idx["f_max"] < len(row) else None)
-        m_min = _to_int(row[idx["m_min"]] if idx["m_min"] < len(row) else None)
-        m_max = _to_int(row[idx["m_max"]] if idx["m_max"] < len(row) else None)
-        if None in (r_min, r_max, f_min, f_max, m_min, m_max):
+        if column == "segment":
+            compact[column] = df[column].astype("category")
             continue
-        rules.append((seg, r_min, r_max, f_min, f_max, m_min, m_max))
-    wb.close()
-    return rules
-
-
-def _assign_segment(df: pd.DataFrame, rules: list) -> pd.DataFrame:
-    """ستون segment را بر اساس قواعد به df اضافه می‌کند."""
-    def find_segment(row):
-        r, f, m = row.get("r_score"), row.get("f_score"), row.get("m_score")
-        if pd.isna(r) or pd.isna(f) or pd.isna(m):
-            return "Unclassified"
-        ri, fi, mi = int(r), int(f), int(m)
-        for seg, r_min, r_max, f_min, f_max, m_min, m_max in rules:
-            if r_min <= ri <= r_max and f_min <= fi <= f_max and m_min <= mi <= m_max:
-                return seg
-        return "Unclassified"
+        values = pd.to_numeric(df[column], errors="coerce")
+        if _COMPACT_KINDS[column] == "integer" and not values.isna().any():
+            compact[column] = pd.to_numeric(values, downcast="integer")
+        else:
+            compact[column] = values.astype(np.float32)
+    return compact
 
-    df = df.copy()
-    df["segment"] = df.apply(find_segment, axis=1)
+
+def concat_scores_frames(frames: list[pd.DataFrame]) -> pd.DataFrame:
+    """الحاق دسته‌های فشرده؛ segment دسته‌ای می‌ماند (union_categoricals به‌جای تبدیل به object)."""
+    if not frames:
+        return compact_scores_frame(pd.DataFrame(columns=list(CHART_COLUMNS)))
+    df = pd.concat([f.drop(columns="segment") for f in frames], ignore_index=True)
+    df["segment"] = union_categoricals([f["segment"] for f in frames])
     return df
 
 
-def build_rfm_charts(folder: Path) -> tuple[bool, str, list[str]]:
+def read_scores_frame(db) -> pd.DataFrame:
+    """ستون‌های نمودار جدول rfm_scores دیتابیس، دسته به دسته خوانده و فشرده‌شده (بدون فایل Excel)."""
+    columns = ", ".join(f'"{c}"' for c in CHART_COLUMNS)
+    frames = [
+        compact_scores_frame(chunk)
+        for chunk in pd.read_sql_query(
+            f'SELECT {columns} FROM "{RFM_SCORES_TABLE}" ORDER BY rowid', db.conn, chunksize=_FRAME_CHUNK
+        )
+    ]
+    return concat_scores_frames(frames)
+
+
+def _scores_from_db(folder: Path) -> pd.DataFrame | None:
+    """DataFrame فشرده rfm_scores از converted.db پوشه خروجی؛ اگر دیتابیس یا جدول نباشد None."""
+    db_file = folder / "converted.db"
+    if not db_file.is_file():
+        return None
+    try:
+        with DBSession(db_file) as db:
+            if not set(CHART_COLUMNS).issubset(db._table_columns(RFM_SCORES_TABLE)):
+                return None
+            return read_scores_frame(db)
+    except Exception:
+        return None
+
+
+def build_rfm_charts(folder: Path, scores: pd.DataFrame | None = None) -> tuple[bool, str, list[str]]:
     """
     ساخت پوشه charts و ۷ نمودار.
+    منبع امتیازها به ترتیب: scores (DataFrame همین اجرا)، جدول rfm_scores در converted.db پوشه،
+    و در آخر خواندن فایل‌های rfm_scores؛ rfm_constant.xlsx فقط وقتی خوانده می‌شود که امتیاز یا سگمنت نباشد.
     برمی‌گرداند: (success, message, list of chart filenames).
     """
     folder = Path(folder)
-    scores_file = folder / "rfm_scores.xlsx"
     constant_file = folder / "rfm_constant.xlsx"
-    if not scores_file.is_file():
-        return False, "فایل rfm_scores.xlsx یافت نشد.", []
-    if not constant_file.is_file():
-        return False, "فایل rfm_constant.xlsx یافت نشد.", []
-
-    try:
-        df = pd.read_excel(scores_file, sheet_name=0)
-    except Exception as e:
-        return False, f"خطا در خواندن rfm_scores.xlsx: {e!s}", []
+    if scores is not None:
+        df = compact_scores_frame(scores)
+    else:
+        df = _scores_from_db(folder)
+    if df is None:
+        scores_files = find_chunk_files(folder, "rfm_scores")
+        if not scores_files:
+            return False, "فایل rfm_scores.xlsx یافت نشد.", []
+        try:
+            df = pd.concat(
+                [pd.read_excel(f, sheet_name=0, usecols=lambda c: c in CHART_COLUMNS) for f in scores_files],
+                ignore_index=True,
+            )
+        except Exception as e:
+            return False, f"خطا در خواندن rfm_scores.xlsx: {e!s}", []
 
-    required = {"r_score", "f_score", "m_score", "total_orders", "total_spent", "recency_days"}
+    required = {"total_orders", "total_spent", "recency_days"}
     missing = required - set(df.columns)
     if missing:
         return False, f"ستون‌های لازم در rfm_scores ناقص: {missing}", []
 
-    rules = _load_segment_rules(constant_file)
-    if not rules:
-        return False, "قواعد سگمنت در rfm_constant.xlsx یافت نشد.", []
+    # بدون ستون‌های امتیاز (مثلاً خروجی خام rfm_data) امتیازها از آستانه‌های rfm_constant حساب می‌شوند
+    if not set(RFM_SCORE_COLUMNS.values()).issubset(df.columns):
+        if not constant_file.is_file():
+            return False, "فایل rfm_constant.xlsx یافت نشد.", []
+        thresholds, err = load_thresholds(constant_file)
+        if err:
+            return False, err, []
+        df = _assign_scores(df, thresholds)
 
     if "segment" not in df.columns:
+        if not constant_file.is_file():
+            return False, "فایل rfm_constant.xlsx یافت نشد.", []
+        rules = load_segment_rules(constant_file)
+        if not rules.rules:
+            return False, "قواعد سگمنت در rfm_constant.xlsx یافت نشد.", []
         df = _assign_segment(df, rules)
 
+    df = compact_scores_frame(df)
+
     SEGMENT_COLORS = {
         "Champions": "#2ecc71",
         "Loyal": "#27ae60",
@@ -186,7 +256,7 @@ def build_rfm_charts(folder: Path) -> tuple[bool, str, list[str]]:
         generated.append("charts/frequency_vs_monetary_scatter.png")
 
         # 4) Revenue contribution by segment
-        rev = df.groupby("segment")["total_spent"].sum().sort_values(ascending=False)
+        rev = df.groupby("segment", observed=True)["total_spent"].sum().sort_values(ascending=False)
         bar_colors_4 = [SEGMENT_COLORS.get(s, "#999999") for s in rev.index]
         fig, ax = plt.subplots(figsize=(10, 5))
         rev.plot(kind="bar", ax=ax, color=bar_colors_4, edgecolor="white")
@@ -220,9 +290,9 @@ def build_rfm_charts(folder: Path) -> tuple[bool, str, list[str]]:
         generated.append("charts/at_risk_recency_distribution.png")
 
         # 6) CLV vs RFM Score
-        df["rfm_total"] = df["r_score"] + df["f_score"] + df["m_score"]
+        df["rfm_total"] = df[["r_score", "f_score", "m_score"]].sum(axis=1)
         fig, ax = plt.subplots(figsize=(10, 6))
-        seg_groups = df.groupby("segment")
+        seg_groups = df.groupby("segment", observed=True)
         for seg_name, grp in seg_groups:
             ax.scatter(
                 grp["rfm_total"],
@@ -243,7 +313,7 @@ def build_rfm_charts(folder: Path) -> tuple[bool, str, list[str]]:
         generated.append("charts/clv_vs_rfm_score.png")
 
         # 7) Treemap – segment share (size = customer count, label includes revenue %)
-        seg_summary = df.groupby("segment").agg(
+        seg_summary = df.groupby("segment", observed=True).agg(
             count=("segment", "size"),
             revenue=("total_spent", "sum"),
         )
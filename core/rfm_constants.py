@@ -7,11 +7,27 @@
 from pathlib import Path
 
 import jdatetime
+import numpy as np
 from openpyxl import Workbook
 
-from config import RFM_QUANTILE_BANDS
-from core.db_manager import SQLiteManager
+from config import (
+    RFM_COMBINED_SKETCH_REPORT,
+    RFM_QUANTILE_BANDS,
+    RFM_QUANTILE_MODE,
+    RFM_SKETCH_EPSILON,
+    RFM_SKETCH_REPORT,
+)
+from core.db_manager import DBSession, SQLiteManager
+from core.quantile_sketch import (
+    KLLSketch,
+    build_metric_sketches,
+    k_for_epsilon,
+    load_metric_sketches,
+    save_metric_sketches,
+)
 from core.rfm_data import RFM_DATA_TABLE
+from core.rfm_numpy import load_metric_arrays, metric_stats, ntile_bands, ntile_positions
+from core.rfm_scores import save_rfm_thresholds, save_segment_rules
 
 
 def _metric_labels(metric: str, score: int, max_score: int) -> str:
@@ -55,60 +71,139 @@ def _metric_fa_name(metric: str) -> str:
     }.get(metric, metric)
 
 
-def _fetch_metric_bands(
+def _fetch_all_metric_bands(
     db: SQLiteManager,
-    metric: str,
+    metrics: list[str],
     quantile_bands: int,
-) -> list[tuple[int, float, float, int]]:
+) -> dict[str, tuple[list[tuple[int, float, float, int]], tuple[int, float | None, float | None, float | None]]]:
     """
-    تقسیم داده‌های هر معیار به باندهای Quantile با NTILE.
-    خروجی: [(bucket, min_val, max_val, cnt), ...]
+    باندهای Quantile و آمار (count, min, max, avg) همه معیارها با یک بار خواندن rfm_data.
+    مرزهای باند در حافظه (np.partition) پیدا می‌شوند؛ خروجی همان NTILE و آمار SQL است (benchmarks.sql_reference).
+    خروجی: {metric: ([(bucket, min_val, max_val, cnt), ...], (cnt, min, max, avg))}
     """
-    sql = f"""
-WITH ranked AS (
-    SELECT
-        CAST("{metric}" AS REAL) AS val,
-        NTILE({quantile_bands}) OVER (ORDER BY CAST("{metric}" AS REAL) ASC) AS bucket
-    FROM "{RFM_DATA_TABLE}"
-    WHERE "{metric}" IS NOT NULL
-)
-SELECT
-    bucket,
-    MIN(val) AS min_val,
-    MAX(val) AS max_val,
-    COUNT(*) AS cnt
-FROM ranked
-GROUP BY bucket
-ORDER BY bucket;
-"""
-    rows = db.execute(sql).fetchall()
-    return [(int(r[0]), float(r[1]), float(r[2]), int(r[3])) for r in rows]
-
-
-def _fetch_metric_stats(db: SQLiteManager, metric: str) -> tuple[int, float | None, float | None, float | None]:
-    sql = f"""
-SELECT
-    COUNT("{metric}") AS cnt,
-    MIN(CAST("{metric}" AS REAL)) AS min_v,
-    MAX(CAST("{metric}" AS REAL)) AS max_v,
-    AVG(CAST("{metric}" AS REAL)) AS avg_v
-FROM "{RFM_DATA_TABLE}";
-"""
-    cnt, min_v, max_v, avg_v = db.execute(sql).fetchone()
-    return int(cnt or 0), min_v, max_v, avg_v
+    arrays = load_metric_arrays(db, RFM_DATA_TABLE, metrics)
+    return {metric: (ntile_bands(arrays[metric], quantile_bands), metric_stats(arrays[metric])) for metric in metrics}
 
 
-def create_rfm_constant_excel(db: SQLiteManager, output_folder: str | Path) -> Path:
+def _sketch_metric_bands(
+    sketches: dict[str, KLLSketch],
+    metrics: list[str],
+    quantile_bands: int,
+) -> dict[str, tuple[list[tuple[int, float, float, int]], tuple[int, float | None, float | None, float | None]]]:
     """
-    ساخت فایل rfm_constant.xlsx کنار خروجی rfm_data.
+    باندهای تقریبی از sketch هر معیار: مرز هر باند مقدار sketch در رتبه‌های همان باند NTILE
+    (تعداد هر باند دقیق است). خروجی هم‌شکل _fetch_all_metric_bands.
     """
-    output_folder = Path(output_folder)
-    output_folder.mkdir(parents=True, exist_ok=True)
-    output_path = output_folder / "rfm_constant.xlsx"
-    quantile_bands = max(2, int(RFM_QUANTILE_BANDS))
+    summary = {}
+    for metric in metrics:
+        sketch = sketches.get(metric)
+        if sketch is None or sketch.count == 0:
+            summary[metric] = ([], (0, None, None, None))
+            continue
+        positions = ntile_positions(sketch.count, quantile_bands)
+        values = sketch.values_at_ranks([rank for _, lo, hi, _ in positions for rank in (lo, hi)])
+        bands = [
+            (bucket, values[2 * i], values[2 * i + 1], cnt)
+            for i, (bucket, _lo, _hi, cnt) in enumerate(positions)
+        ]
+        summary[metric] = (bands, (sketch.count, sketch.min, sketch.max, sketch.total / sketch.count))
+    return summary
+
 
-    total_rows = db.execute(f'SELECT COUNT(*) FROM "{RFM_DATA_TABLE}"').fetchone()[0]
+def _rank_error(sorted_values: np.ndarray, value: float, rank: int) -> float:
+    """فاصله رتبه value در داده دقیق تا رتبه هدف، نسبت به تعداد کل (0 یعنی مرز دقیق)."""
+    first = int(np.searchsorted(sorted_values, value, side="left"))
+    last = int(np.searchsorted(sorted_values, value, side="right")) - 1
+    if first <= rank <= last:
+        return 0.0
+    return min(abs(first - rank), abs(last - rank)) / len(sorted_values)
 
+
+def _sketch_report_rows(
+    metric_summary: dict,
+    exact_arrays: dict[str, np.ndarray],
+    quantile_bands: int,
+) -> list[list]:
+    """
+    ردیف‌های شیت sketch_report: مرز تقریبی و دقیق هر باند و خطای رتبه مرز تقریبی.
+    """
+    rows = []
+    for metric, (bands, _stats) in metric_summary.items():
+        values = np.sort(exact_arrays[metric])
+        if len(values) == 0:
+            continue
+        exact = {bucket: (lo, hi) for bucket, lo, hi, _cnt in ntile_bands(values, quantile_bands)}
+        positions = {bucket: (lo, hi) for bucket, lo, hi, _cnt in ntile_positions(len(values), quantile_bands)}
+        for bucket, min_val, max_val, _cnt in bands:
+            exact_min, exact_max = exact.get(bucket, (None, None))
+            first_rank, last_rank = positions.get(bucket, (0, len(values) - 1))
+            rows.append(
+                [
+                    metric,
+                    bucket,
+                    min_val,
+                    exact_min,
+                    round(_rank_error(values, min_val, first_rank), 6),
+                    max_val,
+                    exact_max,
+                    round(_rank_error(values, max_val, last_rank), 6),
+                ]
+            )
+    return rows
+
+
+def _default_segment_rules(quantile_bands: int) -> list[tuple[str, int, int, int, int, int, int, str]]:
+    """قواعد سگمنت پیشنهادی: [(segment, r_min, r_max, f_min, f_max, m_min, m_max, description), ...]"""
+    if quantile_bands == 5:
+        return [
+            ("Champions", 4, 5, 4, 5, 4, 5, "خریداران بسیار ارزشمند و فعال"),
+            ("Loyal Customers", 3, 5, 4, 5, 3, 5, "مشتریان وفادار با خرید مستمر"),
+            ("Potential Loyalist", 4, 5, 2, 3, 2, 5, "جدید/روبه‌رشد، مناسب پرورش وفاداری"),
+            ("At Risk", 1, 2, 3, 5, 3, 5, "قبلاً خوب بوده‌اند اما اخیراً افت کرده‌اند"),
+            ("Hibernating", 1, 2, 1, 2, 1, 2, "غیرفعال یا کم‌ارزش، نیازمند کمپین فعال‌سازی"),
+        ]
+    high_min = max(quantile_bands - 1, 1)
+    mid_min = max(quantile_bands // 2, 1)
+    low_max = min(2, quantile_bands)
+    return [
+        (
+            "Top Value",
+            high_min,
+            quantile_bands,
+            high_min,
+            quantile_bands,
+            high_min,
+            quantile_bands,
+            "تعریف عمومی برای باندهای بالایی (غیر ۵-تایی).",
+        ),
+        (
+            "Mid Value",
+            mid_min,
+            quantile_bands,
+            mid_min,
+            quantile_bands,
+            mid_min,
+            quantile_bands,
+            "تعریف عمومی برای کاربران میانی.",
+        ),
+        ("Low Value", 1, low_max, 1, low_max, 1, low_max, "تعریف عمومی برای کاربران کم‌ارزش."),
+    ]
+
+
+RFM_METRICS = ["recency_days", "total_orders", "total_spent"]
+
+
+def _write_rfm_constant_workbook(
+    output_path: Path,
+    metric_summary: dict,
+    quantile_bands: int,
+    meta_rows: list[list],
+    report_rows: list[list] | None = None,
+) -> tuple[dict[str, list[tuple[float, float, int]]], list[tuple]]:
+    """
+    نوشتن rfm_constant.xlsx از باندها و آمار هر معیار (خروجی _fetch_all_metric_bands یا _sketch_metric_bands).
+    برمی‌گرداند: (آستانه‌ها {metric: [(min, max, score), ...]}، قواعد سگمنت پیش‌فرض)
+    """
     wb = Workbook()
 
     # Sheet 1: راهنما/متادیتا
@@ -116,12 +211,8 @@ def create_rfm_constant_excel(db: SQLiteManager, output_folder: str | Path) -> P
     ws_meta.title = "meta"
     ws_meta.sheet_view.rightToLeft = True
     ws_meta.append(["کلید", "مقدار"])
-    ws_meta.append(["table_name", RFM_DATA_TABLE])
-    ws_meta.append(["generated_at_shamsi", jdatetime.datetime.now().strftime("%Y/%m/%d %H:%M:%S")])
-    ws_meta.append(["total_rows", total_rows])
-    ws_meta.append(["quantile_bands", quantile_bands])
-    ws_meta.append(["note", f"باندها با NTILE({quantile_bands}) از داده‌های فعلی ساخته شده‌اند."])
-    ws_meta.append(["note2", "در recency هرچه مقدار کمتر باشد، امتیاز بالاتر است."])
+    for row in meta_rows:
+        ws_meta.append(row)
 
     # Sheet 2: آستانه‌ها (machine-readable)
     ws_thr = wb.create_sheet("thresholds")
@@ -144,9 +235,9 @@ def create_rfm_constant_excel(db: SQLiteManager, output_folder: str | Path) -> P
         ]
     )
 
-    metrics = ["recency_days", "total_orders", "total_spent"]
-    for metric in metrics:
-        bands = _fetch_metric_bands(db, metric, quantile_bands)
+    thresholds: dict[str, list[tuple[float, float, int]]] = {}
+    for metric in RFM_METRICS:
+        bands = metric_summary[metric][0]
         for bucket, min_val, max_val, cnt in bands:
             # recency: bucket پایین‌تر => score بالاتر
             if metric == "recency_days":
@@ -155,6 +246,7 @@ def create_rfm_constant_excel(db: SQLiteManager, output_folder: str | Path) -> P
             else:
                 score = bucket
                 scoring_direction = "higher_is_better"
+            thresholds.setdefault(metric, []).append((min_val, max_val, score))
             label = _metric_labels(metric, score, quantile_bands)
             q_label = f"Q{bucket}"
             percentile_from = round(((bucket - 1) / quantile_bands) * 100, 2)
@@ -182,64 +274,145 @@ def create_rfm_constant_excel(db: SQLiteManager, output_folder: str | Path) -> P
     ws_stats = wb.create_sheet("metric_stats")
     ws_stats.sheet_view.rightToLeft = True
     ws_stats.append(["metric", "metric_fa", "count", "min", "max", "avg"])
-    for metric in metrics:
-        cnt, min_v, max_v, avg_v = _fetch_metric_stats(db, metric)
+    for metric in RFM_METRICS:
+        cnt, min_v, max_v, avg_v = metric_summary[metric][1]
         ws_stats.append([metric, _metric_fa_name(metric), cnt, min_v, max_v, avg_v])
 
     # Sheet 4: لیبل/سگمنت پیشنهادی بر اساس score ranges
     ws_seg = wb.create_sheet("segment_rules")
     ws_seg.sheet_view.rightToLeft = True
     ws_seg.append(["segment", "r_min", "r_max", "f_min", "f_max", "m_min", "m_max", "description"])
-    if quantile_bands == 5:
-        ws_seg.append(["Champions", 4, 5, 4, 5, 4, 5, "خریداران بسیار ارزشمند و فعال"])
-        ws_seg.append(["Loyal Customers", 3, 5, 4, 5, 3, 5, "مشتریان وفادار با خرید مستمر"])
-        ws_seg.append(["Potential Loyalist", 4, 5, 2, 3, 2, 5, "جدید/روبه‌رشد، مناسب پرورش وفاداری"])
-        ws_seg.append(["At Risk", 1, 2, 3, 5, 3, 5, "قبلاً خوب بوده‌اند اما اخیراً افت کرده‌اند"])
-        ws_seg.append(["Hibernating", 1, 2, 1, 2, 1, 2, "غیرفعال یا کم‌ارزش، نیازمند کمپین فعال‌سازی"])
-    else:
-        high_min = max(quantile_bands - 1, 1)
-        mid_min = max(quantile_bands // 2, 1)
-        low_max = min(2, quantile_bands)
-        ws_seg.append(
-            [
-                "Top Value",
-                high_min,
-                quantile_bands,
-                high_min,
-                quantile_bands,
-                high_min,
-                quantile_bands,
-                "تعریف عمومی برای باندهای بالایی (غیر ۵-تایی).",
-            ]
-        )
-        ws_seg.append(
-            [
-                "Mid Value",
-                mid_min,
-                quantile_bands,
-                mid_min,
-                quantile_bands,
-                mid_min,
-                quantile_bands,
-                "تعریف عمومی برای کاربران میانی.",
-            ]
-        )
-        ws_seg.append(
+    segment_rules = _default_segment_rules(quantile_bands)
+    for rule in segment_rules:
+        ws_seg.append(list(rule))
+
+    # Sheet 5 (فقط حالت sketch): اختلاف باندهای تقریبی با NTILE دقیق
+    if report_rows is not None:
+        ws_rep = wb.create_sheet("sketch_report")
+        ws_rep.sheet_view.rightToLeft = True
+        ws_rep.append(
             [
-                "Low Value",
-                1,
-                low_max,
-                1,
-                low_max,
-                1,
-                low_max,
-                "تعریف عمومی برای کاربران کم‌ارزش.",
+                "metric",
+                "bucket",
+                "min_value",
+                "exact_min_value",
+                "min_rank_error",
+                "max_value",
+                "exact_max_value",
+                "max_rank_error",
             ]
         )
+        for row in report_rows:
+            ws_rep.append(row)
+        worst = max((max(row[4], row[7]) for row in report_rows), default=0.0)
+        ws_meta.append(["sketch_max_rank_error", worst])
+
+    wb.save(str(output_path))
+    return thresholds, segment_rules
+
+
+def _sketch_meta_rows(sketches: dict[str, KLLSketch]) -> list[list]:
+    k = min((s.k for s in sketches.values()), default=k_for_epsilon(RFM_SKETCH_EPSILON))
+    return [
+        ["quantile_mode", "sketch"],
+        ["sketch_k", k],
+        ["sketch_epsilon", round(KLLSketch(k).epsilon, 6)],
+    ]
 
+
+def create_rfm_constant_excel(db: SQLiteManager, output_folder: str | Path) -> Path:
+    """
+    ساخت فایل rfm_constant.xlsx کنار خروجی rfm_data.
+    آستانه‌ها و قواعد سگمنت در جدول‌های rfm_thresholds و rfm_segment_rules دیتابیس هم ذخیره می‌شوند.
+    با RFM_QUANTILE_MODE="sketch" باندها از KLL sketch هر معیار ساخته و sketchها در rfm_sketches ذخیره می‌شوند.
+    """
+    output_folder = Path(output_folder)
+    output_folder.mkdir(parents=True, exist_ok=True)
+    output_path = output_folder / "rfm_constant.xlsx"
+    quantile_bands = max(2, int(RFM_QUANTILE_BANDS))
+
+    total_rows = db.get_row_count(RFM_DATA_TABLE)
+
+    meta_rows = [
+        ["table_name", RFM_DATA_TABLE],
+        ["generated_at_shamsi", jdatetime.datetime.now().strftime("%Y/%m/%d %H:%M:%S")],
+        ["total_rows", total_rows],
+        ["quantile_bands", quantile_bands],
+    ]
+    report_rows = None
+    if RFM_QUANTILE_MODE == "sketch":
+        sketches = build_metric_sketches(db, RFM_DATA_TABLE, RFM_METRICS, k_for_epsilon(RFM_SKETCH_EPSILON))
+        save_metric_sketches(db, sketches)
+        metric_summary = _sketch_metric_bands(sketches, RFM_METRICS, quantile_bands)
+        if RFM_SKETCH_REPORT:
+            exact_arrays = load_metric_arrays(db, RFM_DATA_TABLE, RFM_METRICS)
+            report_rows = _sketch_report_rows(metric_summary, exact_arrays, quantile_bands)
+        meta_rows.append(["note", f"باندها تقریبی (KLL sketch) با رتبه‌های NTILE({quantile_bands}) ساخته شده‌اند."])
+        meta_rows += _sketch_meta_rows(sketches)
+    else:
+        # هر سه معیار یک بار خوانده و باندها/آمار در حافظه حساب می‌شوند (نه سه NTILE و سه اسکن جدا)
+        metric_summary = _fetch_all_metric_bands(db, RFM_METRICS, quantile_bands)
+        meta_rows.append(["note", f"باندها با NTILE({quantile_bands}) از داده‌های فعلی ساخته شده‌اند."])
+    meta_rows.append(["note2", "در recency هرچه مقدار کمتر باشد، امتیاز بالاتر است."])
     # اگر داده‌ای نبود، یک هشدار واضح داخل فایل بگذار
     if total_rows == 0:
-        ws_meta.append(["warning", "جدول rfm_data خالی است؛ آستانه‌ها ممکن است کامل نباشند."])
+        meta_rows.append(["warning", "جدول rfm_data خالی است؛ آستانه‌ها ممکن است کامل نباشند."])
 
-    wb.save(str(output_path))
+    thresholds, segment_rules = _write_rfm_constant_workbook(
+        output_path, metric_summary, quantile_bands, meta_rows, report_rows
+    )
+
+    # آستانه‌ها و قواعد سگمنت در دیتابیس هم ذخیره می‌شوند تا rfm_scores با یک کوئری ساخته شود
+    save_rfm_thresholds(db, thresholds)
+    save_segment_rules(db, segment_rules)
+    db.commit()
+    return output_path
+
+
+def create_combined_rfm_constant_excel(db_files: list[Path], output_path: Path) -> Path | None:
+    """
+    rfm_constant مشترک چند فروشگاه: sketchهای rfm_sketches هر converted.db ادغام و باندها از نتیجه ساخته می‌شوند
+    (بدون خواندن دوباره rfm_data). شیت sketch_report فقط با RFM_COMBINED_SKETCH_REPORT ساخته می‌شود، چون
+    داده دقیق همه فروشگاه‌ها را با هم در حافظه می‌خواند.
+    برمی‌گرداند مسیر فایل یا None اگر هیچ sketchی پیدا نشد.
+    """
+    quantile_bands = max(2, int(RFM_QUANTILE_BANDS))
+    merged = {metric: KLLSketch(k_for_epsilon(RFM_SKETCH_EPSILON)) for metric in RFM_METRICS}
+    exact_parts: dict[str, list[np.ndarray]] = {metric: [] for metric in RFM_METRICS}
+    sources = []
+    total_rows = 0
+    for db_file in db_files:
+        with DBSession(db_file) as db:
+            sketches = load_metric_sketches(db)
+            if not sketches:
+                continue
+            sources.append(Path(db_file).parent.name)
+            total_rows += db.get_row_count(RFM_DATA_TABLE)
+            for metric in RFM_METRICS:
+                if metric in sketches:
+                    merged[metric].merge(sketches[metric])
+            if RFM_COMBINED_SKETCH_REPORT and db._table_exists(RFM_DATA_TABLE):
+                for metric, values in load_metric_arrays(db, RFM_DATA_TABLE, RFM_METRICS).items():
+                    exact_parts[metric].append(values)
+    if not sources:
+        return None
+
+    metric_summary = _sketch_metric_bands(merged, RFM_METRICS, quantile_bands)
+    report_rows = None
+    if RFM_COMBINED_SKETCH_REPORT:
+        exact_arrays = {metric: np.concatenate(parts or [np.empty(0)]) for metric, parts in exact_parts.items()}
+        report_rows = _sketch_report_rows(metric_summary, exact_arrays, quantile_bands)
+    meta_rows = [
+        ["table_name", f"{RFM_DATA_TABLE} ({len(sources)} فروشگاه)"],
+        ["sources", ", ".join(sources)],
+        ["generated_at_shamsi", jdatetime.datetime.now().strftime("%Y/%m/%d %H:%M:%S")],
+        ["total_rows", total_rows],
+        ["quantile_bands", quantile_bands],
+        ["note", f"باندهای مشترک از ادغام KLL sketch فروشگاه‌ها با رتبه‌های NTILE({quantile_bands}) ساخته شده‌اند."],
+        *_sketch_meta_rows(merged),
+        ["note2", "در recency هرچه مقدار کمتر باشد، امتیاز بالاتر است."],
+    ]
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    _write_rfm_constant_workbook(output_path, metric_summary, quantile_bands, meta_rows, report_rows)
     return output_path
@@ -1,28 +1,20 @@
 """
 ساخت جدول rfm_data بر اساس wc_order_stats برای تحلیل RFM.
 """
-from datetime import datetime
+import time
 
 import jdatetime
 
+from config import RFM_DATA_SINGLE_SCAN, RFM_INCREMENTAL, RFM_REFERENCE_SHAMSI_DATE
 from core.db_manager import SQLiteManager
+from core.duckdb_engine import DuckDBWorkspace, use_duckdb
+from core.jalali import register_shamsi_functions
+from core.rfm_numpy import SQLITE_KBN_SUM
 
 
 RFM_DATA_TABLE = "rfm_data"
 
 
-def _to_shamsi(dt_text: str | None) -> str:
-    """تبدیل datetime میلادی (YYYY-MM-DD HH:MM:SS) به تاریخ شمسی."""
-    if not dt_text:
-        return ""
-    try:
-        dt = datetime.strptime(dt_text, "%Y-%m-%d %H:%M:%S")
-    except Exception:
-        return ""
-    jdt = jdatetime.datetime.fromgregorian(datetime=dt)
-    return jdt.strftime("%Y/%m/%d %H:%M:%S")
-
-
 def _shamsi_to_gregorian_start(shamsi_text: str | None) -> str | None:
     """
     تبدیل تاریخ شمسی کانفیگ به datetime میلادی.
@@ -56,47 +48,47 @@ def _shamsi_to_gregorian_start(shamsi_text: str | None) -> str | None:
         return None
 
 
-def create_rfm_data_table(db: SQLiteManager, from_shamsi_date: str | None = None) -> bool:
-    """
-    ایجاد جدول rfm_data:
-    - فقط سفارش‌های completed
-    - آمار کل خرید هر کاربر (تعداد/مبلغ)
-    - آخرین مبلغ سفارش کاربر
-    - recency_days
-    - فیلتر اختیاری تاریخ شروع (شمسی) از کانفیگ
-    """
-    try:
-        db.conn.create_function("to_shamsi", 1, _to_shamsi)
-        lookup_cols = db._table_columns("wc_customer_lookup")
-        if "customer_id" in lookup_cols:
-            join_key = "c.customer_id"
-        elif "id" in lookup_cols:
-            join_key = "c.id"
-        else:
-            return False
+# آمار تجمیعی ماندگار هر کاربر (تعداد، مجموع، تاریخ/مبلغ آخرین سفارش) که rfm_data از روی آن ساخته می‌شود
+RFM_USER_AGG_TABLE = "rfm_user_agg"
 
-        from_gregorian = _shamsi_to_gregorian_start(from_shamsi_date)
-        date_filter_sql = ""
-        if from_gregorian:
-            date_filter_sql = f" AND o.date_created >= '{from_gregorian}'"
+# وضعیت به‌روزرسانی افزایشی: شناسه سایت، watermark سفارش‌های ادغام‌شده و فیلتر تاریخ همان آمار
+RFM_STATE_TABLE = "_rfm_state"
 
-        sql = f"""
-DROP TABLE IF EXISTS "{RFM_DATA_TABLE}";
-CREATE TABLE "{RFM_DATA_TABLE}" AS
+# ستون‌های _rfm_state که _load_rfm_state برمی‌گرداند
+_RFM_STATE_KEYS = (
+    "site_id",
+    "from_gregorian",
+    "max_order_id",
+    "max_date_created",
+    "reference_date",
+    "mode",
+    "merged_users",
+)
+
+# CTE مشترک: سفارش‌های completed هر کاربر (با فیلتر اختیاری تاریخ)
+# orders_source در به‌روزرسانی افزایشی فقط سفارش‌های بعد از watermark است
+_RFM_BASE_CTE = """
 WITH base AS (
     SELECT
         c.user_id AS user_id,
         o.order_id AS order_id,
         o.date_created AS date_created,
         o.total_sales AS total_sales
-    FROM wc_order_stats o
+    FROM {orders_source} o
     JOIN wc_customer_lookup c
         ON o.customer_id = {join_key}
     JOIN users u
         ON u.ID = c.user_id
     WHERE o.status = 'wc-completed'
     {date_filter_sql}
-),
+)"""
+
+# کلید آخرین سفارش: مقایسه رشته‌ای آن همان ترتیب (date_created، order_id) است.
+# char(1) جداکننده است و تاریخ NULL مثل ORDER BY ... DESC کمترین مقدار حساب می‌شود.
+_LAST_ORDER_KEY_SQL = "COALESCE({date}, '') || char(1) || printf('%020d', {order_id})"
+
+# روش قبلی: GROUP BY برای آمار + ROW_NUMBER روی همه سفارش‌ها برای مبلغ آخرین سفارش، سپس join
+_RFM_WINDOW_AGG_SELECT = """,
 ranked AS (
     SELECT
         user_id,
@@ -120,28 +112,397 @@ agg AS (
 )
 SELECT
     a.user_id AS user_id,
-    a.last_order_date AS last_order_date,
-    to_shamsi(a.last_order_date) AS last_order_date_shamsi,
     a.total_orders AS total_orders,
     a.total_spent AS total_spent,
-    r.total_sales AS last_order_amount,
-    CAST(julianday('now') - julianday(a.last_order_date) AS INTEGER) AS recency_days
+    """ + _LAST_ORDER_KEY_SQL.format(date="r.date_created", order_id="r.order_id") + """ AS last_order_key,
+    a.last_order_date AS last_order_date,
+    r.total_sales AS last_order_amount
 FROM agg a
 JOIN ranked r
     ON a.user_id = r.user_id
-   AND r.rn = 1;
+   AND r.rn = 1
 """
-        db.executescript(sql)
+
+# روش تک‌پاس: یک GROUP BY با تنها یک MAX روی کلید آخرین سفارش.
+# در SQLite ستون‌های بدون تابع تجمیعی کنار تنها یک max() از همان ردیفِ بیشینه خوانده می‌شوند،
+# پس تاریخ و مبلغ آخرین سفارش با همان ترتیب ROW_NUMBER (date_created DESC, order_id DESC) به دست می‌آیند.
+# «+» affinity ستون تاریخ را برمی‌دارد (همان نوع ستون روش قبلی).
+# ارجاع به last_order_key در WHERE بیرونی مانع حذف این ستون (و در نتیجه max) توسط بهینه‌ساز می‌شود.
+_RFM_SINGLE_SCAN_AGG_CTE = """,
+last_order AS (
+    SELECT
+        user_id,
+        COUNT(order_id) AS total_orders,
+        SUM(total_sales) AS total_spent,
+        MAX(""" + _LAST_ORDER_KEY_SQL.format(date="date_created", order_id="order_id") + """) AS last_order_key,
+        +date_created AS last_order_date,
+        total_sales AS last_order_amount
+    FROM base
+    GROUP BY user_id
+)"""
+
+_RFM_USER_AGG_COLUMNS = "user_id, total_orders, total_spent, last_order_key, last_order_date, last_order_amount"
+
+_RFM_SINGLE_SCAN_AGG_FINAL = f"""
+SELECT {_RFM_USER_AGG_COLUMNS}
+FROM last_order
+WHERE last_order_key IS NOT NULL
+"""
+
+# ادغام آمار سفارش‌های جدید در آمار ماندگار (در SET همه ستون‌های سمت راست مقدار قبلی‌اند)
+_RFM_USER_AGG_UPSERT = """
+ON CONFLICT(user_id) DO UPDATE SET
+    total_orders = total_orders + excluded.total_orders,
+    total_spent = total_spent + excluded.total_spent,
+    last_order_date = CASE WHEN excluded.last_order_key > last_order_key
+        THEN excluded.last_order_date ELSE last_order_date END,
+    last_order_amount = CASE WHEN excluded.last_order_key > last_order_key
+        THEN excluded.last_order_amount ELSE last_order_amount END,
+    last_order_key = MAX(last_order_key, excluded.last_order_key)
+"""
+
+# rfm_data از روی آمار ماندگار؛ recency نسبت به تاریخ مرجع (پیش‌فرض: اکنون)
+_RFM_DATA_FROM_AGG_SQL = f"""
+CREATE TABLE "{RFM_DATA_TABLE}" AS
+SELECT
+    user_id,
+    last_order_date,
+    to_shamsi(last_order_date) AS last_order_date_shamsi,
+    total_orders,
+    total_spent,
+    last_order_amount,
+    CAST(julianday({{reference}}) - julianday(last_order_date) AS INTEGER) AS recency_days
+FROM "{RFM_USER_AGG_TABLE}"
+ORDER BY user_id;
+"""
+
+
+def _sql_text(value: str) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _base_cte(join_key: str, from_gregorian: str | None, orders_source: str) -> str:
+    date_filter_sql = f" AND o.date_created >= {_sql_text(from_gregorian)}" if from_gregorian else ""
+    return _RFM_BASE_CTE.format(orders_source=orders_source, join_key=join_key, date_filter_sql=date_filter_sql)
+
+
+def rfm_user_agg_select_sql(
+    join_key: str,
+    from_gregorian: str | None = None,
+    single_scan: bool = True,
+    orders_source: str = "wc_order_stats",
+) -> str:
+    """
+    کوئری SELECT آمار هر کاربر (تک‌پاس یا پنجره‌ای) با ستون‌های:
+    user_id, total_orders, total_spent, last_order_key, last_order_date, last_order_amount
+    join_key ستون کلید wc_customer_lookup است.
+    """
+    base = _base_cte(join_key, from_gregorian, orders_source)
+    if single_scan:
+        return base + _RFM_SINGLE_SCAN_AGG_CTE + _RFM_SINGLE_SCAN_AGG_FINAL
+    return base + _RFM_WINDOW_AGG_SELECT
+
+
+def _load_rfm_state(db: SQLiteManager) -> dict | None:
+    """
+    وضعیت آخرین ساخت/به‌روزرسانی rfm_user_agg یا None اگر آمار ماندگاری نباشد
+    (وضعیت قدیمی بدون site_id هم None است، چون معلوم نیست آمار کدام سایت است).
+    """
+    if not (db._table_exists(RFM_STATE_TABLE) and db._table_exists(RFM_USER_AGG_TABLE)):
+        return None
+    if not set(_RFM_STATE_KEYS).issubset(db._table_columns(RFM_STATE_TABLE)):
+        return None
+    row = db.execute(
+        f"""SELECT {", ".join(_RFM_STATE_KEYS)} FROM "{RFM_STATE_TABLE}" WHERE id = 1"""
+    ).fetchone()
+    if row is None:
+        return None
+    return dict(zip(_RFM_STATE_KEYS, row))
+
+
+def get_rfm_state(db: SQLiteManager) -> dict | None:
+    """
+    وضعیت آخرین ساخت rfm_data برای گزارش:
+    {"site_id", "from_gregorian", "max_order_id", "max_date_created", "reference_date",
+     "mode" ("full"/"incremental"), "merged_users"}
+    """
+    try:
+        return _load_rfm_state(db)
+    except Exception:
+        return None
+
+
+def _save_rfm_state(
+    db: SQLiteManager,
+    site_id: str | None,
+    from_gregorian: str | None,
+    max_order_id,
+    reference_date: str | None,
+    mode: str,
+    merged_users: int,
+) -> None:
+    # وضعیت قالب قدیمی (بدون site_id) کنار گذاشته می‌شود
+    if db._table_exists(RFM_STATE_TABLE) and "site_id" not in db._table_columns(RFM_STATE_TABLE):
+        db.execute(f'DROP TABLE "{RFM_STATE_TABLE}"')
+    db.execute(
+        f"""CREATE TABLE IF NOT EXISTS "{RFM_STATE_TABLE}" (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            site_id TEXT,
+            from_gregorian TEXT,
+            max_order_id INTEGER,
+            max_date_created TEXT,
+            reference_date TEXT,
+            mode TEXT,
+            merged_users INTEGER,
+            updated_at TEXT
+        )"""
+    )
+    max_date_created = db.execute(f'SELECT MAX(last_order_date) FROM "{RFM_USER_AGG_TABLE}"').fetchone()[0]
+    db.execute(
+        f"""INSERT OR REPLACE INTO "{RFM_STATE_TABLE}"
+        (id, site_id, from_gregorian, max_order_id, max_date_created, reference_date, mode, merged_users, updated_at)
+        VALUES (1, ?, ?, ?, ?, ?, ?, ?, datetime('now'))""",
+        (site_id, from_gregorian, max_order_id, max_date_created, reference_date, mode, merged_users),
+    )
+
+
+def _order_watermark(db: SQLiteManager) -> tuple:
+    """بیشترین order_id و date_created جدول wc_order_stats (با ایندکس‌ها، بدون اسکن)."""
+    return db.execute("SELECT MAX(order_id), MAX(date_created) FROM main.wc_order_stats").fetchone()
+
+
+def _state_matches(state: dict, site_id: str | None, watermark: tuple) -> bool:
+    """
+    آمار ماندگار state برای دامپ فعلی قابل استفاده است: همان سایت، و watermark سفارش‌های دامپ
+    عقب‌تر از watermark ذخیره‌شده نیست (دامپ قدیمی‌تر یا دامپ سایت دیگر با همان پیشوند).
+    """
+    if state.get("site_id") != site_id:
+        return False
+    max_order_id, max_date_created = watermark
+    if (state.get("max_order_id") or 0) > (max_order_id or 0):
+        return False
+    return (state.get("max_date_created") or "") <= (max_date_created or "")
+
+
+# جمع مبالغ در DuckDB: ترتیب جمع اجرای چندنخی ثابت نیست، پس مثل SUM در SQLite (جمع ترتیبی به ترتیب order_id)
+# روی لیست مرتب مبالغ جمع زده می‌شود تا float بیت‌به‌بیت یکسان بماند؛ SQLite >= 3.43 با Kahan-Babuska-Neumaier
+# جمع می‌زند که معادل دقیق ندارد و fsum (جمع جبرانی) نزدیک‌ترین است
+_RFM_DUCKDB_SUM_SQL = (
+    "fsum(total_sales)"
+    if SQLITE_KBN_SUM
+    else "list_reduce(list(total_sales ORDER BY order_id) FILTER (WHERE total_sales IS NOT NULL), lambda a, b: a + b)"
+)
+
+# آمار هر کاربر در DuckDB: همان base و همان کلید آخرین سفارش؛ arg_max جای ستون‌های بدون تجمیع SQLite
+_RFM_DUCKDB_AGG_SQL = """,
+keyed AS (
+    SELECT *, """ + _LAST_ORDER_KEY_SQL.replace("char(1)", "chr(1)").format(
+    date="date_created", order_id="order_id"
+) + """ AS last_order_key
+    FROM base
+)
+SELECT
+    user_id,
+    COUNT(order_id) AS total_orders,
+    """ + _RFM_DUCKDB_SUM_SQL + """ AS total_spent,
+    MAX(last_order_key) AS last_order_key,
+    arg_max(date_created, last_order_key) AS last_order_date,
+    arg_max(total_sales, last_order_key) AS last_order_amount
+FROM keyed
+GROUP BY user_id
+ORDER BY user_id
+"""
+
+
+def _build_rfm_user_agg_duckdb(db: SQLiteManager, join_key: str, from_gregorian: str | None) -> int:
+    """ساخت rfm_user_agg با DuckDB (core.duckdb_engine)؛ جدول با همان ستون‌ها و نوع‌های کوئری SQL ساخته می‌شود."""
+    with DuckDBWorkspace(db) as ws:
+        ws.load("wc_order_stats", "status = 'wc-completed'")
+        ws.load("wc_customer_lookup")
+        ws.load("users")
+        db.execute(f'DROP TABLE IF EXISTS "{RFM_USER_AGG_TABLE}"')
+        db.execute(
+            f'CREATE TABLE "{RFM_USER_AGG_TABLE}" AS'
+            + rfm_user_agg_select_sql(join_key, from_gregorian, single_scan=True)
+            + "LIMIT 0"
+        )
+        count = ws.write_rows(
+            _base_cte(join_key, from_gregorian, "wc_order_stats") + _RFM_DUCKDB_AGG_SQL,
+            RFM_USER_AGG_TABLE,
+            _RFM_USER_AGG_COLUMNS.split(", "),
+        )
+    db.execute(f'CREATE UNIQUE INDEX "idx_{RFM_USER_AGG_TABLE}_user_id" ON "{RFM_USER_AGG_TABLE}" ("user_id")')
+    return count
+
+
+def _build_rfm_user_agg(
+    db: SQLiteManager,
+    join_key: str,
+    from_gregorian: str | None,
+    single_scan: bool,
+    derived_engine: str | None = None,
+) -> int:
+    """ساخت کامل rfm_user_agg از همه سفارش‌ها. برمی‌گرداند تعداد کاربران."""
+    if use_duckdb(derived_engine):
+        try:
+            return _build_rfm_user_agg_duckdb(db, join_key, from_gregorian)
+        except Exception:
+            db.conn.rollback()
+    db.execute(f'DROP TABLE IF EXISTS "{RFM_USER_AGG_TABLE}"')
+    db.executescript(
+        f'CREATE TABLE "{RFM_USER_AGG_TABLE}" AS'
+        + rfm_user_agg_select_sql(join_key, from_gregorian, single_scan)
+        + f';\nCREATE UNIQUE INDEX "idx_{RFM_USER_AGG_TABLE}_user_id" ON "{RFM_USER_AGG_TABLE}" ("user_id");'
+    )
+    return db.new_table_row_count(RFM_USER_AGG_TABLE)
+
+
+def _merge_new_orders(db: SQLiteManager, join_key: str, state: dict) -> int:
+    """
+    ادغام سفارش‌های بعد از watermark در rfm_user_agg. برمی‌گرداند تعداد کاربران به‌روزشده.
+    سفارش جدید: order_id بزرگ‌تر از بیشترین order_id دیده‌شده، یا date_created بعد از آخرین تاریخ ادغام‌شده
+    (چنین سفارشی قبلاً ادغام نشده، چون تاریخ همه سفارش‌های ادغام‌شده حداکثر همان تاریخ است).
+    فقط همین سفارش‌ها با ایندکس‌های order_id و date_created خوانده می‌شوند.
+    """
+    orders_source = (
+        f"(SELECT * FROM wc_order_stats WHERE order_id > {int(state['max_order_id'] or 0)}"
+        f" UNION SELECT * FROM wc_order_stats WHERE date_created > {_sql_text(state['max_date_created'] or '')})"
+    )
+    sql = (
+        _base_cte(join_key, state["from_gregorian"], orders_source)
+        + _RFM_SINGLE_SCAN_AGG_CTE
+        + f'\nINSERT INTO "{RFM_USER_AGG_TABLE}" ({_RFM_USER_AGG_COLUMNS})'
+        + _RFM_SINGLE_SCAN_AGG_FINAL
+        + _RFM_USER_AGG_UPSERT
+    )
+    changes_before = db.conn.total_changes
+    db.execute(sql)
+    return db.conn.total_changes - changes_before
+
+
+def create_rfm_data_table(
+    db: SQLiteManager,
+    from_shamsi_date: str | None = None,
+    single_scan: bool | None = None,
+    reference_shamsi_date: str | None = None,
+    incremental: bool | None = None,
+    derived_engine: str | None = None,
+    site_id: str | None = None,
+) -> bool:
+    """
+    ایجاد جدول rfm_data:
+    - فقط سفارش‌های completed
+    - آمار کل خرید هر کاربر (تعداد/مبلغ)
+    - آخرین مبلغ سفارش کاربر
+    - recency_days نسبت به reference_shamsi_date (شمسی؛ "0" یا خالی = اکنون)
+    - فیلتر اختیاری تاریخ شروع (شمسی) از کانفیگ
+    آمار هر کاربر در rfm_user_agg و watermark سفارش‌ها در _rfm_state می‌ماند؛ با incremental=True
+    اگر آمار قبلی همین سایت (site_id، مثل utils.helpers.site_identity) با همین فیلتر تاریخ موجود باشد
+    و watermark آن از سفارش‌های فعلی جلوتر نباشد فقط سفارش‌های جدید ادغام می‌شوند؛ در غیر این صورت ساخت کامل.
+    single_scan/incremental=None یعنی از RFM_DATA_SINGLE_SCAN/RFM_INCREMENTAL در config؛
+    با derived_engine="duckdb" (یا DERIVED_ENGINE در config) ساخت کامل آمار در DuckDB (core.duckdb_engine) است.
+    """
+    if single_scan is None:
+        single_scan = RFM_DATA_SINGLE_SCAN
+    if incremental is None:
+        incremental = RFM_INCREMENTAL
+    if reference_shamsi_date is None:
+        reference_shamsi_date = RFM_REFERENCE_SHAMSI_DATE
+    try:
+        register_shamsi_functions(db)
+        lookup_cols = db._table_columns("wc_customer_lookup")
+        if "customer_id" in lookup_cols:
+            join_key = "c.customer_id"
+        elif "id" in lookup_cols:
+            join_key = "c.id"
+        else:
+            return False
+
+        from_gregorian = _shamsi_to_gregorian_start(from_shamsi_date)
+        reference_date = _shamsi_to_gregorian_start(reference_shamsi_date)
+        reference_sql = "'now'" if reference_date is None else f"'{reference_date}'"
+
+        started = time.perf_counter()
+        bytes_before = db.used_bytes()
+        state = _load_rfm_state(db) if incremental else None
+        # watermark شناسه: بیشترین order_id کل جدول (با ایندکس اصلی، بدون اسکن)
+        watermark = _order_watermark(db)
+        max_order_id = watermark[0]
+        if (
+            state is not None
+            and state["from_gregorian"] == from_gregorian
+            and _state_matches(state, site_id, watermark)
+        ):
+            mode = "incremental"
+            merged_users = _merge_new_orders(db, join_key, state)
+        else:
+            mode = "full"
+            merged_users = _build_rfm_user_agg(db, join_key, from_gregorian, single_scan, derived_engine)
+        _save_rfm_state(db, site_id, from_gregorian, max_order_id, reference_date, mode, merged_users)
+
+        db.execute(f'DROP TABLE IF EXISTS "{RFM_DATA_TABLE}"')
+        db.executescript(_RFM_DATA_FROM_AGG_SQL.format(reference=reference_sql))
+        db.record_stats(
+            RFM_DATA_TABLE,
+            db.new_table_row_count(RFM_DATA_TABLE),
+            byte_size=db.used_bytes() - bytes_before,
+            build_seconds=time.perf_counter() - started,
+            kind="derived",
+        )
+        db.commit()
+        return True
+    except Exception:
+        return False
+
+
+def seed_rfm_state(db: SQLiteManager, source_db_path, site_id: str | None) -> bool:
+    """
+    کپی آمار ماندگار RFM (rfm_user_agg و _rfm_state) از دیتابیس یک اجرای قبلی (مثلاً converted.db خروجی قبلی)
+    تا ساخت بعدی rfm_data فقط سفارش‌های جدید را ادغام کند. برمی‌گرداند True اگر کپی شد.
+    کپی نمی‌شود اگر site_id وضعیت قبلی با site_id دامپ فعلی فرق کند (یا وضعیت قدیمی site_id نداشته باشد)
+    یا بیشترین order_id / date_created سفارش‌های واردشده کمتر از watermark ذخیره‌شده باشد.
+    """
+    try:
+        db.execute("ATTACH DATABASE ? AS rfm_seed", (str(source_db_path),))
+    except Exception:
+        return False
+    try:
+        names = {
+            row[0]
+            for row in db.execute("SELECT name FROM rfm_seed.sqlite_master WHERE type = 'table'").fetchall()
+        }
+        if not {RFM_USER_AGG_TABLE, RFM_STATE_TABLE}.issubset(names):
+            return False
+        state_columns = {row[1] for row in db.execute(f'PRAGMA rfm_seed.table_info("{RFM_STATE_TABLE}")')}
+        if not set(_RFM_STATE_KEYS).issubset(state_columns):
+            return False
+        row = db.execute(
+            f'SELECT {", ".join(_RFM_STATE_KEYS)} FROM rfm_seed."{RFM_STATE_TABLE}" WHERE id = 1'
+        ).fetchone()
+        if row is None or not _state_matches(dict(zip(_RFM_STATE_KEYS, row)), site_id, _order_watermark(db)):
+            return False
+        for table in (RFM_USER_AGG_TABLE, RFM_STATE_TABLE):
+            db.execute(f'DROP TABLE IF EXISTS main."{table}"')
+            create_sql = db.execute(
+                "SELECT sql FROM rfm_seed.sqlite_master WHERE type = 'table' AND name = ?", (table,)
+            ).fetchone()[0]
+            db.execute(create_sql)
+            db.execute(f'INSERT INTO main."{table}" SELECT * FROM rfm_seed."{table}"')
+        db.execute(
+            f'CREATE UNIQUE INDEX IF NOT EXISTS "idx_{RFM_USER_AGG_TABLE}_user_id" ON "{RFM_USER_AGG_TABLE}" ("user_id")'
+        )
         db.commit()
         return True
     except Exception:
+        db.conn.rollback()
         return False
+    finally:
+        db.execute("DETACH DATABASE rfm_seed")
 
 
 def get_rfm_data_row_count(db: SQLiteManager) -> int:
-    """تعداد رکوردهای جدول rfm_data."""
+    """تعداد رکوردهای جدول rfm_data (از _stats)."""
     try:
-        cursor = db.execute(f'SELECT COUNT(*) FROM "{RFM_DATA_TABLE}"')
-        return cursor.fetchone()[0]
+        return db.get_row_count(RFM_DATA_TABLE)
     except Exception:
         return 0
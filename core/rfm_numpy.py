@@ -0,0 +1,330 @@
+"""
+موتور ستونی RFM با NumPy (جایگزین محاسبه در SQLite و حلقه‌های ردیف‌به‌ردیف پایتون).
+
+- باندهای Quantile (همان تقسیم NTILE) با np.partition فقط روی مرزهای باند
+- امتیاز R/F/M با searchsorted روی مرزهای مرتب‌شده و سگمنت با جدول lookup سه‌بعدی
+- آستانه‌ها و قواعد سگمنت rfm_constant.xlsx با load_thresholds / load_segment_rules خوانده و کامپایل می‌شوند
+
+آمار هر کاربر (rfm_data) در SQLite ساخته می‌شود؛ خروجی‌ها همان rfm_constant و rfm_scores مسیر SQL هستند.
+"""
+import math
+import sqlite3
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+from openpyxl import load_workbook
+
+from core.db_manager import SQLiteManager
+
+
+# تعداد ردیف در هر fetchmany هنگام خواندن ستون‌ها
+_FETCH_CHUNK = 200_000
+
+
+def _fetch_columns(cursor, column_count: int) -> list[list]:
+    """خواندن نتیجه کوئری به صورت ستونی (لیست برای هر ستون) با fetchmany."""
+    columns: list[list] = [[] for _ in range(column_count)]
+    while True:
+        rows = cursor.fetchmany(_FETCH_CHUNK)
+        if not rows:
+            break
+        for col, values in zip(columns, zip(*rows)):
+            col.extend(values)
+    return columns
+
+
+# از SQLite 3.43 تابع SUM روی REAL با جمع Kahan-Babuska-Neumaier حساب می‌شود و قبل از آن جمع ساده ترتیبی
+SQLITE_KBN_SUM = sqlite3.sqlite_version_info >= (3, 43, 0)
+
+
+def ntile_positions(total: int, quantile_bands: int) -> list[tuple[int, int, int, int]]:
+    """
+    موقعیت باندهای NTILE(n) OVER (ORDER BY value) در آرایه مرتب: r باند اول یک ردیف بیشتر دارند.
+    خروجی: [(bucket, first_rank, last_rank, cnt), ...] (رتبه صفرمبنا؛ باند خالی حذف می‌شود)
+    """
+    size, extra = divmod(total, quantile_bands)
+    bounds = []
+    start = 0
+    for bucket in range(1, quantile_bands + 1):
+        cnt = size + (1 if bucket <= extra else 0)
+        if cnt == 0:
+            continue
+        bounds.append((bucket, start, start + cnt - 1, cnt))
+        start += cnt
+    return bounds
+
+
+def ntile_bands(values: np.ndarray, quantile_bands: int) -> list[tuple[int, float, float, int]]:
+    """
+    همان باندهای NTILE(n) OVER (ORDER BY value) (ntile_positions).
+    فقط مقادیر مرز باندها با np.partition پیدا می‌شوند (بدون مرتب‌سازی کامل).
+    خروجی: [(bucket, min_val, max_val, cnt), ...]
+    """
+    total = len(values)
+    if total == 0:
+        return []
+    bounds = ntile_positions(total, quantile_bands)
+    kth = sorted({p for _, lo, hi, _ in bounds for p in (lo, hi)})
+    part = np.partition(values, kth)
+    return [(bucket, float(part[lo]), float(part[hi]), cnt) for bucket, lo, hi, cnt in bounds]
+
+
+def metric_stats(values: np.ndarray) -> tuple[int, float | None, float | None, float | None]:
+    """
+    (count, min, max, avg) مثل COUNT/MIN/MAX/AVG در SQLite.
+    جمع میانگین مثل SQLite: ترتیبی (cumsum) و در نسخه‌های دارای KBN با math.fsum.
+    """
+    cnt = len(values)
+    if cnt == 0:
+        return 0, None, None, None
+    total = math.fsum(values.tolist()) if SQLITE_KBN_SUM else float(np.cumsum(values)[-1])
+    return cnt, float(values.min()), float(values.max()), total / cnt
+
+
+def load_metric_arrays(db: SQLiteManager, table: str, metrics: list[str]) -> dict[str, np.ndarray]:
+    """مقادیر غیر NULL هر معیار (CAST AS REAL) از جدول، یک بار خواندن همه ستون‌ها."""
+    cols = ", ".join(f'CAST("{m}" AS REAL)' for m in metrics)
+    columns = _fetch_columns(db.execute(f'SELECT {cols} FROM "{table}"'), len(metrics))
+    result = {}
+    for metric, values in zip(metrics, columns):
+        # None => NaN و حذف؛ CAST در SQLite هیچ‌وقت NaN برنمی‌گرداند
+        arr = np.array(values, dtype=np.float64)
+        result[metric] = arr[~np.isnan(arr)]
+    return result
+
+
+def to_int(value):
+    """مقدار سلول اکسل به int (از طریق float)؛ خالی یا نامعتبر => None."""
+    if value is None:
+        return None
+    try:
+        return int(float(str(value).strip()))
+    except (ValueError, TypeError):
+        return None
+
+
+def to_float(value):
+    """مقدار سلول اکسل به float (جداکننده هزارگان حذف)؛ خالی یا نامعتبر => None."""
+    if value is None:
+        return None
+    txt = str(value).strip()
+    if not txt:
+        return None
+    try:
+        return float(txt.replace(",", ""))
+    except Exception:
+        return None
+
+
+# معیار rfm_data و ستون امتیاز هر کدام
+RFM_SCORE_COLUMNS = {"recency_days": "r_score", "total_orders": "f_score", "total_spent": "m_score"}
+
+
+def load_thresholds(constant_path: Path) -> tuple[dict[str, list[tuple[float, float, int]]], str | None]:
+    """
+    خواندن شیت thresholds از rfm_constant.xlsx.
+    خروجی: ({metric: [(min, max, score), ...] مرتب بر اساس (min, max)}, پیام خطا یا None)
+    """
+    try:
+        wb = load_workbook(constant_path, read_only=True, data_only=True)
+        if "thresholds" not in wb.sheetnames:
+            wb.close()
+            return {}, "شیت thresholds در rfm_constant.xlsx یافت نشد."
+        ws = wb["thresholds"]
+        header_row = next(ws.iter_rows(min_row=1, max_row=1, values_only=True), None)
+        if not header_row:
+            wb.close()
+            return {}, "هدر شیت thresholds خالی است."
+        headers = [str(c).strip() if c is not None else "" for c in header_row]
+        idx = {h: i for i, h in enumerate(headers)}
+        required = ["metric", "min_value", "max_value", "score"]
+        if not all(k in idx for k in required):
+            wb.close()
+            return {}, "ستون‌های لازم برای thresholds کامل نیستند."
+
+        rules: dict[str, list[tuple[float, float, int]]] = {}
+        for row in ws.iter_rows(min_row=2, values_only=True):
+            metric = row[idx["metric"]] if idx["metric"] < len(row) else None
+            if metric is None:
+                continue
+            metric = str(metric).strip()
+            min_v = to_float(row[idx["min_value"]] if idx["min_value"] < len(row) else None)
+            max_v = to_float(row[idx["max_value"]] if idx["max_value"] < len(row) else None)
+            score_v = row[idx["score"]] if idx["score"] < len(row) else None
+            if min_v is None or max_v is None or score_v is None:
+                continue
+            try:
+                score_i = int(float(str(score_v)))
+            except Exception:
+                continue
+            rules.setdefault(metric, []).append((min_v, max_v, score_i))
+        wb.close()
+
+        for metric in RFM_SCORE_COLUMNS:
+            if metric not in rules or not rules[metric]:
+                return {}, f"برای معیار {metric} در thresholds قانونی پیدا نشد."
+            rules[metric].sort(key=lambda x: (x[0], x[1]))
+
+        return rules, None
+    except Exception as e:
+        return {}, f"خطا در خواندن rfm_constant.xlsx: {e!s}"
+
+
+class ThresholdEdges(NamedTuple):
+    """آستانه‌های یک معیار به صورت آرایه‌های مرتب (بر اساس min، max) برای امتیازدهی با searchsorted."""
+
+    mins: np.ndarray
+    maxs: np.ndarray
+    # cummax(maxs): اولین بازه‌ای که max آن >= v است با searchsorted روی همین آرایه پیدا می‌شود
+    running_max: np.ndarray
+    centers: np.ndarray
+    scores: np.ndarray
+
+
+def compile_thresholds(rules: list[tuple[float, float, int]]) -> ThresholdEdges:
+    """تبدیل بازه‌های (min, max, score) یک معیار (شیت thresholds) به ThresholdEdges؛ یک بار برای هر معیار."""
+    ordered = sorted(rules, key=lambda x: (x[0], x[1]))
+    mins = np.array([r[0] for r in ordered], dtype=np.float64)
+    maxs = np.array([r[1] for r in ordered], dtype=np.float64)
+    return ThresholdEdges(
+        mins=mins,
+        maxs=maxs,
+        running_max=np.maximum.accumulate(maxs),
+        centers=(mins + maxs) / 2,
+        scores=np.array([r[2] for r in ordered], dtype=np.int64),
+    )
+
+
+def score_values(values: np.ndarray, rules: "ThresholdEdges | list[tuple[float, float, int]]") -> np.ndarray:
+    """
+    امتیاز برداری یک ستون float (NaN = مقدار خالی => امتیاز 0)، با این قواعد:
+    اولین بازه (به ترتیب min، max) که min <= v <= max باشد: بازه‌های با min <= v پیشوند هستند
+    (searchsorted روی minها) و اولین بازه با max >= v اولین اندیس cummax(max) >= v است.
+    بقیه: کمتر از اولین min => امتیاز اول، بیشتر از max آخرین بازه => امتیاز آخر،
+    در غیر این صورت نزدیک‌ترین مرکز بازه (در تساوی، بازه جلوتر).
+    """
+    edges = rules if isinstance(rules, ThresholdEdges) else compile_thresholds(rules)
+    mins, maxs, scores = edges.mins, edges.maxs, edges.scores
+
+    result = np.zeros(len(values), dtype=np.int64)
+    valid = ~np.isnan(values)
+    v = values[valid]
+
+    prefix = np.searchsorted(mins, v, side="right")
+    first_max = np.searchsorted(edges.running_max, v, side="left")
+    matched = first_max < prefix
+    out = np.empty(len(v), dtype=np.int64)
+    out[matched] = scores[first_max[matched]]
+
+    rest = ~matched
+    below = rest & (v < mins[0])
+    above = rest & ~below & (v > maxs[-1])
+    out[below] = scores[0]
+    out[above] = scores[-1]
+    nearest = rest & ~below & ~above
+    if nearest.any():
+        out[nearest] = scores[np.argmin(np.abs(v[nearest][:, None] - edges.centers[None, :]), axis=1)]
+
+    result[valid] = out
+    return result
+
+
+# بزرگ‌ترین امتیازی که در جدول lookup سگمنت جا می‌گیرد (امتیاز بزرگ‌تر با پیمایش قواعد)
+_SEGMENT_LOOKUP_MAX_SCORE = 64
+
+
+class SegmentLookup(NamedTuple):
+    """قواعد سگمنت به صورت جدول سه‌بعدی [r, f, m] => اندیس سگمنت (آخرین اندیس names = Unclassified)."""
+
+    rules: list[tuple[str, int, int, int, int, int, int]]
+    table: np.ndarray
+    names: np.ndarray
+
+
+def compile_segment_rules(segment_rules: list[tuple]) -> SegmentLookup:
+    """
+    تبدیل قواعد [(segment, r_min, r_max, f_min, f_max, m_min, m_max), ...] به SegmentLookup؛ یک بار برای همه کاربران.
+    اندازه جدول بزرگ‌ترین کران قواعد است، پس امتیاز بزرگ‌تر از آن با هیچ قاعده‌ای منطبق نیست.
+    """
+    rules = [tuple(rule[:7]) for rule in segment_rules]
+    highest = max((max(rule[2], rule[4], rule[6]) for rule in rules), default=0)
+    size = min(max(highest, 0), _SEGMENT_LOOKUP_MAX_SCORE) + 1
+    names = np.array([rule[0] for rule in rules] + ["Unclassified"], dtype=object)
+    table = np.full((size, size, size), len(rules), dtype=np.int32)
+    # قواعد از آخر به اول اعمال می‌شوند تا اولین قاعده منطبق روی بقیه بنویسد
+    for i in range(len(rules) - 1, -1, -1):
+        _, r_min, r_max, f_min, f_max, m_min, m_max = rules[i]
+        r_lo, f_lo, m_lo = max(r_min, 0), max(f_min, 0), max(m_min, 0)
+        if r_lo > r_max or f_lo > f_max or m_lo > m_max:
+            continue
+        table[r_lo : r_max + 1, f_lo : f_max + 1, m_lo : m_max + 1] = i
+    return SegmentLookup(rules=rules, table=table, names=names)
+
+
+def load_segment_rules(constant_path: Path) -> SegmentLookup:
+    """
+    خواندن شیت segment_rules از rfm_constant.xlsx و کامپایل آن به جدول lookup امتیاز => سگمنت.
+    برمی‌گرداند: SegmentLookup؛ rules همان [(segment, r_min, r_max, f_min, f_max, m_min, m_max), ...] است.
+    """
+    wb = load_workbook(constant_path, read_only=True, data_only=True)
+    if "segment_rules" not in wb.sheetnames:
+        wb.close()
+        return compile_segment_rules([])
+    ws = wb["segment_rules"]
+    header = next(ws.iter_rows(min_row=1, max_row=1, values_only=True), None)
+    if not header:
+        wb.close()
+        return compile_segment_rules([])
+    headers = [str(c).strip() if c is not None else "" for c in header]
+    idx = {h: i for i, h in enumerate(headers)}
+    required = ["segment", "r_min", "r_max", "f_min", "f_max", "m_min", "m_max"]
+    if not all(k in idx for k in required):
+        wb.close()
+        return compile_segment_rules([])
+    rules = []
+    for row in ws.iter_rows(min_row=2, values_only=True):
+        seg = row[idx["segment"]] if idx["segment"] < len(row) else None
+        if seg is None:
+            continue
+        seg = str(seg).strip()
+        r_min = to_int(row[idx["r_min"]] if idx["r_min"] < len(row) else None)
+        r_max = to_int(row[idx["r_max"]] if idx["r_max"] < len(row) else None)
+        f_min = to_int(row[idx["f_min"]] if idx["f_min"] < len(row) else None)
+        f_max = to_int(row[idx["f_max"]] if idx["f_max"] < len(row) else None)
+        m_min = to_int(row[idx["m_min"]] if idx["m_min"] < len(row) else None)
+        m_max = to_int(row[idx["m_max"]] if idx["m_max"] < len(row) else None)
+        if None in (r_min, r_max, f_min, f_max, m_min, m_max):
+            continue
+        rules.append((seg, r_min, r_max, f_min, f_max, m_min, m_max))
+    wb.close()
+    return compile_segment_rules(rules)
+
+
+def _scan_segment(r: int, f: int, m: int, rules: list[tuple]) -> int:
+    """اندیس اولین قاعده منطبق (len(rules) = Unclassified)."""
+    for i, (_, r_min, r_max, f_min, f_max, m_min, m_max) in enumerate(rules):
+        if r_min <= r <= r_max and f_min <= f <= f_max and m_min <= m <= m_max:
+            return i
+    return len(rules)
+
+
+def assign_segments(
+    r_scores: np.ndarray,
+    f_scores: np.ndarray,
+    m_scores: np.ndarray,
+    segment_rules: "SegmentLookup | list[tuple[str, int, int, int, int, int, int]]",
+) -> np.ndarray:
+    """
+    سگمنت هر کاربر با اندیس‌گذاری مستقیم در جدول lookup (اولین قاعده منطبق)؛
+    امتیاز منفی یا بزرگ‌تر از جدول با پیمایش همان قواعد.
+    """
+    lookup = segment_rules if isinstance(segment_rules, SegmentLookup) else compile_segment_rules(segment_rules)
+    size = lookup.table.shape[0]
+    inside = (r_scores >= 0) & (f_scores >= 0) & (m_scores >= 0)
+    inside &= (r_scores < size) & (f_scores < size) & (m_scores < size)
+    codes = np.empty(len(r_scores), dtype=np.int32)
+    codes[inside] = lookup.table[r_scores[inside], f_scores[inside], m_scores[inside]]
+    for i in np.flatnonzero(~inside).tolist():
+        codes[i] = _scan_segment(int(r_scores[i]), int(f_scores[i]), int(m_scores[i]), lookup.rules)
+    return lookup.names[codes]
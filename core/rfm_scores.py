@@ -0,0 +1,284 @@
+"""
+امتیاز R/F/M و سگمنت هر کاربر داخل دیتابیس.
+
+آستانه‌های rfm_constant (rfm_thresholds) و قواعد سگمنت (rfm_segment_rules) جدول هستند
+و جدول rfm_scores با یک کوئری از rfm_data ساخته می‌شود؛ rfm_scores.xlsx (یا 1_rfm_scores.xlsx, ...)
+فقط خروجی همین جدول است.
+قاعده امتیاز همان score_values در core.rfm_numpy است:
+- اولین بازه (به ترتیب min_value، max_value) که مقدار را در بر دارد
+- کمتر از کمینه اولین بازه / بیشتر از بیشینه آخرین بازه => امتیاز همان بازه
+- در غیر این صورت بازه با نزدیک‌ترین مرکز
+"""
+import time
+
+from core.db_manager import SQLiteManager
+from core.rfm_data import RFM_DATA_TABLE
+from core.user_full_data import USER_FULL_DATA_TABLE
+
+
+RFM_THRESHOLDS_TABLE = "rfm_thresholds"
+RFM_SEGMENT_RULES_TABLE = "rfm_segment_rules"
+RFM_SCORES_TABLE = "rfm_scores"
+
+# ستون‌های rfm_scores (همان ستون‌های فایل‌های rfm_scores)
+RFM_SCORES_COLUMNS = (
+    "user_id",
+    "r_score",
+    "f_score",
+    "m_score",
+    "rfm_score",
+    "segment",
+    "recency_days",
+    "total_orders",
+    "total_spent",
+    "last_order_amount",
+    "last_order_date",
+    "last_order_date_shamsi",
+)
+
+# position ترتیب بازه‌های هر معیار است (مرتب بر اساس min_value، max_value)
+CREATE_RFM_THRESHOLDS_SQL = f"""
+CREATE TABLE "{RFM_THRESHOLDS_TABLE}" (
+    metric TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    min_value REAL NOT NULL,
+    max_value REAL NOT NULL,
+    score INTEGER NOT NULL,
+    PRIMARY KEY (metric, position)
+) WITHOUT ROWID
+"""
+
+# priority ترتیب قواعد است؛ اولین قاعده منطبق سگمنت کاربر است
+CREATE_RFM_SEGMENT_RULES_SQL = f"""
+CREATE TABLE "{RFM_SEGMENT_RULES_TABLE}" (
+    priority INTEGER PRIMARY KEY,
+    segment TEXT NOT NULL,
+    r_min INTEGER NOT NULL,
+    r_max INTEGER NOT NULL,
+    f_min INTEGER NOT NULL,
+    f_max INTEGER NOT NULL,
+    m_min INTEGER NOT NULL,
+    m_max INTEGER NOT NULL,
+    description TEXT
+)
+"""
+
+
+def save_rfm_thresholds(db: SQLiteManager, rules: dict[str, list[tuple[float, float, int]]]) -> None:
+    """ذخیره آستانه‌ها ({metric: [(min, max, score), ...]}) در جدول rfm_thresholds (جایگزین قبلی)."""
+    db.execute(f'DROP TABLE IF EXISTS "{RFM_THRESHOLDS_TABLE}"')
+    db.execute(CREATE_RFM_THRESHOLDS_SQL)
+    db.conn.executemany(
+        f'INSERT INTO "{RFM_THRESHOLDS_TABLE}" (metric, position, min_value, max_value, score) VALUES (?, ?, ?, ?, ?)',
+        (
+            (metric, position, float(min_v), float(max_v), int(score))
+            for metric, metric_rules in rules.items()
+            for position, (min_v, max_v, score) in enumerate(sorted(metric_rules, key=lambda x: (x[0], x[1])))
+        ),
+    )
+
+
+def save_segment_rules(db: SQLiteManager, segment_rules: list[tuple]) -> None:
+    """
+    ذخیره قواعد سگمنت [(segment, r_min, r_max, f_min, f_max, m_min, m_max[, description]), ...]
+    به همان ترتیب در جدول rfm_segment_rules (جایگزین قبلی).
+    """
+    db.execute(f'DROP TABLE IF EXISTS "{RFM_SEGMENT_RULES_TABLE}"')
+    db.execute(CREATE_RFM_SEGMENT_RULES_SQL)
+    db.conn.executemany(
+        f"""INSERT INTO "{RFM_SEGMENT_RULES_TABLE}"
+        (priority, segment, r_min, r_max, f_min, f_max, m_min, m_max, description)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        (
+            (priority, *rule[:7], rule[7] if len(rule) > 7 else None)
+            for priority, rule in enumerate(segment_rules)
+        ),
+    )
+
+
+# کوتاه‌نام join هر معیار در CREATE_RFM_SCORES_SQL
+_SCORE_METRICS = {"recency_days": "r", "total_orders": "f", "total_spent": "m"}
+
+
+def _score_sql(metric: str, alias: str) -> str:
+    """
+    عبارت امتیاز یک معیار روی ستون هم‌نام rfm_data (d)؛ مقدار NULL => 0.
+    {alias}e تنها بازه edges است که v در (lower_bound, upper_bound] آن است؛ اگر min آن <= v باشد همان
+    اولین بازه در بر دارنده است. بقیه با مرزهای {alias}b و فقط برای مقدارهای بیرون از همه بازه‌ها با زیرکوئری
+    نزدیک‌ترین مرکز (SQLite ستون کوئری بیرونی را در ORDER BY زیرکوئری نمی‌پذیرد، پس با MIN).
+    """
+    value = f'CAST(d."{metric}" AS REAL)'
+    return f"""CASE
+            WHEN d."{metric}" IS NULL THEN 0
+            WHEN {alias}e.min_value <= {value} THEN {alias}e.score
+            WHEN {value} < {alias}b.first_min THEN {alias}b.first_score
+            WHEN {value} > {alias}b.last_max THEN {alias}b.last_score
+            ELSE (SELECT t.score FROM "{RFM_THRESHOLDS_TABLE}" t
+                  WHERE t.metric = '{metric}' AND abs({value} - (t.min_value + t.max_value) / 2) = (
+                    SELECT MIN(abs({value} - (n.min_value + n.max_value) / 2))
+                    FROM "{RFM_THRESHOLDS_TABLE}" n WHERE n.metric = '{metric}'
+                  ) ORDER BY t.position LIMIT 1)
+        END"""
+
+
+def _score_joins_sql() -> str:
+    """join مرزها (bounds) و range join بازه‌ها (edges) برای هر سه معیار."""
+    joins = []
+    for metric, alias in _SCORE_METRICS.items():
+        value = f'CAST(d."{metric}" AS REAL)'
+        joins.append(
+            f"""JOIN bounds {alias}b ON {alias}b.metric = '{metric}'
+    LEFT JOIN edges {alias}e ON {alias}e.metric = '{metric}'
+        AND {value} <= {alias}e.upper_bound
+        AND ({alias}e.lower_bound IS NULL OR {value} > {alias}e.lower_bound)"""
+        )
+    return "\n    ".join(joins)
+
+
+# امتیاز با range join به جای زیرکوئری‌های هم‌بسته برای هر کاربر (همان قاعده score_values):
+# - edges: بیشینه تجمعی max_value هر معیار به ترتیب position؛ اولین بازه با max >= v همان بازه‌ای است که
+#   v در (بیشینه تجمعی قبلی، بیشینه تجمعی خودش] باشد، پس هر مقدار حداکثر با یک ردیف join می‌شود
+# - bounds: min و امتیاز اولین بازه و max و امتیاز آخرین بازه هر معیار
+# - segments: سگمنت هر ترکیب متمایز (r, f, m) یک بار (اولین قاعده به ترتیب priority) و join با تساوی
+CREATE_RFM_SCORES_SQL = f"""
+CREATE TABLE "{RFM_SCORES_TABLE}" AS
+WITH edges AS (
+    SELECT
+        metric,
+        min_value,
+        score,
+        LAG(running_max) OVER (PARTITION BY metric ORDER BY position) AS lower_bound,
+        running_max AS upper_bound
+    FROM (
+        SELECT metric, position, min_value, score,
+            MAX(max_value) OVER (PARTITION BY metric ORDER BY position) AS running_max
+        FROM "{RFM_THRESHOLDS_TABLE}"
+    )
+),
+bounds AS (
+    SELECT
+        p.metric AS metric,
+        f.min_value AS first_min,
+        f.score AS first_score,
+        l.max_value AS last_max,
+        l.score AS last_score
+    FROM (
+        SELECT metric, MIN(position) AS first_position, MAX(position) AS last_position
+        FROM "{RFM_THRESHOLDS_TABLE}" GROUP BY metric
+    ) p
+    JOIN "{RFM_THRESHOLDS_TABLE}" f ON f.metric = p.metric AND f.position = p.first_position
+    JOIN "{RFM_THRESHOLDS_TABLE}" l ON l.metric = p.metric AND l.position = p.last_position
+),
+scored AS (
+    SELECT
+        d.rowid AS data_row,
+        d.user_id AS user_id,
+        {_score_sql("recency_days", "r")} AS r_score,
+        {_score_sql("total_orders", "f")} AS f_score,
+        {_score_sql("total_spent", "m")} AS m_score,
+        d.recency_days AS recency_days,
+        d.total_orders AS total_orders,
+        d.total_spent AS total_spent,
+        d.last_order_amount AS last_order_amount,
+        d.last_order_date AS last_order_date,
+        d.last_order_date_shamsi AS last_order_date_shamsi
+    FROM "{RFM_DATA_TABLE}" d
+    {_score_joins_sql()}
+),
+segments AS (
+    SELECT
+        c.r_score AS r_score,
+        c.f_score AS f_score,
+        c.m_score AS m_score,
+        COALESCE(
+            (SELECT g.segment FROM "{RFM_SEGMENT_RULES_TABLE}" g
+             WHERE c.r_score BETWEEN g.r_min AND g.r_max
+               AND c.f_score BETWEEN g.f_min AND g.f_max
+               AND c.m_score BETWEEN g.m_min AND g.m_max
+             ORDER BY g.priority LIMIT 1),
+            'Unclassified'
+        ) AS segment
+    FROM (SELECT DISTINCT r_score, f_score, m_score FROM scored) c
+)
+SELECT
+    s.user_id AS user_id,
+    s.r_score AS r_score,
+    s.f_score AS f_score,
+    s.m_score AS m_score,
+    s.r_score || s.f_score || s.m_score AS rfm_score,
+    g.segment AS segment,
+    s.recency_days AS recency_days,
+    s.total_orders AS total_orders,
+    s.total_spent AS total_spent,
+    s.last_order_amount AS last_order_amount,
+    s.last_order_date AS last_order_date,
+    s.last_order_date_shamsi AS last_order_date_shamsi
+FROM scored s
+JOIN segments g ON g.r_score = s.r_score AND g.f_score = s.f_score AND g.m_score = s.m_score
+ORDER BY s.data_row;
+"""
+
+
+def create_rfm_scores_table(db: SQLiteManager) -> tuple[bool, str | None]:
+    """
+    ساخت جدول rfm_scores از rfm_data با آستانه‌های rfm_thresholds و قواعد rfm_segment_rules
+    (هر سه معیار باید آستانه داشته باشند). خروجی: (موفق بود یا نه، پیام خطا یا None)
+    """
+    try:
+        metrics = {
+            row[0] for row in db.execute(f'SELECT DISTINCT metric FROM "{RFM_THRESHOLDS_TABLE}"').fetchall()
+        }
+        missing = [metric for metric in _SCORE_METRICS if metric not in metrics]
+        if missing:
+            return False, f"آستانه معیارهای {', '.join(missing)} در {RFM_THRESHOLDS_TABLE} نیست."
+        if not db._table_exists(RFM_SEGMENT_RULES_TABLE):
+            save_segment_rules(db, [])
+        db.execute(f'DROP TABLE IF EXISTS "{RFM_SCORES_TABLE}"')
+        started = time.perf_counter()
+        bytes_before = db.used_bytes()
+        db.executescript(CREATE_RFM_SCORES_SQL)
+        db.record_stats(
+            RFM_SCORES_TABLE,
+            db.new_table_row_count(RFM_SCORES_TABLE),
+            byte_size=db.used_bytes() - bytes_before,
+            build_seconds=time.perf_counter() - started,
+            kind="derived",
+        )
+        db.commit()
+        return True, None
+    except Exception as e:
+        return False, f"{type(e).__name__}: {e!s}"
+
+
+# ستون‌های تماس user_full_data در خروجی هر سگمنت: ستون منبع => نام ستون خروجی
+SEGMENT_CONTACT_COLUMNS = {
+    "display_name": "display_name",
+    "user_email": "email",
+    "digits_phone": "phone",
+}
+
+
+def segment_contacts_sql(db: SQLiteManager) -> str:
+    """
+    کوئری مشتریان امتیازدار rfm_scores با نام، ایمیل و موبایل از user_full_data (LEFT JOIN روی ID)
+    برای خروجی فایل هر سگمنت؛ ستون تماسی که در user_full_data نیست NULL است. ترتیب همان rfm_scores.
+    """
+    available = db._table_columns(USER_FULL_DATA_TABLE)
+    contacts = "".join(
+        f',\n    c."{source}" AS {name}' if source in available else f",\n    NULL AS {name}"
+        for source, name in SEGMENT_CONTACT_COLUMNS.items()
+    )
+    join = f'\nLEFT JOIN "{USER_FULL_DATA_TABLE}" c ON c.ID = s.user_id' if "ID" in available else ""
+    score_columns = "".join(f',\n    s."{col}" AS {col}' for col in RFM_SCORES_COLUMNS if col != "user_id")
+    return f"""SELECT
+    s.user_id AS user_id{contacts}{score_columns}
+FROM "{RFM_SCORES_TABLE}" s{join}
+ORDER BY s.rowid"""
+
+
+def get_rfm_scores_row_count(db: SQLiteManager) -> int:
+    """تعداد رکوردهای جدول rfm_scores (از _stats)."""
+    try:
+        return db.get_row_count(RFM_SCORES_TABLE)
+    except Exception:
+        return 0
@@ -1,100 +1,144 @@
 """
 ساخت جدول user_full_data از users + usermeta با ستون‌های تجمیعی.
 """
-from datetime import datetime
-
-import jdatetime
+import time
 
+from config import USER_META_PIVOT_KEYS
 from core.db_manager import SQLiteManager
+from core.duckdb_engine import DuckDBWorkspace, use_duckdb
+from core.jalali import register_shamsi_functions
 
 
 USER_FULL_DATA_TABLE = "user_full_data"
 
 
-def _to_shamsi(dt_text: str | None) -> str:
-    """تبدیل datetime میلادی (YYYY-MM-DD HH:MM:SS) به تاریخ شمسی."""
-    if not dt_text:
-        return ""
-    try:
-        dt = datetime.strptime(dt_text, "%Y-%m-%d %H:%M:%S")
-    except Exception:
-        return ""
-    jdt = jdatetime.datetime.fromgregorian(datetime=dt)
-    return jdt.strftime("%Y/%m/%d %H:%M:%S")
+# ستون‌هایی که فقط در صورت وجود جداول avanse در خروجی می‌آیند
+AVANS_META_KEYS = ("avans_user_score", "avans_user_score_valid")
+
+# نام ستون خروجی برای meta_keyهایی که نامشان در خروجی فرق دارد (حفظ سازگاری با فایل‌های قبلی)
+_OUTPUT_COLUMN_NAMES = {"billing_first_name": "illing_first_name"}
+
+# ایندکس (meta_key, user_id) برای خواندن فقط ردیف‌های کلیدهای خواسته‌شده از usermeta
+USERMETA_PIVOT_INDEX = "idx_usermeta_meta_key_user_id"
+
+
+# جدول موقت نتیجه پیوت usermeta وقتی پیوت در DuckDB اجرا می‌شود
+_META_PIVOT_TABLE = "_user_meta_pivot"
+
+
+def _sql_literal(value: str) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _pivot_select_columns(meta_keys: list[str], has_avans_tables: bool) -> list[str]:
+    """
+    ستون‌های SELECT نهایی برای هر meta_key پیوت‌شده (با نرمال‌سازی تلفن و تاریخ شمسی).
+    کاربری که فقط meta بی‌ربط دارد در پیوت فیلترشده ردیفی ندارد؛ digits_phone او مثل پیوت کامل قبلی ''
+    است (کاربر بدون هیچ meta => NULL) و بقیه ستون‌ها مثل قبل NULL می‌مانند.
+    """
+    columns = []
+    for key in meta_keys:
+        if key in AVANS_META_KEYS and not has_avans_tables:
+            continue
+        if key == "digits_phone":
+            columns.append(
+                """CASE
+        WHEN p.user_id IS NULL THEN (SELECT '' FROM usermeta m WHERE m.user_id = u.ID LIMIT 1)
+        WHEN p.digits_phone_clean = '' THEN ''
+        WHEN p.digits_phone_clean LIKE '0098%' THEN '0' || substr(p.digits_phone_clean, 5)
+        WHEN p.digits_phone_clean LIKE '98%' THEN '0' || substr(p.digits_phone_clean, 3)
+        WHEN p.digits_phone_clean LIKE '9%' THEN '0' || p.digits_phone_clean
+        WHEN p.digits_phone_clean LIKE '0%' THEN p.digits_phone_clean
+        ELSE p.digits_phone_clean
+    END AS digits_phone"""
+            )
+            continue
+        alias = _OUTPUT_COLUMN_NAMES.get(key, key)
+        columns.append(f'p."{key}" AS "{alias}"')
+        if key == "wc_last_active":
+            columns.append('unix_to_shamsi(p."wc_last_active") AS wc_last_active_shamsi')
+    return columns
 
 
-def _unix_to_shamsi(ts_value) -> str:
-    """تبدیل unix timestamp (ثانیه) به تاریخ شمسی."""
-    if ts_value is None:
-        return ""
+def _pivot_meta_duckdb(db: SQLiteManager, meta_sql: str, key_list: str) -> str | None:
+    """
+    اجرای پیوت usermeta در DuckDB (core.duckdb_engine) و نوشتن نتیجه در جدول موقت SQLite.
+    برمی‌گرداند SELECT جایگزین CTE meta، یا None اگر DuckDB خطا داد (همان پیوت در SQLite اجرا می‌شود).
+    """
     try:
-        ts_int = int(str(ts_value).strip())
-        dt = datetime.utcfromtimestamp(ts_int)
+        with DuckDBWorkspace(db) as ws:
+            ws.load("usermeta", f"meta_key IN ({key_list})")
+            columns = [desc[0] for desc in ws.con.execute(f"SELECT * FROM ({meta_sql}) LIMIT 0").description]
+            # user_id مثل usermeta.user_id از نوع INTEGER (برای ایندکس join)؛ بقیه بدون نوع (بدون affinity)
+            # تا مقدارها مثل خروجی MAX در SQLite بمانند
+            col_list = ", ".join(f'"{c}" INTEGER' if c == "user_id" else f'"{c}"' for c in columns)
+            db.execute(f'DROP TABLE IF EXISTS temp."{_META_PIVOT_TABLE}"')
+            db.execute(f'CREATE TEMP TABLE "{_META_PIVOT_TABLE}" ({col_list})')
+            ws.write_rows(meta_sql, _META_PIVOT_TABLE, columns)
+        db.execute(f'CREATE INDEX temp."idx{_META_PIVOT_TABLE}_user_id" ON "{_META_PIVOT_TABLE}" (user_id)')
+        return f'\n    SELECT * FROM temp."{_META_PIVOT_TABLE}"\n'
     except Exception:
-        return ""
-    jdt = jdatetime.datetime.fromgregorian(datetime=dt)
-    return jdt.strftime("%Y/%m/%d %H:%M:%S")
+        db.conn.rollback()
+        return None
 
 
-def create_user_full_data_table(db: SQLiteManager) -> bool:
+def create_user_full_data_table(
+    db: SQLiteManager, meta_keys: list[str] | None = None, engine: str | None = None
+) -> bool:
     """
     جدول user_full_data را ایجاد می‌کند.
-    - Pivot از usermeta برای meta_keyهای خواسته‌شده
+    - Pivot از usermeta فقط برای meta_keyهای خواسته‌شده (USER_META_PIVOT_KEYS در config)
+      با ایندکس (meta_key, user_id)؛ ردیف‌های بی‌ربط usermeta خوانده نمی‌شوند
     - نرمال‌سازی digits_phone
     - افزودن user_registered_timestamp و user_registered_shamsi
+    engine="duckdb" (یا None و DERIVED_ENGINE="duckdb" در config): پیوت usermeta در DuckDB اجرا می‌شود.
     """
     try:
-        db.conn.create_function("to_shamsi", 1, _to_shamsi)
-        db.conn.create_function("unix_to_shamsi", 1, _unix_to_shamsi)
+        register_shamsi_functions(db)
+
+        keys = list(dict.fromkeys(meta_keys if meta_keys is not None else USER_META_PIVOT_KEYS))
 
         tables = set(db.get_tables())
         has_avans_tables = {"avans_log_score", "avans_log_refs"}.issubset(tables)
 
-        avans_cols = ""
-        if has_avans_tables:
-            avans_cols = """
-    ,p.avans_user_score AS avans_user_score
-    ,p.avans_user_score_valid AS avans_user_score_valid
+        db._create_index_if_possible(USERMETA_PIVOT_INDEX, "usermeta", ["meta_key", "user_id"])
+        indexed_by = f' INDEXED BY "{USERMETA_PIVOT_INDEX}"' if db._index_exists(USERMETA_PIVOT_INDEX) else ""
+
+        pivot_cols = "".join(
+            f',\n        MAX(CASE WHEN meta_key = {_sql_literal(k)} THEN meta_value END) AS "{k}"'
+            for k in keys
+            if k != "digits_phone"
+        )
+        if "digits_phone" in keys:
+            pivot_cols += ",\n        MAX(CASE WHEN meta_key = 'digits_phone' THEN meta_value END) AS digits_phone_raw"
+        key_list = ", ".join(_sql_literal(k) for k in keys) or "NULL"
+        phone_clean = ""
+        if "digits_phone" in keys:
+            phone_clean = """,
+        TRIM(
+            REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(COALESCE(digits_phone_raw, ''), '+', ''), ' ', ''), '-', ''), '(', ''), ')', '')
+        ) AS digits_phone_clean"""
+        meta_cols = "".join(f',\n        "{k}"' for k in keys if k != "digits_phone")
+        select_cols = "".join(f",\n    {c}" for c in _pivot_select_columns(keys, has_avans_tables))
+
+        meta_sql = f"""
+    SELECT
+        user_id{pivot_cols}
+    FROM usermeta{indexed_by}
+    WHERE meta_key IN ({key_list})
+    GROUP BY user_id
 """
+        started = time.perf_counter()
+        bytes_before = db.used_bytes()
+        if use_duckdb(engine):
+            meta_sql = _pivot_meta_duckdb(db, meta_sql.replace(indexed_by, ""), key_list) or meta_sql
 
         sql = f"""
-DROP TABLE IF EXISTS "{USER_FULL_DATA_TABLE}";
 CREATE TABLE "{USER_FULL_DATA_TABLE}" AS
-WITH meta AS (
-    SELECT
-        user_id,
-        MAX(CASE WHEN meta_key = 'nickname' THEN meta_value END) AS nickname,
-        MAX(CASE WHEN meta_key = 'first_name' THEN meta_value END) AS first_name,
-        MAX(CASE WHEN meta_key = 'last_name' THEN meta_value END) AS last_name,
-        MAX(CASE WHEN meta_key = 'billing_first_name' THEN meta_value END) AS billing_first_name,
-        MAX(CASE WHEN meta_key = 'billing_last_name' THEN meta_value END) AS billing_last_name,
-        MAX(CASE WHEN meta_key = 'billing_state' THEN meta_value END) AS billing_state,
-        MAX(CASE WHEN meta_key = 'billing_city' THEN meta_value END) AS billing_city,
-        MAX(CASE WHEN meta_key = 'digits_phone' THEN meta_value END) AS digits_phone_raw,
-        MAX(CASE WHEN meta_key = 'paying_customer' THEN meta_value END) AS paying_customer,
-        MAX(CASE WHEN meta_key = 'wc_last_active' THEN meta_value END) AS wc_last_active,
-        MAX(CASE WHEN meta_key = 'avans_user_score' THEN meta_value END) AS avans_user_score,
-        MAX(CASE WHEN meta_key = 'avans_user_score_valid' THEN meta_value END) AS avans_user_score_valid
-    FROM usermeta
-    GROUP BY user_id
-),
+WITH meta AS ({meta_sql}),
 phone_norm AS (
     SELECT
-        user_id,
-        nickname,
-        first_name,
-        last_name,
-        billing_first_name,
-        billing_last_name,
-        billing_state,
-        billing_city,
-        paying_customer,
-        wc_last_active,
-        avans_user_score,
-        avans_user_score_valid,
-        TRIM(
-            REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(COALESCE(digits_phone_raw, ''), '+', ''), ' ', ''), '-', ''), '(', ''), ')', '')
-        ) AS digits_phone_clean
+        user_id{meta_cols}{phone_clean}
     FROM meta
 )
 SELECT
@@ -102,30 +146,20 @@ SELECT
     u.user_email AS user_email,
     CAST(strftime('%s', u.user_registered) AS INTEGER) AS user_registered_timestamp,
     to_shamsi(u.user_registered) AS user_registered_shamsi,
-    u.display_name AS display_name,
-    p.nickname AS nickname,
-    p.first_name AS first_name,
-    p.last_name AS last_name,
-    p.billing_first_name AS illing_first_name,
-    p.billing_last_name AS billing_last_name,
-    p.billing_state AS billing_state,
-    p.billing_city AS billing_city,
-    CASE
-        WHEN p.digits_phone_clean = '' THEN ''
-        WHEN p.digits_phone_clean LIKE '0098%' THEN '0' || substr(p.digits_phone_clean, 5)
-        WHEN p.digits_phone_clean LIKE '98%' THEN '0' || substr(p.digits_phone_clean, 3)
-        WHEN p.digits_phone_clean LIKE '9%' THEN '0' || p.digits_phone_clean
-        WHEN p.digits_phone_clean LIKE '0%' THEN p.digits_phone_clean
-        ELSE p.digits_phone_clean
-    END AS digits_phone,
-    p.paying_customer AS paying_customer,
-    p.wc_last_active AS wc_last_active,
-    unix_to_shamsi(p.wc_last_active) AS wc_last_active_shamsi
-    {avans_cols}
+    u.display_name AS display_name{select_cols}
 FROM users u
 LEFT JOIN phone_norm p ON p.user_id = u.ID;
 """
+        db.execute(f'DROP TABLE IF EXISTS "{USER_FULL_DATA_TABLE}"')
         db.executescript(sql)
+        db.execute(f'DROP TABLE IF EXISTS temp."{_META_PIVOT_TABLE}"')
+        db.record_stats(
+            USER_FULL_DATA_TABLE,
+            db.new_table_row_count(USER_FULL_DATA_TABLE),
+            byte_size=db.used_bytes() - bytes_before,
+            build_seconds=time.perf_counter() - started,
+            kind="derived",
+        )
         db.commit()
         return True
     except Exception:
@@ -133,9 +167,8 @@ LEFT JOIN phone_norm p ON p.user_id = u.ID;
 
 
 def get_user_full_data_row_count(db: SQLiteManager) -> int:
-    """تعداد رکوردهای جدول user_full_data."""
+    """تعداد رکوردهای جدول user_full_data (از _stats)."""
     try:
-        cursor = db.execute(f'SELECT COUNT(*) FROM "{USER_FULL_DATA_TABLE}"')
-        return cursor.fetchone()[0]
+        return db.get_row_count(USER_FULL_DATA_TABLE)
     except Exception:
         return 0
@@ -1,30 +1,102 @@
 """جریان‌های کاری: وارد کردن داده جدید و استفاده از دادهٔ موجود."""
-import shutil
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import islice
 from pathlib import Path
 
 import jdatetime
+import numpy as np
+import pandas as pd
 from bidi.algorithm import get_display
-from openpyxl import Workbook, load_workbook
-
-from config import DUMP_DIR, OUTPUT_DIR, SQLITE_DB_PATH, TABLE_GROUPS
+from openpyxl import load_workbook
+
+from config import (
+    BATCH_MAX_WORKERS,
+    BATCH_WORKER_MEMORY_MB,
+    DERIVED_ENGINE,
+    DUMP_DIR,
+    EXPORT_FETCH_ROWS,
+    EXPORT_FORMAT,
+    OUTPUT_DIR,
+    RFM_INCREMENTAL,
+    RFM_QUANTILE_MODE,
+    RFM_SEGMENT_EXPORT,
+    TABLE_GROUPS,
+    WORKSPACE_DIR,
+)
 from core.customer_purchases import (
     CUSTOMER_PURCHASES_VIEW,
     create_customer_purchases_view,
     get_customer_purchases_row_count,
 )
-from core.db_manager import SQLiteManager
+from core.db_manager import DBSession
+from core.dim_date import (
+    DIM_DATE_TABLE,
+    SALES_BY_SHAMSI_MONTH_TABLE,
+    create_dim_date_table,
+    create_sales_by_shamsi_month_table,
+    get_dim_date_row_count,
+    get_sales_by_shamsi_month_row_count,
+)
+from core.duckdb_engine import duckdb_available
 from core.dump_reader import DumpReader
-from core.excel_exporter import ExcelExporter
+from core.excel_exporter import (
+    EXPORT_FORMATS,
+    ExcelExporter,
+    export_format_available,
+    open_chunked_xlsx,
+    resolve_export_format,
+)
 from core.importer import DumpImporter
-from core.rfm_charts import build_rfm_charts, _load_segment_rules
-from core.rfm_constants import create_rfm_constant_excel
-from core.rfm_data import RFM_DATA_TABLE, create_rfm_data_table, get_rfm_data_row_count
+from core.rfm_charts import (
+    build_rfm_charts,
+    compact_scores_frame,
+    concat_scores_frames,
+)
+from core.rfm_constants import create_combined_rfm_constant_excel, create_rfm_constant_excel
+from core.rfm_data import (
+    RFM_DATA_TABLE,
+    create_rfm_data_table,
+    get_rfm_data_row_count,
+    get_rfm_state,
+    seed_rfm_state,
+)
+from core.rfm_numpy import (
+    SegmentLookup,
+    ThresholdEdges,
+    assign_segments,
+    compile_thresholds,
+    load_segment_rules,
+    load_thresholds,
+    score_values,
+    to_float,
+)
+from core.rfm_scores import (
+    RFM_SCORES_COLUMNS,
+    RFM_SCORES_TABLE,
+    create_rfm_scores_table,
+    get_rfm_scores_row_count,
+    save_rfm_thresholds,
+    save_segment_rules,
+    segment_contacts_sql,
+)
 from core.user_full_data import (
     USER_FULL_DATA_TABLE,
     create_user_full_data_table,
     get_user_full_data_row_count,
 )
-from utils.helpers import create_output_folder, write_output_readme
+from utils.helpers import (
+    create_output_folder,
+    create_workspace_db,
+    find_chunk_files,
+    find_output_folders,
+    is_output_folder_locked,
+    remove_workspace_db,
+    site_identity,
+    unlock_output_folder,
+    write_output_readme,
+)
 
 
 def rtl(text: str) -> str:
@@ -88,7 +160,25 @@ def _ask_rfm_base_date() -> str:
             return "0"
 
 
-def run_import_new_data() -> None:
+def _ask_export_format() -> str:
+    """قالب خروجی جداول در این اجرا؛ Enter = EXPORT_FORMAT در config."""
+    formats = [f for f in EXPORT_FORMATS if export_format_available(f)]
+    print(rtl("\nقالب خروجی جداول:"))
+    for i, fmt in enumerate(formats, start=1):
+        print(rtl(f"  {i}) {fmt}{EXPORT_FORMATS[fmt]}"))
+    while True:
+        try:
+            choice = input(rtl(f"\nانتخاب (Enter = {resolve_export_format()}):  ")).strip()
+            if not choice:
+                return resolve_export_format()
+            if choice.isdigit() and 1 <= int(choice) <= len(formats):
+                return formats[int(choice) - 1]
+            print(rtl("شماره نامعتبر است."))
+        except (KeyboardInterrupt, EOFError):
+            return resolve_export_format()
+
+
+def run_import_new_data() -> Path | None:
     """وارد کردن دامپ جدید، ساخت viewها، خروجی Excel و کپی دیتابیس به پوشه خروجی."""
     rfm_from_shamsi_date = _ask_rfm_base_date()
     if str(rfm_from_shamsi_date).strip() and str(rfm_from_shamsi_date).strip() != "0":
@@ -96,154 +186,321 @@ def run_import_new_data() -> None:
     else:
         print(rtl("مبنای محاسبات RFM (شمسی): از ابتدا"))
 
-    # ۱. خالی کردن دیتابیس موقت
-    with SQLiteManager(SQLITE_DB_PATH) as db:
-        dropped = db.clear_all_tables()
-    print(rtl(f"\nدیتابیس موقت خالی شد ({dropped} جدول حذف شد)."))
-
     dump_path = select_dump_file()
     if not dump_path:
-        return
+        return None
+    return process_dump(dump_path, rfm_from_shamsi_date, export_format=_ask_export_format())
 
-    reader = DumpReader()
-    info = reader.get_info(dump_path)
-    print(rtl(f"\nفایل انتخاب شده: {info['name']}"))
-    print(rtl(f"حجم: {info['size_mb']} MB"))
-    print(rtl(f"فشرده: {'بله' if info['compressed'] else 'خیر'}"))
 
-    prefix = reader.detect_prefix(dump_path)
-    if prefix:
-        print(rtl(f"پیشوند تشخیص داده شده: '{prefix}'"))
-    else:
-        print(rtl("پیشوندی تشخیص داده نشد."))
-
-    complete_groups = reader.get_complete_groups(dump_path, prefix) if TABLE_GROUPS else []
-    if TABLE_GROUPS:
-        print(rtl("\nبررسی لیست‌ها:"))
-        for group_name in TABLE_GROUPS:
-            status = "detect" if group_name in complete_groups else "not found"
-            print(rtl(f"{group_name}: {status}"))
-
-    if complete_groups:
-        print(rtl("\nدر حال وارد کردن جداول به دیتابیس موقت..."))
-        importer = DumpImporter(SQLITE_DB_PATH)
-        result = importer.import_complete_groups(dump_path, complete_groups, prefix)
-        print(rtl(f"  جداول ایجاد شده: {result['tables_created']}"))
-        print(rtl(f"  دستورات INSERT اجرا شده: {result['inserts_count']}"))
-        if result["errors"]:
-            print(rtl("  خطاها:"))
-            for err in result["errors"][:5]:
-                print(rtl(f"    - {err}"))
-            if len(result["errors"]) > 5:
-                print(rtl(f"    ... و {len(result['errors']) - 5} خطای دیگر"))
-
-    table_row_counts: dict[str, int] = {}
-    if complete_groups:
-        with SQLiteManager(SQLITE_DB_PATH) as db:
-            idx_result = db.ensure_recommended_indexes()
-            if idx_result["created"] > 0:
-                print(rtl(f"  ایندکس‌های پیشنهادی ایجاد شد ({idx_result['created']} مورد)."))
-            table_row_counts = db.get_table_row_counts()
-
-            if "wp" in complete_groups:
-                if create_customer_purchases_view(db):
-                    count = get_customer_purchases_row_count(db)
-                    table_row_counts[CUSTOMER_PURCHASES_VIEW] = count
-                    print(rtl(f"  جدول اطلاعات خرید مشتری ایجاد شد ({count} رکورد)."))
-                else:
-                    print(rtl("  خطا در ایجاد جدول اطلاعات خرید مشتری."))
+def _quiet(*_args, **_kwargs) -> None:
+    """log خاموش برای workerهای حالت گروهی."""
 
-                if create_user_full_data_table(db):
-                    count = get_user_full_data_row_count(db)
-                    table_row_counts[USER_FULL_DATA_TABLE] = count
-                    print(rtl(f"  جدول user_full_data ایجاد شد ({count} رکورد)."))
-                else:
-                    print(rtl("  خطا در ایجاد جدول user_full_data."))
 
-                if create_rfm_data_table(db, from_shamsi_date=rfm_from_shamsi_date):
-                    count = get_rfm_data_row_count(db)
-                    table_row_counts[RFM_DATA_TABLE] = count
-                    if str(rfm_from_shamsi_date).strip() and str(rfm_from_shamsi_date).strip() != "0":
-                        print(rtl(f"  جدول rfm_data ایجاد شد ({count} رکورد) - از تاریخ شمسی {rfm_from_shamsi_date}."))
+def process_dump(
+    dump_path: str | Path, rfm_from_shamsi_date: str = "0", log=print, export_format: str | None = None
+) -> Path | None:
+    """
+    پردازش کامل یک دامپ بدون تعامل با کاربر.
+    export_format: قالب خروجی جداول (xlsx / csv / parquet / arrow؛ None = EXPORT_FORMAT در config).
+    هر اجرا دیتابیس موقت (workspace) مخصوص خودش را دارد و پوشه خروجی تا پایان کار قفل می‌ماند،
+    پس چند اجرا هم‌زمان روی هم اثر نمی‌گذارند. برمی‌گرداند پوشه خروجی یا None.
+    """
+    requested_format = str(export_format or EXPORT_FORMAT).strip().lower()
+    export_format = resolve_export_format(requested_format)
+    if export_format != requested_format:
+        log(rtl(f"قالب خروجی {requested_format} در دسترس نیست (pyarrow نصب نیست؟)؛ خروجی {export_format} ساخته می‌شود."))
+    workspace_db = create_workspace_db(WORKSPACE_DIR, Path(dump_path).stem)
+    output_folder = None
+    try:
+        # یک اتصال مشترک برای کل جریان: import، ساخت جداول مشتق و همه خروجی‌ها
+        with DBSession(workspace_db) as session:
+            log(rtl(f"\nدیتابیس موقت این اجرا: {workspace_db.name}"))
+
+            reader = DumpReader()
+            info = reader.get_info(dump_path)
+            log(rtl(f"\nفایل انتخاب شده: {info['name']}"))
+            log(rtl(f"حجم: {info['size_mb']} MB"))
+            log(rtl(f"فشرده: {'بله' if info['compressed'] else 'خیر'}"))
+
+            prefix = reader.detect_prefix(dump_path)
+            if prefix:
+                log(rtl(f"پیشوند تشخیص داده شده: '{prefix}'"))
+            else:
+                log(rtl("پیشوندی تشخیص داده نشد."))
+
+            complete_groups = reader.get_complete_groups(dump_path, prefix) if TABLE_GROUPS else []
+            site_url = None
+            if TABLE_GROUPS:
+                log(rtl("\nبررسی لیست‌ها:"))
+                for group_name in TABLE_GROUPS:
+                    status = "detect" if group_name in complete_groups else "not found"
+                    log(rtl(f"{group_name}: {status}"))
+
+            if complete_groups:
+                log(rtl("\nدر حال وارد کردن جداول به دیتابیس موقت..."))
+                importer = DumpImporter(workspace_db, session=session)
+                result = importer.import_complete_groups(dump_path, complete_groups, prefix)
+                site_url = result["site_url"]
+                log(rtl(f"  جداول ایجاد شده: {result['tables_created']}"))
+                log(rtl(f"  دستورات INSERT اجرا شده: {result['inserts_count']}"))
+                if result["errors"]:
+                    log(rtl("  خطاها:"))
+                    for err in result["errors"][:5]:
+                        log(rtl(f"    - {err}"))
+                    if len(result["errors"]) > 5:
+                        log(rtl(f"    ... و {len(result['errors']) - 5} خطای دیگر"))
+
+            folder_name = prefix.rstrip("_") if prefix else "output"
+            site_id = site_identity(info["name"], site_url)
+            table_row_counts: dict[str, int] = {}
+            if complete_groups:
+                idx_result = session.ensure_recommended_indexes()
+                if idx_result["created"] > 0:
+                    log(rtl(f"  ایندکس‌های پیشنهادی ایجاد شد ({idx_result['created']} مورد)."))
+                table_row_counts = session.get_table_row_counts()
+
+                if "wp" in complete_groups:
+                    if DERIVED_ENGINE == "duckdb":
+                        if duckdb_available():
+                            log(rtl("  جداول مشتق با موتور ستونی DuckDB ساخته می‌شوند."))
+                        else:
+                            log(rtl("  پکیج duckdb نصب نیست؛ جداول مشتق با SQLite ساخته می‌شوند."))
+                    if create_customer_purchases_view(session):
+                        count = get_customer_purchases_row_count(session)
+                        table_row_counts[CUSTOMER_PURCHASES_VIEW] = count
+                        log(rtl(f"  جدول اطلاعات خرید مشتری ایجاد شد ({count} رکورد)."))
+                    else:
+                        log(rtl("  خطا در ایجاد جدول اطلاعات خرید مشتری."))
+
+                    if create_user_full_data_table(session):
+                        count = get_user_full_data_row_count(session)
+                        table_row_counts[USER_FULL_DATA_TABLE] = count
+                        log(rtl(f"  جدول user_full_data ایجاد شد ({count} رکورد)."))
+                    else:
+                        log(rtl("  خطا در ایجاد جدول user_full_data."))
+
+                    if RFM_INCREMENTAL:
+                        # آمار RFM آخرین خروجی همین سایت (نه هر سایتی با همان پیشوند) تا فقط سفارش‌های جدید ادغام شوند
+                        for previous in find_output_folders(OUTPUT_DIR, folder_name):
+                            if seed_rfm_state(session, previous / "converted.db", site_id):
+                                log(rtl(f"  آمار RFM قبلی از {previous.name} برداشته شد."))
+                                break
+
+                    if create_rfm_data_table(session, from_shamsi_date=rfm_from_shamsi_date, site_id=site_id):
+                        count = get_rfm_data_row_count(session)
+                        table_row_counts[RFM_DATA_TABLE] = count
+                        state = get_rfm_state(session) or {}
+                        if state.get("mode") == "incremental":
+                            log(rtl(f"  به‌روزرسانی افزایشی RFM: {state['merged_users']} کاربر با سفارش جدید."))
+                        if str(rfm_from_shamsi_date).strip() and str(rfm_from_shamsi_date).strip() != "0":
+                            log(rtl(f"  جدول rfm_data ایجاد شد ({count} رکورد) - از تاریخ شمسی {rfm_from_shamsi_date}."))
+                        else:
+                            log(rtl(f"  جدول rfm_data ایجاد شد ({count} رکورد) - بدون فیلتر تاریخ."))
                     else:
-                        print(rtl(f"  جدول rfm_data ایجاد شد ({count} رکورد) - بدون فیلتر تاریخ."))
+                        log(rtl("  خطا در ایجاد جدول rfm_data."))
+
+                    if create_dim_date_table(session):
+                        count = get_dim_date_row_count(session)
+                        table_row_counts[DIM_DATE_TABLE] = count
+                        log(rtl(f"  جدول dim_date ایجاد شد ({count} روز)."))
+                        if create_sales_by_shamsi_month_table(session):
+                            count = get_sales_by_shamsi_month_row_count(session)
+                            table_row_counts[SALES_BY_SHAMSI_MONTH_TABLE] = count
+                            log(rtl(f"  جدول sales_by_shamsi_month ایجاد شد ({count} ماه)."))
+                        else:
+                            log(rtl("  خطا در ایجاد جدول sales_by_shamsi_month."))
+                    else:
+                        log(rtl("  خطا در ایجاد جدول dim_date."))
+
+            output_folder = create_output_folder(OUTPUT_DIR, folder_name, lock=True)
+            generated_files: list[str] = []
+            exporter = ExcelExporter(session, output_folder)
+            file_label = "فایل Excel" if export_format == "xlsx" else "فایل خروجی"
+
+            if CUSTOMER_PURCHASES_VIEW in table_row_counts:
+                headers = [
+                    "شناسه کاربر",
+                    "نام کاربر",
+                    "ایمیل",
+                    "شماره موبایل",
+                    "شناسه سفارش",
+                    "تاریخ خرید",
+                    "مبلغ خرید",
+                    "وضعیت سفارش",
+                ]
+                paths = exporter.export_view(
+                    CUSTOMER_PURCHASES_VIEW,
+                    output_base_name="user_orders",
+                    export_format=export_format,
+                    column_headers=headers,
+                )
+                for p in paths:
+                    log(rtl(f"{file_label}: {p.name}"))
+                    generated_files.append(p.name)
+
+            if USER_FULL_DATA_TABLE in table_row_counts:
+                paths = exporter.export_view(
+                    USER_FULL_DATA_TABLE,
+                    output_base_name="user_full_data",
+                    export_format=export_format,
+                )
+                for p in paths:
+                    log(rtl(f"{file_label}: {p.name}"))
+                    generated_files.append(p.name)
+
+            if RFM_DATA_TABLE in table_row_counts:
+                paths = exporter.export_view(
+                    RFM_DATA_TABLE,
+                    output_base_name="rfm_data",
+                    export_format=export_format,
+                    column_formats={
+                        "total_spent": "#,##0",
+                        "last_order_amount": "#,##0",
+                    },
+                )
+                for p in paths:
+                    log(rtl(f"{file_label}: {p.name}"))
+                    generated_files.append(p.name)
+
+                # ساخت فایل ثابت‌ها/لیبل‌های پیشنهادی RFM برای استفاده کاربر و مراحل بعد
+                const_path = create_rfm_constant_excel(session, output_folder)
+                log(rtl(f"فایل Excel: {const_path.name}"))
+                generated_files.append(const_path.name)
+
+                # امتیاز و سگمنت هر کاربر با آستانه‌های همین rfm_constant (جدول rfm_scores در converted.db)
+                scores_ok, scores_err = create_rfm_scores_table(session)
+                if scores_ok:
+                    log(rtl(f"  جدول rfm_scores ایجاد شد ({get_rfm_scores_row_count(session)} رکورد)."))
+                    # rfm_scores.xlsx در مرحله ۲ ساخته می‌شود؛ قالب‌های دیگر همین‌جا از جدول
+                    if export_format != "xlsx":
+                        for p in exporter.export_view(RFM_SCORES_TABLE, "rfm_scores", export_format=export_format):
+                            log(rtl(f"{file_label}: {p.name}"))
+                            generated_files.append(p.name)
+                    if RFM_SEGMENT_EXPORT:
+                        segment_files = _export_segment_files(session, output_folder, export_format, log)
+                        generated_files.extend(segment_files)
                 else:
-                    print(rtl("  خطا در ایجاد جدول rfm_data."))
-
-    folder_name = prefix.rstrip("_") if prefix else "output"
-    output_folder = create_output_folder(OUTPUT_DIR, folder_name)
-    generated_files: list[str] = []
-
-    if CUSTOMER_PURCHASES_VIEW in table_row_counts:
-        headers = [
-            "شناسه کاربر",
-            "نام کاربر",
-            "ایمیل",
-            "شماره موبایل",
-            "شناسه سفارش",
-            "تاریخ خرید",
-            "مبلغ خرید",
-            "وضعیت سفارش",
-        ]
-        with SQLiteManager(SQLITE_DB_PATH) as db:
-            exporter = ExcelExporter(db, output_folder)
-            paths = exporter.export_view_chunked(
-                CUSTOMER_PURCHASES_VIEW,
-                output_base_name="user_orders",
-                column_headers=headers,
-            )
-            for p in paths:
-                print(rtl(f"فایل Excel: {p.name}"))
-                generated_files.append(p.name)
-
-    if USER_FULL_DATA_TABLE in table_row_counts:
-        with SQLiteManager(SQLITE_DB_PATH) as db:
-            exporter = ExcelExporter(db, output_folder)
-            paths = exporter.export_view_chunked(
-                USER_FULL_DATA_TABLE,
-                output_base_name="user_full_data",
-            )
-            for p in paths:
-                print(rtl(f"فایل Excel: {p.name}"))
-                generated_files.append(p.name)
-
-    if RFM_DATA_TABLE in table_row_counts:
-        with SQLiteManager(SQLITE_DB_PATH) as db:
-            exporter = ExcelExporter(db, output_folder)
-            paths = exporter.export_view_chunked(
-                RFM_DATA_TABLE,
-                output_base_name="rfm_data",
-                column_formats={
-                    "total_spent": "#,##0",
-                    "last_order_amount": "#,##0",
-                },
-            )
-            for p in paths:
-                print(rtl(f"فایل Excel: {p.name}"))
-                generated_files.append(p.name)
-
-            # ساخت فایل ثابت‌ها/لیبل‌های پیشنهادی RFM برای استفاده کاربر و مراحل بعد
-            const_path = create_rfm_constant_excel(db, output_folder)
-            print(rtl(f"فایل Excel: {const_path.name}"))
-            generated_files.append(const_path.name)
-
-    # کپی دیتابیس موقت به پوشه خروجی
-    dest_db = output_folder / "converted.db"
-    shutil.copy2(SQLITE_DB_PATH, dest_db)
-    print(rtl(f"کپی دیتابیس به پوشه خروجی: {dest_db.name}"))
-
-    write_output_readme(
-        output_folder,
-        info["name"],
-        info["size_mb"],
-        complete_groups=complete_groups,
-        table_groups=TABLE_GROUPS,
-        table_row_counts=table_row_counts,
-        rfm_from_shamsi_date=rfm_from_shamsi_date,
-        excel_files=generated_files,
+                    log(rtl(f"  خطا در ایجاد جدول rfm_scores: {scores_err}"))
+
+            table_stats = session.get_stats()
+
+            # کپی دیتابیس موقت به پوشه خروجی (با backup API، شامل تغییرات WAL)
+            dest_db = session.backup_to(output_folder / "converted.db")
+            log(rtl(f"کپی دیتابیس به پوشه خروجی: {dest_db.name}"))
+
+        write_output_readme(
+            output_folder,
+            info["name"],
+            info["size_mb"],
+            complete_groups=complete_groups,
+            table_groups=TABLE_GROUPS,
+            table_row_counts=table_row_counts,
+            rfm_from_shamsi_date=rfm_from_shamsi_date,
+            excel_files=generated_files,
+            table_stats=table_stats,
+        )
+        log(rtl(f"\nپوشه خروجی: {output_folder}"))
+        log(rtl("فایل README.txt ایجاد شد."))
+        return output_folder
+    finally:
+        if output_folder is not None:
+            unlock_output_folder(output_folder)
+        remove_workspace_db(workspace_db)
+
+
+def _available_memory_mb() -> float | None:
+    """حافظه آزاد سیستم (مگابایت)؛ اگر قابل تشخیص نباشد None."""
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+# پوشه فایل‌های هر سگمنت داخل پوشه خروجی
+SEGMENTS_DIR_NAME = "segments"
+
+
+def _export_segment_files(db, folder: Path, export_format: str | None = None, log=print) -> list[str]:
+    """
+    فایل مشتریان هر سگمنت (با نام، ایمیل و موبایل از user_full_data) در پوشه segments، با یک بار خواندن
+    rfm_scores (ExcelExporter.export_fanout). فایل‌های قبلی پوشه حذف می‌شوند. برمی‌گرداند نام نسبی فایل‌ها.
+    """
+    segment_dir = Path(folder) / SEGMENTS_DIR_NAME
+    if segment_dir.is_dir():
+        for old in segment_dir.iterdir():
+            if old.is_file():
+                old.unlink()
+    files = ExcelExporter(db, segment_dir).export_fanout(
+        segment_contacts_sql(db),
+        key_column="segment",
+        output_base_name="segment",
+        export_format=export_format,
+        column_formats={
+            "total_spent": "#,##0",
+            "last_order_amount": "#,##0",
+        },
     )
-    print(rtl(f"\nپوشه خروجی: {output_folder}"))
-    print(rtl("فایل README.txt ایجاد شد."))
+    log(rtl(f"  فایل‌های سگمنت: {len(files)} سگمنت در پوشه {SEGMENTS_DIR_NAME}"))
+    return [f"{SEGMENTS_DIR_NAME}/{p.name}" for paths in files.values() for p in paths]
+
+
+def _batch_worker_count(job_count: int) -> int:
+    """تعداد worker حالت گروهی: محدود به تعداد دامپ‌ها، هسته‌های CPU و حافظه آزاد."""
+    limits = [job_count, os.cpu_count() or 1]
+    if BATCH_MAX_WORKERS:
+        limits.append(int(BATCH_MAX_WORKERS))
+    free_mb = _available_memory_mb()
+    if free_mb is not None and BATCH_WORKER_MEMORY_MB:
+        limits.append(int(free_mb // BATCH_WORKER_MEMORY_MB))
+    return max(1, min(limits))
+
+
+def _batch_worker(
+    dump_path: str, rfm_from_shamsi_date: str, export_format: str | None = None
+) -> tuple[str, str | None, str | None]:
+    """اجرای process_dump در یک پردازه جدا. برمی‌گرداند (نام دامپ، پوشه خروجی، خطا)."""
+    name = Path(dump_path).name
+    try:
+        folder = process_dump(dump_path, rfm_from_shamsi_date, log=_quiet, export_format=export_format)
+        return name, str(folder) if folder else None, None
+    except Exception as e:
+        return name, None, str(e)
+
+
+def run_batch_import() -> list[Path]:
+    """پردازش همه دامپ‌های پوشه dump به صورت موازی (هر دامپ در workspace مجزا)."""
+    files = DumpReader(DUMP_DIR).list_files()
+    if not files:
+        print(rtl(f"هیچ فایل دامپی در پوشه {DUMP_DIR} یافت نشد."))
+        return []
+
+    rfm_from_shamsi_date = _ask_rfm_base_date()
+    export_format = _ask_export_format()
+    workers = _batch_worker_count(len(files))
+    print(rtl(f"\nپردازش {len(files)} دامپ با {workers} worker..."))
+
+    outputs: list[Path] = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_batch_worker, str(f["path"]), rfm_from_shamsi_date, export_format) for f in files]
+        for future in as_completed(futures):
+            name, folder, error = future.result()
+            if error:
+                print(rtl(f"  {name}: خطا - {error}"))
+            elif folder:
+                print(rtl(f"  {name}: {folder}"))
+                outputs.append(Path(folder))
+            else:
+                print(rtl(f"  {name}: خروجی ساخته نشد."))
+
+    # حالت sketch: آستانه‌های مشترک همه فروشگاه‌ها از ادغام sketchهای converted.db هر خروجی
+    if RFM_QUANTILE_MODE == "sketch" and len(outputs) > 1:
+        combined = create_combined_rfm_constant_excel(
+            [folder / "converted.db" for folder in outputs if (folder / "converted.db").is_file()],
+            Path(OUTPUT_DIR) / "rfm_constant_combined.xlsx",
+        )
+        if combined is not None:
+            print(rtl(f"آستانه‌های مشترک فروشگاه‌ها: {combined}"))
+    return outputs
 
 
 # ستون‌های لازم در فایل ۱_rfm_data.xlsx
@@ -260,231 +517,245 @@ RFM_DATA_REQUIRED_COLUMNS = {
 # شیت‌ها و ستون‌های لازم در rfm_constant.xlsx
 RFM_CONSTANT_REQUIRED_SHEETS = {"meta", "thresholds"}
 RFM_CONSTANT_THRESHOLDS_COLUMNS = {"metric", "score", "min_value", "max_value"}
-RFM_SCORE_REQUIRED_METRICS = {"recency_days", "total_orders", "total_spent"}
 
 
-def _to_float(value):
-    if value is None:
-        return None
-    txt = str(value).strip()
-    if not txt:
-        return None
-    try:
-        return float(txt.replace(",", ""))
-    except Exception:
+def _load_rfm_thresholds(constant_file: Path) -> tuple[dict[str, list[tuple[float, float, int]]], str | None]:
+    """
+    thresholds را از rfm_constant.xlsx می‌خواند.
+    خروجی:
+      ({metric: [(min, max, score), ...]}, error_message)
+    """
+    rules, err = load_thresholds(constant_file)
+    return rules, (rtl(err) if err else None)
+
+
+# ترتیب ستون‌های داده در rfm_scores.xlsx (بعد از امتیازها و سگمنت)
+RFM_SCORES_DATA_COLUMNS = (
+    "recency_days",
+    "total_orders",
+    "total_spent",
+    "last_order_amount",
+    "last_order_date",
+    "last_order_date_shamsi",
+)
+
+
+def _append_scores(
+    writer, rows, idx: dict[str, int], edges: dict[str, ThresholdEdges], segment_rules: SegmentLookup
+) -> pd.DataFrame | None:
+    """
+    امتیاز و سگمنت یک دسته از ردیف‌های فایل rfm_data (حداکثر EXPORT_FETCH_ROWS) به صورت ستونی
+    (searchsorted روی آستانه‌های کامپایل‌شده و lookup سگمنت) و نوشتن با نویسنده chunked خروجی (open_chunked_xlsx).
+    برمی‌گرداند ستون‌های نمودار همین ردیف‌ها (compact_scores_frame) یا None اگر ردیفی نبود.
+    """
+    columns = ("user_id",) + RFM_SCORES_DATA_COLUMNS
+    data = [
+        tuple(row[idx[c]] if idx[c] < len(row) else None for c in columns)
+        for row in rows
+    ]
+    if not data:
         return None
+    values = list(zip(*data))
+
+    def _metric_array(name: str) -> np.ndarray:
+        return np.array(
+            [np.nan if v is None else v for v in map(to_float, values[columns.index(name)])],
+            dtype=np.float64,
+        )
+
+    recency = _metric_array("recency_days")
+    orders = _metric_array("total_orders")
+    spent = _metric_array("total_spent")
+    r_scores = score_values(recency, edges["recency_days"])
+    f_scores = score_values(orders, edges["total_orders"])
+    m_scores = score_values(spent, edges["total_spent"])
+    segments = assign_segments(r_scores, f_scores, m_scores, segment_rules)
+
+    writer.write(
+        [
+            (row[0], r, f, m, f"{r}{f}{m}", seg, *row[1:])
+            for row, r, f, m, seg in zip(
+                data, r_scores.tolist(), f_scores.tolist(), m_scores.tolist(), segments.tolist()
+            )
+        ]
+    )
+    return compact_scores_frame(
+        pd.DataFrame(
+            {
+                "r_score": r_scores,
+                "f_score": f_scores,
+                "m_score": m_scores,
+                "segment": segments,
+                "recency_days": recency,
+                "total_orders": orders,
+                "total_spent": spent,
+            }
+        )
+    )
+
+
+# فرمت عددی ستون‌های مبلغ در فایل‌های rfm_scores
+RFM_SCORES_COLUMN_FORMATS = {
+    "total_spent": "#,##0",
+    "last_order_amount": "#,##0",
+}
+
+
+def _remove_rfm_scores_files(folder: Path) -> None:
+    """حذف فایل‌های rfm_scores قبلی پوشه (chunked و فایل تکی)."""
+    for path in find_chunk_files(folder, "rfm_scores") + [Path(folder) / "rfm_scores.xlsx"]:
+        path.unlink(missing_ok=True)
 
 
-def _excel_sort_key(path: Path):
+def _rfm_scores_temp_dir(folder: Path) -> tempfile.TemporaryDirectory:
+    """پوشه موقت داخل پوشه خروجی برای نوشتن فایل‌های rfm_scores تازه (rename بعدی روی همان دیسک است)."""
+    return tempfile.TemporaryDirectory(dir=folder, prefix=".rfm_scores_")
+
+
+def _publish_rfm_scores_files(paths: list[Path], folder: Path) -> list[Path]:
     """
-    مرتب‌سازی فایل‌های chunked مثل:
-    1_rfm_data.xlsx, 2_rfm_data.xlsx, ...
+    جایگزینی فایل‌های rfm_scores قبلی با فایل‌های کامل‌شده پوشه موقت (فقط بعد از موفقیت کل ساخت):
+    یک فایل => rfm_scores.xlsx (همان نام همیشگی)، بیشتر => 1_rfm_scores.xlsx, 2_rfm_scores.xlsx, ...
     """
-    name = path.name
-    parts = name.split("_", 1)
-    if len(parts) == 2 and parts[0].isdigit():
-        return int(parts[0]), name
-    return 10**9, name
+    folder = Path(folder)
+    _remove_rfm_scores_files(folder)
+    targets = [folder / "rfm_scores.xlsx"] if len(paths) == 1 else [folder / p.name for p in paths]
+    for source, target in zip(paths, targets):
+        source.replace(target)
+    return targets
 
 
-def _load_rfm_thresholds(constant_file: Path) -> tuple[dict[str, list[tuple[float, float, int]]], str | None]:
+def _export_rfm_scores_table(db, folder: Path) -> list[Path]:
     """
-    thresholds را از rfm_constant.xlsx می‌خواند.
-    خروجی:
-      ({metric: [(min, max, score), ...]}, error_message)
+    نوشتن جدول rfm_scores در rfm_scores.xlsx (یا اگر بیش از EXCEL_MAX_ROWS_PER_FILE ردیف باشد
+    1_rfm_scores.xlsx, 2_rfm_scores.xlsx, ...) با export_view_chunked: حافظه ثابت، RTL و فرمت #,##0 مبالغ.
+    فایل‌ها اول در پوشه موقت نوشته می‌شوند؛ با خطا فایل‌های قبلی دست نمی‌خورند.
+    """
+    with _rfm_scores_temp_dir(folder) as temp_dir:
+        paths = ExcelExporter(db, Path(temp_dir)).export_view_chunked(
+            RFM_SCORES_TABLE,
+            output_base_name="rfm_scores",
+            column_formats=RFM_SCORES_COLUMN_FORMATS,
+        )
+        return _publish_rfm_scores_files(paths, folder)
+
+
+def _build_rfm_scores_from_db(db_file: Path, constant_file: Path, folder: Path) -> tuple[bool, str]:
     """
+    ساخت rfm_scores داخل converted.db پوشه خروجی: آستانه‌ها و قواعد سگمنت rfm_constant.xlsx
+    (شاید کاربر ویرایششان کرده باشد) در جدول‌ها ذخیره، rfm_scores با یک کوئری ساخته و به Excel نوشته می‌شود.
+    """
+    rules, err = _load_rfm_thresholds(constant_file)
+    if err:
+        return False, err
     try:
-        wb = load_workbook(constant_file, read_only=True, data_only=True)
-        if "thresholds" not in wb.sheetnames:
-            wb.close()
-            return {}, rtl("شیت thresholds در rfm_constant.xlsx یافت نشد.")
-        ws = wb["thresholds"]
+        with DBSession(db_file) as db:
+            save_rfm_thresholds(db, rules)
+            save_segment_rules(db, load_segment_rules(constant_file).rules)
+            db.commit()
+            scores_ok, scores_err = create_rfm_scores_table(db)
+            if not scores_ok:
+                return False, rtl(f"خطا در ساخت جدول rfm_scores: {scores_err}")
+            paths = _export_rfm_scores_table(db, folder)
+            # فایل‌های سگمنت با سگمنت‌های جدید (قواعد شاید ویرایش شده باشند) دوباره ساخته می‌شوند
+            if RFM_SEGMENT_EXPORT:
+                _export_segment_files(db, folder)
+        return True, rtl(f"فایل rfm_scores با موفقیت ایجاد شد: {', '.join(p.name for p in paths)}")
+    except Exception as e:
+        return False, rtl(f"خطا در ساخت rfm_scores.xlsx: {e!s}")
+
+
+def _rfm_data_header_index(file_path: Path) -> dict[str, int] | None:
+    """اندیس ستون‌های هدر شیت اول یک فایل rfm_data؛ None اگر شیت یا هدر نداشته باشد."""
+    wb_in = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        if not wb_in.sheetnames:
+            return None
+        ws = wb_in[wb_in.sheetnames[0]]
         header_row = next(ws.iter_rows(min_row=1, max_row=1, values_only=True), None)
         if not header_row:
-            wb.close()
-            return {}, rtl("هدر شیت thresholds خالی است.")
+            return None
         headers = [str(c).strip() if c is not None else "" for c in header_row]
-        idx = {h: i for i, h in enumerate(headers)}
-        required = ["metric", "min_value", "max_value", "score"]
-        if not all(k in idx for k in required):
-            wb.close()
-            return {}, rtl("ستون‌های لازم برای thresholds کامل نیستند.")
-
-        rules: dict[str, list[tuple[float, float, int]]] = {}
-        for row in ws.iter_rows(min_row=2, values_only=True):
-            metric = row[idx["metric"]] if idx["metric"] < len(row) else None
-            if metric is None:
-                continue
-            metric = str(metric).strip()
-            min_v = _to_float(row[idx["min_value"]] if idx["min_value"] < len(row) else None)
-            max_v = _to_float(row[idx["max_value"]] if idx["max_value"] < len(row) else None)
-            score_v = row[idx["score"]] if idx["score"] < len(row) else None
-            if min_v is None or max_v is None or score_v is None:
-                continue
-            try:
-                score_i = int(float(str(score_v)))
-            except Exception:
-                continue
-            rules.setdefault(metric, []).append((min_v, max_v, score_i))
-        wb.close()
+        return {h: i for i, h in enumerate(headers)}
+    finally:
+        wb_in.close()
 
-        for metric in RFM_SCORE_REQUIRED_METRICS:
-            if metric not in rules or not rules[metric]:
-                return {}, rtl(f"برای معیار {metric} در thresholds قانونی پیدا نشد.")
-            rules[metric].sort(key=lambda x: (x[0], x[1]))
 
-        return rules, None
-    except Exception as e:
-        return {}, rtl(f"خطا در خواندن rfm_constant.xlsx: {e!s}")
-
-
-def _score_by_rules(value, rules: list[tuple[float, float, int]]) -> int:
-    """
-    امتیازدهی مقدار بر اساس بازه‌های (min,max,score).
-    """
-    v = _to_float(value)
-    if v is None:
-        return 0
-
-    # تطبیق مستقیم بازه
-    for min_v, max_v, score in rules:
-        if min_v <= v <= max_v:
-            return score
-
-    # fallback برای خطاهای گردکردن/مرزها
-    if v < rules[0][0]:
-        return rules[0][2]
-    if v > rules[-1][1]:
-        return rules[-1][2]
-
-    # نزدیک‌ترین بازه
-    best_score = rules[0][2]
-    best_dist = float("inf")
-    for min_v, max_v, score in rules:
-        center = (min_v + max_v) / 2
-        d = abs(v - center)
-        if d < best_dist:
-            best_dist = d
-            best_score = score
-    return best_score
-
-
-def _build_rfm_scores_file(folder: Path) -> tuple[bool, str]:
+def _build_rfm_scores_file(folder: Path) -> tuple[bool, str, pd.DataFrame | None]:
     """
-    از روی فایل‌های rfm_data و rfm_constant امتیاز R/F/M را محاسبه می‌کند
-    و فایل rfm_scores.xlsx را می‌سازد.
+    امتیاز R/F/M و سگمنت هر کاربر و فایل rfm_scores.xlsx (بیش از EXCEL_MAX_ROWS_PER_FILE ردیف:
+    1_rfm_scores.xlsx, 2_rfm_scores.xlsx, ...).
+    اگر converted.db در پوشه باشد امتیازها با یک کوئری در دیتابیس (جدول rfm_scores) حساب می‌شوند؛
+    در غیر این صورت از روی فایل‌های rfm_data و rfm_constant: هدر همه فایل‌ها اول چک می‌شود، ردیف‌ها دسته‌های
+    EXPORT_FETCH_ROWS تایی خوانده و در پوشه موقت نوشته می‌شوند و فایل‌های قبلی فقط بعد از موفقیت جایگزین می‌شوند.
+    برمی‌گرداند: (ok, message, ستون‌های نمودار مسیر Excel یا None)؛ در مسیر دیتابیس نمودارها از جدول rfm_scores
+    خوانده می‌شوند و در هیچ مسیری rfm_scores.xlsx برای نمودار دوباره خوانده نمی‌شود.
     """
     folder = Path(folder)
     constant_file = folder / "rfm_constant.xlsx"
     if not constant_file.is_file():
-        return False, rtl("فایل rfm_constant.xlsx موجود نیست.")
+        return False, rtl("فایل rfm_constant.xlsx موجود نیست."), None
 
-    rfm_data_files = sorted(folder.glob("*_rfm_data.xlsx"), key=_excel_sort_key)
-    if not rfm_data_files:
-        single = folder / "rfm_data.xlsx"
-        if single.is_file():
-            rfm_data_files = [single]
+    # rfm_data از جدول converted.db با cursor خوانده می‌شود؛ فایل‌های Excel فقط وقتی دیتابیس نیست
+    db_file = _rfm_data_db_file(folder)
+    if db_file is not None:
+        ok, msg = _build_rfm_scores_from_db(db_file, constant_file, folder)
+        return ok, msg, None
+
+    rfm_data_files = find_chunk_files(folder, "rfm_data")
     if not rfm_data_files:
-        return False, rtl("فایل‌های rfm_data پیدا نشدند.")
+        return False, rtl("فایل‌های rfm_data پیدا نشدند."), None
 
     rules, err = _load_rfm_thresholds(constant_file)
     if err:
-        return False, err
-
-    segment_rules = _load_segment_rules(constant_file)
-
-    output_file = folder / "rfm_scores.xlsx"
-    wb_out = Workbook(write_only=True)
-    ws_out = wb_out.create_sheet("rfm_scores")
-    ws_out.append(
-        [
-            "user_id",
-            "r_score",
-            "f_score",
-            "m_score",
-            "rfm_score",
-            "segment",
-            "recency_days",
-            "total_orders",
-            "total_spent",
-            "last_order_amount",
-            "last_order_date",
-            "last_order_date_shamsi",
-        ]
-    )
+        return False, err, None
 
-    required_headers = {
-        "user_id",
-        "last_order_date",
-        "last_order_date_shamsi",
-        "total_orders",
-        "total_spent",
-        "last_order_amount",
-        "recency_days",
-    }
+    segment_rules = load_segment_rules(constant_file)
+    # آستانه‌ها یک بار به آرایه‌های مرتب تبدیل و برای همه فایل‌های rfm_data استفاده می‌شوند
+    edges = {metric: compile_thresholds(metric_rules) for metric, metric_rules in rules.items()}
 
+    # هدر همه فایل‌ها پیش از نوشتن چیزی چک می‌شود
+    inputs: list[tuple[Path, dict[str, int]]] = []
     try:
         for file_path in rfm_data_files:
-            wb_in = load_workbook(file_path, read_only=True, data_only=True)
-            if not wb_in.sheetnames:
-                wb_in.close()
+            idx = _rfm_data_header_index(file_path)
+            if idx is None:
                 continue
-            ws = wb_in[wb_in.sheetnames[0]]
-            header_row = next(ws.iter_rows(min_row=1, max_row=1, values_only=True), None)
-            if not header_row:
-                wb_in.close()
-                continue
-            headers = [str(c).strip() if c is not None else "" for c in header_row]
-            idx = {h: i for i, h in enumerate(headers)}
-            missing = required_headers - set(idx.keys())
+            missing = RFM_DATA_REQUIRED_COLUMNS - set(idx.keys())
             if missing:
-                wb_in.close()
-                return False, rtl(f"ستون‌های لازم در {file_path.name} ناقص هستند: {missing}")
-
-            for row in ws.iter_rows(min_row=2, values_only=True):
-                user_id = row[idx["user_id"]] if idx["user_id"] < len(row) else None
-                recency_days = row[idx["recency_days"]] if idx["recency_days"] < len(row) else None
-                total_orders = row[idx["total_orders"]] if idx["total_orders"] < len(row) else None
-                total_spent = row[idx["total_spent"]] if idx["total_spent"] < len(row) else None
-                last_order_amount = row[idx["last_order_amount"]] if idx["last_order_amount"] < len(row) else None
-                last_order_date = row[idx["last_order_date"]] if idx["last_order_date"] < len(row) else None
-                last_order_date_shamsi = (
-                    row[idx["last_order_date_shamsi"]] if idx["last_order_date_shamsi"] < len(row) else None
-                )
-
-                r_score = _score_by_rules(recency_days, rules["recency_days"])
-                f_score = _score_by_rules(total_orders, rules["total_orders"])
-                m_score = _score_by_rules(total_spent, rules["total_spent"])
-                rfm_score = f"{r_score}{f_score}{m_score}"
-
-                segment = "Unclassified"
-                for seg, sr_min, sr_max, sf_min, sf_max, sm_min, sm_max in segment_rules:
-                    if sr_min <= r_score <= sr_max and sf_min <= f_score <= sf_max and sm_min <= m_score <= sm_max:
-                        segment = seg
-                        break
-
-                ws_out.append(
-                    [
-                        user_id,
-                        r_score,
-                        f_score,
-                        m_score,
-                        rfm_score,
-                        segment,
-                        recency_days,
-                        total_orders,
-                        total_spent,
-                        last_order_amount,
-                        last_order_date,
-                        last_order_date_shamsi,
-                    ]
-                )
-            wb_in.close()
+                return False, rtl(f"ستون‌های لازم در {file_path.name} ناقص هستند: {missing}"), None
+            inputs.append((file_path, idx))
+    except Exception as e:
+        return False, rtl(f"خطا در خواندن فایل‌های rfm_data: {e!s}"), None
 
-        wb_out.save(output_file)
-        return True, rtl(f"فایل rfm_scores.xlsx با موفقیت ایجاد شد.")
+    chart_frames: list[pd.DataFrame] = []
+    try:
+        with _rfm_scores_temp_dir(folder) as temp_dir:
+            writer = open_chunked_xlsx(temp_dir, "rfm_scores", RFM_SCORES_COLUMNS, RFM_SCORES_COLUMN_FORMATS)
+            try:
+                for file_path, idx in inputs:
+                    wb_in = load_workbook(file_path, read_only=True, data_only=True)
+                    try:
+                        rows = wb_in[wb_in.sheetnames[0]].iter_rows(min_row=2, values_only=True)
+                        while True:
+                            batch = list(islice(rows, EXPORT_FETCH_ROWS))
+                            if not batch:
+                                break
+                            frame = _append_scores(writer, batch, idx, edges, segment_rules)
+                            if frame is not None:
+                                chart_frames.append(frame)
+                    finally:
+                        wb_in.close()
+            finally:
+                paths = writer.close()
+            paths = _publish_rfm_scores_files(paths, folder)
     except Exception as e:
-        return False, rtl(f"خطا در ساخت rfm_scores.xlsx: {e!s}")
+        return False, rtl(f"خطا در ساخت rfm_scores.xlsx: {e!s}"), None
+    return (
+        True,
+        rtl(f"فایل rfm_scores با موفقیت ایجاد شد: {', '.join(p.name for p in paths)}"),
+        concat_scores_frames(chart_frames),
+    )
 
 
 def _append_charts_to_readme(folder: Path, chart_files: list[str]) -> None:
@@ -501,20 +772,21 @@ def _append_charts_to_readme(folder: Path, chart_files: list[str]) -> None:
         pass
 
 
-def _validate_rfm_output_folder(folder: Path) -> tuple[bool, str]:
-    """
-    چک می‌کند که 1_rfm_data.xlsx و rfm_constant.xlsx در پوشه باشند و ستون‌های لازم را داشته باشند.
-    برمی‌گرداند: (ok: bool, message: str)
-    """
-    folder = Path(folder)
-    rfm_data_file = folder / "1_rfm_data.xlsx"
-    rfm_constant_file = folder / "rfm_constant.xlsx"
+def _rfm_data_db_file(folder: Path) -> Path | None:
+    """converted.db پوشه خروجی، اگر جدول rfm_data با ستون‌های لازم را داشته باشد؛ وگرنه None."""
+    db_file = Path(folder) / "converted.db"
+    if not db_file.is_file():
+        return None
+    try:
+        with DBSession(db_file) as db:
+            columns = db._table_columns(RFM_DATA_TABLE)
+    except Exception:
+        return None
+    return db_file if RFM_DATA_REQUIRED_COLUMNS.issubset(columns) else None
 
-    if not rfm_data_file.is_file():
-        return False, rtl("فایل 1_rfm_data.xlsx یافت نشد.")
-    if not rfm_constant_file.is_file():
-        return False, rtl("فایل rfm_constant.xlsx یافت نشد.")
 
+def _validate_rfm_data_excel(rfm_data_file: Path) -> tuple[bool, str]:
+    """چک هدر 1_rfm_data.xlsx (وقتی converted.db در پوشه نیست)."""
     try:
         wb_data = load_workbook(rfm_data_file, read_only=True, data_only=True)
         if not wb_data.sheetnames:
@@ -531,6 +803,30 @@ def _validate_rfm_output_folder(folder: Path) -> tuple[bool, str]:
             return False, rtl(f"فایل 1_rfm_data.xlsx ستون‌های لازم را ندارد: {missing}")
     except Exception as e:
         return False, rtl(f"خطا در خواندن 1_rfm_data.xlsx: {e!s}")
+    return True, ""
+
+
+def _validate_rfm_output_folder(folder: Path) -> tuple[bool, str]:
+    """
+    چک می‌کند که rfm_data (جدول converted.db، یا اگر نبود 1_rfm_data.xlsx) و rfm_constant.xlsx
+    در پوشه باشند و ستون‌های لازم را داشته باشند.
+    برمی‌گرداند: (ok: bool, message: str)
+    """
+    folder = Path(folder)
+    rfm_data_file = folder / "1_rfm_data.xlsx"
+    rfm_constant_file = folder / "rfm_constant.xlsx"
+    has_rfm_db = _rfm_data_db_file(folder) is not None
+
+    if not has_rfm_db and not rfm_data_file.is_file():
+        return False, rtl("فایل 1_rfm_data.xlsx یافت نشد.")
+    if not rfm_constant_file.is_file():
+        return False, rtl("فایل rfm_constant.xlsx یافت نشد.")
+
+    # با converted.db ستون‌های rfm_data از خود جدول چک شده‌اند و فایل Excel خوانده نمی‌شود
+    if not has_rfm_db:
+        ok, msg = _validate_rfm_data_excel(rfm_data_file)
+        if not ok:
+            return False, msg
 
     try:
         wb_const = load_workbook(rfm_constant_file, read_only=True, data_only=True)
@@ -577,7 +873,8 @@ def run_use_existing_data() -> Path | None:
         except Exception:
             date_str = "-"
         file_count = sum(1 for x in p.iterdir() if x.is_file())
-        print(rtl(f"  {i + 1}. {p.name}  {date_str}  ({file_count})"))
+        busy = "  [در حال ساخت]" if is_output_folder_locked(p) else ""
+        print(rtl(f"  {i + 1}. {p.name}  {date_str}  ({file_count}){busy}"))
     print("-" * 50)
 
     while True:
@@ -589,15 +886,18 @@ def run_use_existing_data() -> Path | None:
             if 1 <= idx <= len(subdirs):
                 chosen = subdirs[idx - 1]
                 print(rtl(f"انتخاب شد: {chosen.name}"))
+                if is_output_folder_locked(chosen):
+                    print(rtl("این پوشه هنوز توسط یک اجرای دیگر در حال ساخت است."))
+                    return None
                 ok, msg = _validate_rfm_output_folder(chosen)
                 if ok:
                     print(msg)
-                    score_ok, score_msg = _build_rfm_scores_file(chosen)
+                    score_ok, score_msg, scores = _build_rfm_scores_file(chosen)
                     print(score_msg)
                     if not score_ok:
                         print(rtl("خطا در محاسبه امتیازها؛ فایل rfm_scores ساخته نشد."))
                     else:
-                        chart_ok, chart_msg, chart_files = build_rfm_charts(chosen)
+                        chart_ok, chart_msg, chart_files = build_rfm_charts(chosen, scores)
                         print(rtl(chart_msg))
                         if not chart_ok:
                             print(rtl("خطا در ساخت نمودارها."))
@@ -3,7 +3,7 @@ import sys
 
 from bidi.algorithm import get_display
 
-from config import DUMP_DIR, OUTPUT_DIR, SQLITE_DB_PATH
+from config import DUMP_DIR, OUTPUT_DIR, WORKSPACE_DIR
 
 # رفع خطای Unicode در ویندوز
 if sys.platform == "win32" and hasattr(sys.stdout, "reconfigure"):
@@ -13,7 +13,7 @@ if sys.platform == "win32" and hasattr(sys.stdout, "reconfigure"):
     except Exception:
         pass
 
-from flows import run_import_new_data, run_use_existing_data
+from flows import run_batch_import, run_import_new_data, run_use_existing_data
 
 
 def rtl(text: str) -> str:
@@ -30,11 +30,12 @@ def main():
         print(rtl("=== SQL to Excel Tool ==="))
         print(rtl(f"پوشه دامپ: {DUMP_DIR}"))
         print(rtl(f"خروجی: {OUTPUT_DIR}"))
-        print(rtl(f"دیتابیس SQLite: {SQLITE_DB_PATH}"))
+        print(rtl(f"دیتابیس‌های موقت SQLite: {WORKSPACE_DIR}"))
 
         print(rtl("\nیک گزینه را انتخاب کنید:"))
         print(rtl("  ۱) وارد کردن داده‌های جدید"))
         print(rtl("  ۲) استفاده از داده‌های وارد شده"))
+        print(rtl("  ۳) پردازش موازی همه دامپ‌ها"))
         print(rtl("  ۰) خروج"))
         try:
             choice = input(rtl("\nانتخاب:  ")).strip()
@@ -48,10 +49,13 @@ def main():
         if choice == "2":
             run_use_existing_data()
             return
+        if choice == "3":
+            run_batch_import()
+            return
         if choice == "0":
             print(rtl("خروج."))
             return
-        # غیر از ۰، ۱، ۲: پاک کردن صفحه و پرسیدن دوباره
+        # غیر از ۰، ۱، ۲، ۳: پاک کردن صفحه و پرسیدن دوباره
         _clear_screen()
 
 
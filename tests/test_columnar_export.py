@@ -0,0 +1,63 @@
+"""
+خروجی parquet / arrow ستون بدون نوع اعلام‌شده: وقتی دسته‌های بعدی نوع ستون را گسترده می‌کنند
+(int64 => float64 => string)، ردیف‌های نوشته‌شده همان متن _ensure_str را می‌گیرند (3 => '3' نه '3.0').
+"""
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+import core.excel_exporter as excel_exporter
+from core.db_manager import SQLiteManager
+from core.excel_exporter import ExcelExporter
+
+
+def _read(path, export_format):
+    if export_format == "parquet":
+        return pq.read_table(path)
+    with pa.memory_map(str(path)) as source:
+        return pa.ipc.open_file(source).read_all()
+
+
+@pytest.fixture
+def small_batches(monkeypatch):
+    monkeypatch.setattr(excel_exporter, "_ARROW_BATCH_ROWS", 2)
+    monkeypatch.setattr(excel_exporter, "EXPORT_FETCH_ROWS", 2)
+
+
+@pytest.mark.parametrize("export_format", ["parquet", "arrow"])
+@pytest.mark.parametrize(
+    "values, arrow_type, expected",
+    [
+        ([1, 2, 3, 4.5, 5, "s"], pa.string(), ["1", "2", "3", "4.5", "5", "s"]),
+        ([1, 2, 3, "s", 4.5, 5], pa.string(), ["1", "2", "3", "s", "4.5", "5"]),
+        ([1.5, 2, 3, 4, 5, "s"], pa.string(), ["1.5", "2", "3", "4", "5", "s"]),
+        ([1, 2, 3, 4.5, 5, 6], pa.float64(), [1.0, 2.0, 3.0, 4.5, 5.0, 6.0]),
+    ],
+)
+def test_widened_column_keeps_original_text(tmp_path, small_batches, export_format, values, arrow_type, expected):
+    db = SQLiteManager(tmp_path / "converted.db").connect()
+    try:
+        db.execute("CREATE TABLE mixed (v)")
+        db.conn.executemany("INSERT INTO mixed VALUES (?)", [(v,) for v in values])
+        (path,) = ExcelExporter(db, tmp_path / "out").export_table("mixed", export_format=export_format)
+    finally:
+        db.close()
+    table = _read(path, export_format)
+    assert table.schema.field("v").type == arrow_type
+    assert table.column("v").to_pylist() == expected
+
+
+def test_fanout_keeps_null_and_empty_keys_apart(tmp_path):
+    db = SQLiteManager(tmp_path / "converted.db").connect()
+    try:
+        db.execute("CREATE TABLE contacts (segment TEXT, user_id INTEGER)")
+        db.conn.executemany("INSERT INTO contacts VALUES (?, ?)", [(None, 1), ("", 2), ("A", 3), (None, 4)])
+        files = ExcelExporter(db, tmp_path / "out").export_fanout(
+            "SELECT segment, user_id FROM contacts ORDER BY user_id", "segment", "segment", export_format="parquet"
+        )
+    finally:
+        db.close()
+    assert list(files) == [None, "", "A"]
+    assert len({path for paths in files.values() for path in paths}) == 3
+    (null_file,) = files[None]
+    assert pq.read_table(null_file).column("user_id").to_pylist() == [1, 4]
@@ -0,0 +1,47 @@
+"""
+قفل پوشه خروجی: قفل اجرای زنده می‌ماند و قفل رهاشده (pid مرده، یا pid ناخوانای قدیمی) برداشته می‌شود تا
+پوشه دوباره در find_output_folders و مرحله «داده موجود» دیده شود.
+"""
+import os
+import subprocess
+import sys
+import time
+
+from utils.helpers import OUTPUT_LOCK_NAME, create_output_folder, find_output_folders, is_output_folder_locked
+
+
+def _dead_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def _locked_folder(tmp_path, content: str):
+    folder = tmp_path / "wp_1"
+    folder.mkdir()
+    (folder / "converted.db").write_bytes(b"")
+    (folder / OUTPUT_LOCK_NAME).write_text(content, encoding="utf-8")
+    return folder
+
+
+def test_lock_of_running_process_is_kept(tmp_path):
+    folder = create_output_folder(tmp_path, "wp", lock=True)
+    assert (folder / OUTPUT_LOCK_NAME).read_text(encoding="utf-8") == str(os.getpid())
+    assert is_output_folder_locked(folder)
+    assert (folder / OUTPUT_LOCK_NAME).exists()
+
+
+def test_lock_of_dead_process_is_cleared(tmp_path):
+    folder = _locked_folder(tmp_path, str(_dead_pid()))
+    assert find_output_folders(tmp_path, "wp") == [folder]
+    assert not (folder / OUTPUT_LOCK_NAME).exists()
+    assert not is_output_folder_locked(folder)
+
+
+def test_unreadable_lock_is_cleared_only_when_old(tmp_path):
+    folder = _locked_folder(tmp_path, "")
+    assert is_output_folder_locked(folder)
+    old = time.time() - 2 * 3600
+    os.utime(folder / OUTPUT_LOCK_NAME, (old, old))
+    assert not is_output_folder_locked(folder)
+    assert not (folder / OUTPUT_LOCK_NAME).exists()
@@ -0,0 +1,120 @@
+"""
+به‌روزرسانی افزایشی RFM (RFM_INCREMENTAL) با چند دامپ پشت‌سرهم: آمار ماندگار فقط از خروجی قبلی
+همان سایت (siteurl) برداشته می‌شود و دامپ قدیمی‌تر یا دامپ سایت دیگر با همان پیشوند wp_ ساخت کامل دارد.
+"""
+import random
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+import flows
+import core.rfm_data
+
+
+def _write_dump(path: Path, site_url: str, users: int, orders_per_user: int, seed: int) -> Path:
+    """دامپ MySQL کوچک وردپرس/ووکامرس (users، usermeta، wc_customer_lookup، wc_order_stats و options)."""
+    rnd = random.Random(seed)
+    statements = [
+        "CREATE TABLE `wp_users` (`ID` bigint(20) unsigned NOT NULL, `user_login` varchar(60) NOT NULL,"
+        " `user_email` varchar(100) NOT NULL, `user_registered` datetime NOT NULL, `display_name` varchar(250)"
+        " NOT NULL, PRIMARY KEY (`ID`)) ENGINE=InnoDB;",
+        "CREATE TABLE `wp_usermeta` (`umeta_id` bigint(20) unsigned NOT NULL, `user_id` bigint(20) unsigned"
+        " NOT NULL, `meta_key` varchar(255) DEFAULT NULL, `meta_value` longtext, PRIMARY KEY (`umeta_id`))"
+        " ENGINE=InnoDB;",
+        "CREATE TABLE `wp_wc_customer_lookup` (`customer_id` bigint(20) unsigned NOT NULL, `user_id` bigint(20)"
+        " unsigned DEFAULT NULL, `username` varchar(60) NOT NULL, PRIMARY KEY (`customer_id`)) ENGINE=InnoDB;",
+        "CREATE TABLE `wp_wc_order_stats` (`order_id` bigint(20) unsigned NOT NULL, `parent_id` bigint(20)"
+        " unsigned NOT NULL, `date_created` datetime NOT NULL, `total_sales` double NOT NULL, `status`"
+        " varchar(200) NOT NULL, `customer_id` bigint(20) unsigned NOT NULL, PRIMARY KEY (`order_id`))"
+        " ENGINE=InnoDB;",
+        "CREATE TABLE `wp_options` (`option_id` bigint(20) unsigned NOT NULL, `option_name` varchar(191) NOT NULL,"
+        " `option_value` longtext NOT NULL, `autoload` varchar(20) NOT NULL, PRIMARY KEY (`option_id`))"
+        " ENGINE=InnoDB;",
+        f"INSERT INTO `wp_options` VALUES (1,'siteurl','{site_url}','yes'),(2,'home','{site_url}','yes');",
+    ]
+    order_rows = []
+    order_id = 1000
+    for user in range(1, users + 1):
+        statements.append(
+            f"INSERT INTO `wp_users` VALUES ({user},'u{user}','u{user}@x.com','2020-01-01 00:00:00','n{user}');"
+        )
+        statements.append(f"INSERT INTO `wp_usermeta` VALUES ({user},{user},'billing_phone','0912{user:07d}');")
+        statements.append(f"INSERT INTO `wp_wc_customer_lookup` VALUES ({user + 500},{user},'u{user}');")
+        for _ in range(orders_per_user):
+            order_id += 1
+            day = f"2023-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d} 10:00:00"
+            order_rows.append(f"({order_id},0,'{day}',{rnd.randint(1, 500) * 1000},'wc-completed',{user + 500})")
+    statements.append("INSERT INTO `wp_wc_order_stats` VALUES " + ",".join(order_rows) + ";")
+    path.write_text("\n".join(statements) + "\n", encoding="utf-8")
+    return path
+
+
+def _set_incremental(monkeypatch, enabled: bool) -> None:
+    # flows (برداشتن آمار خروجی قبلی) و core.rfm_data (ادغام افزایشی) هر کدام RFM_INCREMENTAL را import کرده‌اند
+    monkeypatch.setattr(flows, "RFM_INCREMENTAL", enabled)
+    monkeypatch.setattr(core.rfm_data, "RFM_INCREMENTAL", enabled)
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.setattr(flows, "OUTPUT_DIR", str(tmp_path / "output"))
+    monkeypatch.setattr(flows, "WORKSPACE_DIR", str(tmp_path / "workspace"))
+    _set_incremental(monkeypatch, True)
+    monkeypatch.setattr(flows, "RFM_SEGMENT_EXPORT", False)
+    monkeypatch.setattr(core.rfm_data, "RFM_REFERENCE_SHAMSI_DATE", "1403/01/01")
+    return tmp_path
+
+
+def _run(dump: Path) -> tuple[dict, list[tuple]]:
+    folder = flows.process_dump(dump, "0", log=flows._quiet, export_format="csv")
+    with sqlite3.connect(folder / "converted.db") as conn:
+        state = dict(zip(("site_id", "mode", "max_order_id"), conn.execute(
+            "SELECT site_id, mode, max_order_id FROM _rfm_state"
+        ).fetchone()))
+        rows = conn.execute("SELECT * FROM rfm_data ORDER BY user_id").fetchall()
+    return state, rows
+
+
+def _full_rows(dump: Path, monkeypatch) -> list[tuple]:
+    _set_incremental(monkeypatch, False)
+    try:
+        return _run(dump)[1]
+    finally:
+        _set_incremental(monkeypatch, True)
+
+
+def test_other_site_with_same_prefix_is_not_seeded(workdir, monkeypatch):
+    shop_a = _write_dump(workdir / "shop_a.sql", "https://shop-a.example", users=40, orders_per_user=5, seed=1)
+    shop_c = _write_dump(workdir / "shop_c.sql", "https://shop-c.example", users=25, orders_per_user=3, seed=2)
+
+    _run(shop_a)
+    state, rows = _run(shop_c)
+
+    assert state["site_id"] == "url:shop-c.example"
+    assert state["mode"] == "full"
+    assert len(rows) == 25
+    assert rows == _full_rows(shop_c, monkeypatch)
+
+
+def test_newer_dump_of_same_site_is_merged_incrementally(workdir, monkeypatch):
+    old = _write_dump(workdir / "shop_a_1.sql", "https://shop-a.example/", users=30, orders_per_user=3, seed=3)
+    new = _write_dump(workdir / "shop_a_2.sql", "http://www.shop-a.example", users=35, orders_per_user=3, seed=3)
+
+    _run(old)
+    state, rows = _run(new)
+
+    assert state["mode"] == "incremental"
+    assert rows == _full_rows(new, monkeypatch)
+
+
+def test_older_dump_of_same_site_does_not_move_watermark_back(workdir, monkeypatch):
+    new = _write_dump(workdir / "shop_a_2.sql", "https://shop-a.example", users=35, orders_per_user=3, seed=4)
+    old = _write_dump(workdir / "shop_a_1.sql", "https://shop-a.example", users=30, orders_per_user=3, seed=4)
+
+    first, _ = _run(new)
+    state, rows = _run(old)
+
+    assert state["mode"] == "full"
+    assert state["max_order_id"] < first["max_order_id"]
+    assert rows == _full_rows(old, monkeypatch)
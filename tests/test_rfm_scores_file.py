@@ -0,0 +1,123 @@
+"""
+ساخت rfm_scores.xlsx از فایل‌های rfm_data (مسیر Excel بدون converted.db): نام فایل، تقسیم و اینکه خطا
+فایل‌های قبلی را دست‌نخورده می‌گذارد.
+"""
+from pathlib import Path
+
+import pytest
+from openpyxl import Workbook, load_workbook
+
+import flows
+
+RFM_DATA_HEADERS = [
+    "user_id",
+    "last_order_date",
+    "last_order_date_shamsi",
+    "total_orders",
+    "total_spent",
+    "last_order_amount",
+    "recency_days",
+]
+
+
+def _write_constant(path: Path) -> None:
+    wb = Workbook()
+    wb.active.title = "meta"
+    ws = wb.create_sheet("thresholds")
+    ws.append(["metric", "min_value", "max_value", "score"])
+    for metric, bounds in (
+        ("recency_days", [(0, 30, 5), (31, 10_000, 1)]),
+        ("total_orders", [(0, 1, 1), (2, 1_000, 5)]),
+        ("total_spent", [(0, 100_000, 1), (100_001, 10**9, 5)]),
+    ):
+        for low, high, score in bounds:
+            ws.append([metric, low, high, score])
+    ws = wb.create_sheet("segment_rules")
+    ws.append(["segment", "r_min", "r_max", "f_min", "f_max", "m_min", "m_max"])
+    ws.append(["Champions", 5, 5, 5, 5, 5, 5])
+    ws.append(["Lost", 1, 1, 1, 5, 1, 5])
+    wb.save(path)
+
+
+def _write_rfm_data(path: Path, first_user: int, count: int, headers=RFM_DATA_HEADERS) -> None:
+    wb = Workbook()
+    ws = wb.active
+    ws.append(headers)
+    for user in range(first_user, first_user + count):
+        row = [user, "2024-01-01 10:00:00", "1402/10/11 10:00:00", user % 4, user * 1000, 500, user % 60]
+        ws.append(row[: len(headers)])
+    wb.save(path)
+
+
+@pytest.fixture
+def folder(tmp_path):
+    _write_constant(tmp_path / "rfm_constant.xlsx")
+    _write_rfm_data(tmp_path / "1_rfm_data.xlsx", 1, 30)
+    _write_rfm_data(tmp_path / "2_rfm_data.xlsx", 31, 20)
+    return tmp_path
+
+
+def _sheet_rows(path: Path) -> list[tuple]:
+    wb = load_workbook(path, read_only=True)
+    try:
+        return list(wb.worksheets[0].iter_rows(values_only=True))
+    finally:
+        wb.close()
+
+
+def test_single_file_keeps_rfm_scores_name(folder):
+    ok, _, scores = flows._build_rfm_scores_file(folder)
+
+    assert ok
+    rows = _sheet_rows(folder / "rfm_scores.xlsx")
+    assert rows[0] == flows.RFM_SCORES_COLUMNS
+    assert [r[0] for r in rows[1:]] == list(range(1, 51))
+    assert len(scores) == 50
+    assert not list(folder.glob("1_rfm_scores.xlsx"))
+    assert not list(folder.glob(".rfm_scores_*"))
+
+
+def test_split_output_and_small_batches(folder, monkeypatch):
+    monkeypatch.setattr(flows, "EXPORT_FETCH_ROWS", 7)
+    monkeypatch.setattr("core.excel_exporter.EXCEL_MAX_ROWS_PER_FILE", 20)
+
+    ok, _, _ = flows._build_rfm_scores_file(folder)
+
+    assert ok
+    assert not (folder / "rfm_scores.xlsx").exists()
+    chunks = [folder / f"{n}_rfm_scores.xlsx" for n in (1, 2, 3)]
+    user_ids = [r[0] for path in chunks for r in _sheet_rows(path)[1:]]
+    assert user_ids == list(range(1, 51))
+
+
+def test_bad_header_in_later_file_keeps_previous_output(folder):
+    assert flows._build_rfm_scores_file(folder)[0]
+    before = _sheet_rows(folder / "rfm_scores.xlsx")
+    _write_rfm_data(folder / "2_rfm_data.xlsx", 31, 20, headers=RFM_DATA_HEADERS[:-1])
+
+    ok, _, _ = flows._build_rfm_scores_file(folder)
+
+    assert not ok
+    assert _sheet_rows(folder / "rfm_scores.xlsx") == before
+    assert sorted(p.name for p in folder.glob("*rfm_scores*")) == ["rfm_scores.xlsx"]
+
+
+def test_failure_while_writing_keeps_previous_output(folder, monkeypatch):
+    assert flows._build_rfm_scores_file(folder)[0]
+    before = _sheet_rows(folder / "rfm_scores.xlsx")
+    calls = []
+
+    def failing_append(writer, rows, *args):
+        calls.append(len(rows))
+        if len(calls) == 2:
+            raise ValueError("boom")
+        return original(writer, rows, *args)
+
+    original = flows._append_scores
+    monkeypatch.setattr(flows, "_append_scores", failing_append)
+
+    ok, _, _ = flows._build_rfm_scores_file(folder)
+
+    assert not ok
+    assert _sheet_rows(folder / "rfm_scores.xlsx") == before
+    assert sorted(p.name for p in folder.iterdir() if "rfm_scores" in p.name) == ["rfm_scores.xlsx"]
@@ -0,0 +1,158 @@
+"""
+امتیازدهی برداری (score_values / assign_segments)، کوئری rfm_scores و مسیر سریع تاریخ شمسی در برابر
+الگوریتم اولیه پروژه (حلقه روی بازه‌ها و قواعد، و jdatetime) روی مقدارهای مرزی.
+"""
+import itertools
+from datetime import date, datetime, timedelta, timezone
+
+import jdatetime
+import numpy as np
+import pytest
+
+from core.db_manager import SQLiteManager
+from core.jalali import to_shamsi, unix_to_shamsi
+from core.rfm_numpy import assign_segments, compile_segment_rules, compile_thresholds, score_values
+from core.rfm_scores import RFM_SCORES_TABLE, create_rfm_scores_table, save_rfm_thresholds, save_segment_rules
+
+# بازه‌ها با شکاف (61..62)، هم‌پوشانی (150..180)، min یکسان، بازه تک‌مقداری و بازه باریک کنار بازه پهن
+# (مرکز بازه باریک به max بازه پهن نزدیک‌تر از مرکز خودش است)
+THRESHOLDS = {
+    "recency_days": [(0, 60, 5), (60.5, 61, 4), (62, 180, 3), (150, 365, 2), (366, 2000, 1)],
+    "total_orders": [(1, 1, 1), (2, 2, 2), (3, 4, 3), (3, 9, 4), (10, 100, 5)],
+    "total_spent": [(1000, 50000, 1), (50000.5, 200000, 2), (200001, 900000, 3), (900001, 5e6, 4), (4e6, 1e9, 5)],
+}
+
+SEGMENT_RULES = [
+    ("Champions", 4, 5, 4, 5, 4, 5),
+    ("Loyal", 3, 5, 3, 5, 1, 5),
+    ("Lost", 1, 2, 0, 5, 0, 5),
+    ("Zero", 0, 0, 0, 5, 0, 5),
+    # کران بزرگ‌تر از جدول lookup (مسیر پیمایش قواعد)
+    ("Outlier", 70, 100, 0, 100, 0, 100),
+]
+
+
+def _baseline_score(value, rules):
+    """الگوریتم اولیه: اولین بازه در بر دارنده، کمتر از اولی / بیشتر از آخری، نزدیک‌ترین مرکز."""
+    if value is None:
+        return 0
+    v = float(value)
+    for min_v, max_v, score in rules:
+        if min_v <= v <= max_v:
+            return score
+    if v < rules[0][0]:
+        return rules[0][2]
+    if v > rules[-1][1]:
+        return rules[-1][2]
+    best_score, best_dist = rules[0][2], float("inf")
+    for min_v, max_v, score in rules:
+        d = abs(v - (min_v + max_v) / 2)
+        if d < best_dist:
+            best_dist, best_score = d, score
+    return best_score
+
+
+def _baseline_segment(r, f, m, rules):
+    for seg, r_min, r_max, f_min, f_max, m_min, m_max in rules:
+        if r_min <= r <= r_max and f_min <= f <= f_max and m_min <= m <= m_max:
+            return seg
+    return "Unclassified"
+
+
+def _boundary_values(rules):
+    """هر min، max و مرکز با همسایه‌های نزدیکشان، بیرون از همه بازه‌ها و NULL."""
+    points = {v for min_v, max_v, _ in rules for v in (min_v, max_v, (min_v + max_v) / 2)}
+    values = [p + delta for p in sorted(points) for delta in (0, -0.5, 0.5, -1e-9, 1e-9)]
+    return values + [rules[0][0] - 1e6, rules[-1][1] + 1e6, -1.0, None]
+
+
+@pytest.mark.parametrize("metric", list(THRESHOLDS))
+def test_score_values_matches_baseline(metric):
+    rules = sorted(THRESHOLDS[metric])
+    values = _boundary_values(rules)
+    arr = np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+    got = score_values(arr, compile_thresholds(rules)).tolist()
+    assert got == [_baseline_score(v, rules) for v in values]
+
+
+def test_assign_segments_matches_baseline():
+    combos = list(itertools.product([-1, 0, 1, 2, 3, 4, 5, 6, 64, 65, 80], repeat=3))
+    r, f, m = (np.array(col, dtype=np.int64) for col in zip(*combos))
+    got = assign_segments(r, f, m, compile_segment_rules(SEGMENT_RULES)).tolist()
+    assert got == [_baseline_segment(*combo, SEGMENT_RULES) for combo in combos]
+
+
+@pytest.fixture
+def db(tmp_path):
+    manager = SQLiteManager(tmp_path / "converted.db").connect()
+    yield manager
+    manager.close()
+
+
+def test_sql_scores_match_baseline(db):
+    metric_names = ("recency_days", "total_orders", "total_spent")
+    columns = [_boundary_values(sorted(THRESHOLDS[metric])) for metric in metric_names]
+    # طول ستون‌ها فرق دارد، پس هر ردیف ترکیب دیگری از مقدارهای مرزی سه معیار است
+    rows = []
+    for i in range(3 * max(len(values) for values in columns)):
+        metrics = [values[i % len(values)] for values in columns]
+        rows.append((i, "2024-01-01 10:00:00", "1402/10/11 10:00:00", *metrics, 500))
+    db.execute(
+        "CREATE TABLE rfm_data (user_id INTEGER, last_order_date TEXT, last_order_date_shamsi TEXT,"
+        " recency_days REAL, total_orders REAL, total_spent REAL, last_order_amount REAL)"
+    )
+    db.conn.executemany("INSERT INTO rfm_data VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+    save_rfm_thresholds(db, THRESHOLDS)
+    save_segment_rules(db, SEGMENT_RULES)
+    assert create_rfm_scores_table(db) == (True, None)
+
+    got = db.execute(
+        f'SELECT user_id, r_score, f_score, m_score, segment FROM "{RFM_SCORES_TABLE}" ORDER BY rowid'
+    ).fetchall()
+    expected = []
+    for user_id, _, _, recency, orders, spent, _ in rows:
+        scores = [
+            _baseline_score(value, sorted(THRESHOLDS[metric]))
+            for metric, value in (("recency_days", recency), ("total_orders", orders), ("total_spent", spent))
+        ]
+        expected.append((user_id, *scores, _baseline_segment(*scores, SEGMENT_RULES)))
+    assert got == expected
+
+
+def test_sql_scores_report_missing_thresholds(db):
+    db.execute("CREATE TABLE rfm_data (user_id INTEGER, recency_days REAL, total_orders REAL, total_spent REAL)")
+    save_rfm_thresholds(db, {"recency_days": THRESHOLDS["recency_days"]})
+    ok, err = create_rfm_scores_table(db)
+    assert not ok and "total_orders" in err
+
+
+def _jdatetime_text(dt: datetime) -> str:
+    return jdatetime.datetime.fromgregorian(datetime=dt).strftime("%Y/%m/%d %H:%M:%S")
+
+
+def _boundary_dates():
+    """نوروز و اسفند هر سال در چند قرن، کبیسه‌ها، لبه‌های مسیر سریع و همه روزهای چند سال اخیر."""
+    days = {date(1970, 1, 1), date(2000, 2, 29), date(2100, 2, 28), date(2100, 3, 1)}
+    for year in list(range(1622, 1632)) + list(range(1900, 2101)) + list(range(2990, 3000)):
+        days.update(date(year, 3, day) for day in range(18, 24))
+        days.update({date(year, 1, 1), date(year, 12, 31)})
+    start = date(2020, 1, 1)
+    days.update(start + timedelta(days=i) for i in range(5 * 366))
+    return sorted(days)
+
+
+def test_to_shamsi_fast_path_matches_jdatetime():
+    for day in _boundary_dates():
+        for clock in ("00:00:00", "23:59:59"):
+            text = f"{day.isoformat()} {clock}"
+            assert to_shamsi(text) == _jdatetime_text(datetime.strptime(text, "%Y-%m-%d %H:%M:%S")), text
+
+
+def test_unix_to_shamsi_fast_path_matches_jdatetime():
+    for day in _boundary_dates():
+        midnight = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+        for offset in (0, 1, 86399):
+            ts = int(midnight.timestamp()) + offset
+            expected = _jdatetime_text(datetime.fromtimestamp(ts, timezone.utc).replace(tzinfo=None))
+            assert unix_to_shamsi(ts) == expected, ts
+            assert unix_to_shamsi(str(ts)) == expected, ts
@@ -0,0 +1,55 @@
+"""
+user_full_data با پیوت فیلترشده usermeta همان خروجی پیوت کامل قبلی را می‌دهد، از جمله برای کاربری که
+فقط meta بی‌ربط دارد (digits_phone => '') و کاربر بدون هیچ meta (NULL).
+"""
+import pytest
+
+from core.db_manager import SQLiteManager
+from core.duckdb_engine import duckdb_available
+from core.user_full_data import create_user_full_data_table
+
+USERS = [
+    (1, "a@example.com", "2024-01-01 10:00:00", "A"),
+    (2, "b@example.com", "2024-02-01 10:00:00", "B"),
+    (3, "c@example.com", "2024-03-01 10:00:00", "C"),
+    (4, "d@example.com", "2024-04-01 10:00:00", "D"),
+]
+
+USERMETA = [
+    (1, 1, "first_name", "علی"),
+    (2, 1, "digits_phone", "+98 912-000 0000"),
+    (3, 1, "rich_editing", "true"),
+    # کاربر ۲ فقط meta بی‌ربط دارد
+    (4, 2, "rich_editing", "true"),
+    (5, 2, "session_tokens", "x"),
+    # کاربر ۳ کلید خواسته‌شده دارد ولی تلفن ندارد؛ کاربر ۴ هیچ meta ندارد
+    (6, 3, "nickname", "c"),
+]
+
+
+@pytest.fixture
+def db(tmp_path):
+    manager = SQLiteManager(tmp_path / "converted.db").connect()
+    manager.execute("CREATE TABLE users (ID INTEGER, user_email TEXT, user_registered TEXT, display_name TEXT)")
+    manager.execute("CREATE TABLE usermeta (umeta_id INTEGER, user_id INTEGER, meta_key TEXT, meta_value TEXT)")
+    manager.conn.executemany("INSERT INTO users VALUES (?, ?, ?, ?)", USERS)
+    manager.conn.executemany("INSERT INTO usermeta VALUES (?, ?, ?, ?)", USERMETA)
+    manager.ensure_recommended_indexes()
+    yield manager
+    manager.close()
+
+
+@pytest.mark.parametrize("engine", ["sqlite", "duckdb"])
+def test_users_without_wanted_meta_keep_old_values(db, engine):
+    if engine == "duckdb" and not duckdb_available():
+        pytest.skip("duckdb نصب نیست")
+    assert create_user_full_data_table(db, engine=engine)
+    rows = db.execute(
+        "SELECT ID, first_name, nickname, digits_phone, wc_last_active_shamsi FROM user_full_data ORDER BY ID"
+    ).fetchall()
+    assert rows == [
+        (1, "علی", None, "09120000000", ""),
+        (2, None, None, "", ""),
+        (3, None, "c", "", ""),
+        (4, None, None, None, ""),
+    ]
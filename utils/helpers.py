@@ -1,7 +1,10 @@
 import gzip
 import os
 import re
+import time
+import uuid
 from collections import Counter
+from datetime import datetime
 from pathlib import Path
 
 import chardet
@@ -106,10 +109,110 @@ def get_shamsi_date() -> str:
     return now.strftime("%Y/%m/%d")
 
 
-def create_output_folder(base_dir: Path, folder_name: str) -> Path:
+# فایل قفل داخل پوشه خروجی در حال ساخت
+OUTPUT_LOCK_NAME = ".lock"
+
+# قفلی که pid خوانایی ندارد (اجرا پیش از نوشتن pid کشته شده) بعد از این مدت (ثانیه) رهاشده حساب می‌شود
+_UNREADABLE_LOCK_STALE_SECONDS = 3600
+
+
+def create_workspace_db(workspace_dir: Path, name: str) -> Path:
+    """مسیر یکتای دیتابیس موقت برای یک اجرا (نام، زمان، pid و شناسه تصادفی)."""
+    workspace_dir = ensure_dir(workspace_dir)
+    safe_name = "".join(c for c in name if c.isalnum() or c in "_-") or "run"
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return workspace_dir / f"{safe_name}_{stamp}_{os.getpid()}_{uuid.uuid4().hex[:6]}.db"
+
+
+def remove_workspace_db(db_path: Path) -> None:
+    """حذف دیتابیس موقت یک اجرا همراه فایل‌های -wal و -shm."""
+    db_path = Path(db_path)
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        try:
+            Path(str(db_path) + suffix).unlink()
+        except FileNotFoundError:
+            pass
+        except OSError:
+            pass
+
+
+def _pid_alive(pid: int) -> bool:
+    """آیا پردازه pid هنوز اجرا می‌شود (در ویندوز با OpenProcess، چون os.kill آنجا پردازه را می‌بندد)."""
+    if pid <= 0:
+        return False
+    if os.name == "nt":
+        import ctypes
+
+        kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+        # PROCESS_QUERY_LIMITED_INFORMATION
+        handle = kernel32.OpenProcess(0x1000, False, pid)
+        if not handle:
+            # ERROR_ACCESS_DENIED: پردازه هست ولی مال کاربر دیگری است
+            return ctypes.get_last_error() == 5
+        try:
+            exit_code = ctypes.c_ulong()
+            if not kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code)):
+                return True
+            # STILL_ACTIVE
+            return exit_code.value == 259
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+def _is_stale_lock(lock_path: Path) -> bool:
+    """
+    قفل رهاشده از اجرایی که بی‌خبر بسته شده (kill، بستن پنجره کنسول): pid داخل قفل دیگر اجرا نمی‌شود،
+    یا pid خوانا نیست و قفل از _UNREADABLE_LOCK_STALE_SECONDS قدیمی‌تر است.
+    """
+    try:
+        text = lock_path.read_text(encoding="utf-8").strip()
+        age = time.time() - lock_path.stat().st_mtime
+    except FileNotFoundError:
+        return False
+    except OSError:
+        return False
+    if text.isdigit():
+        return not _pid_alive(int(text))
+    return age > _UNREADABLE_LOCK_STALE_SECONDS
+
+
+def is_output_folder_locked(folder: Path) -> bool:
+    """
+    آیا پوشه خروجی هنوز توسط اجرای دیگری در حال ساخت است. قفل رهاشده (_is_stale_lock) همین‌جا
+    برداشته می‌شود تا پوشه برای seed و مرحله «داده موجود» دوباره در دسترس باشد.
+    """
+    lock_path = Path(folder) / OUTPUT_LOCK_NAME
+    if not lock_path.exists():
+        return False
+    if _is_stale_lock(lock_path):
+        unlock_output_folder(folder)
+        return False
+    return True
+
+
+def unlock_output_folder(folder: Path) -> None:
+    try:
+        (Path(folder) / OUTPUT_LOCK_NAME).unlink()
+    except FileNotFoundError:
+        pass
+
+
+def create_output_folder(base_dir: Path, folder_name: str, lock: bool = False) -> Path:
     """
     داخل base_dir یک پوشه با نام folder_name می‌سازد.
     همیشه با شماره است: folder_1، folder_2، ... (حتی اولین بار).
+    شماره‌گذاری اتمیک است: mkdir بدون exist_ok پوشه را رزرو می‌کند و اگر اجرای هم‌زمان دیگری
+    همان شماره را گرفته باشد شماره بعدی امتحان می‌شود.
+    lock=True: فایل .lock داخل پوشه ساخته می‌شود تا پایان کار با unlock_output_folder برداشته شود.
     """
     base_dir = Path(base_dir)
     base_dir.mkdir(parents=True, exist_ok=True)
@@ -127,17 +230,84 @@ def create_output_folder(base_dir: Path, folder_name: str) -> Path:
                 existing.append(int(m.group(1)))
     n = max(existing, default=0) + 1
 
-    candidate = base_dir / f"{safe_name}_{n}"
-    candidate.mkdir(parents=True, exist_ok=True)
+    while True:
+        candidate = base_dir / f"{safe_name}_{n}"
+        try:
+            candidate.mkdir()
+            break
+        except FileExistsError:
+            n += 1
+
+    if lock:
+        fd = os.open(candidate / OUTPUT_LOCK_NAME, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(str(os.getpid()))
     return candidate
 
 
+def find_output_folders(base_dir: Path, folder_name: str, required_file: str = "converted.db") -> list[Path]:
+    """
+    پوشه‌های خروجی folder_name_N که قفل نیستند و required_file را دارند، جدیدترین (بزرگ‌ترین N) اول.
+    """
+    base_dir = Path(base_dir)
+    if not base_dir.is_dir():
+        return []
+    safe_name = "".join(c for c in folder_name if c.isalnum() or c in "_-") or "output"
+    pattern = re.compile(re.escape(safe_name) + r"_(\d+)$")
+    candidates = []
+    for p in base_dir.iterdir():
+        m = pattern.match(p.name)
+        if m and p.is_dir() and not is_output_folder_locked(p) and (p / required_file).is_file():
+            candidates.append((int(m.group(1)), p))
+    return [p for _, p in sorted(candidates, reverse=True)]
+
+
+def site_identity(dump_name: str, site_url: str | None = None) -> str:
+    """
+    شناسه سایت یک دامپ برای جدا کردن آمار ماندگار سایت‌ها با پیشوند جدول یکسان (مثلاً همه wp_):
+    siteurl جدول options بدون پروتکل، www و / آخر؛ اگر نبود نام فایل دامپ بدون پسوند (.sql / .gz).
+    """
+    if site_url and site_url.strip():
+        url = site_url.strip().lower()
+        url = re.sub(r"^[a-z][a-z0-9+.-]*://", "", url)
+        url = url.removeprefix("www.").rstrip("/")
+        return f"url:{url}"
+    name = Path(str(dump_name)).name
+    for suffix in (".gz", ".sql"):
+        name = name.removesuffix(suffix)
+    return f"dump:{name}"
+
+
+def find_chunk_files(folder: Path, base_name: str, suffix: str = ".xlsx") -> list[Path]:
+    """
+    فایل‌های chunked یک خروجی به ترتیب شماره: 1_{base}.xlsx, 2_{base}.xlsx, ...
+    اگر نبودند فایل تکی {base}.xlsx (خروجی‌های قدیمی‌تر)؛ در غیر این صورت [].
+    """
+    folder = Path(folder)
+    if not folder.is_dir():
+        return []
+    pattern = re.compile(r"(\d+)_" + re.escape(base_name + suffix) + "$")
+    chunks = []
+    for p in folder.iterdir():
+        m = pattern.match(p.name)
+        if m and p.is_file():
+            chunks.append((int(m.group(1)), p))
+    if chunks:
+        return [p for _, p in sorted(chunks)]
+    single = folder / f"{base_name}{suffix}"
+    return [single] if single.is_file() else []
+
+
 def _format_table_stats(
     table_row_counts: dict[str, int],
     table_groups: dict[str, list[str]],
     complete_groups: list[str],
+    table_stats: dict[str, dict] = None,
 ) -> list[str]:
-    """فرمت جدول برای نمایش آمار دیتابیس موقت."""
+    """
+    فرمت جدول برای نمایش آمار دیتابیس موقت.
+    table_stats (محتوای جدول _stats) اگر داده شود، حجم و زمان ساخت هر جدول هم نمایش داده می‌شود.
+    """
     rows = []
     # نگاشت جدول -> گروه
     table_to_group = {}
@@ -149,13 +319,28 @@ def _format_table_stats(
     if "wp" in complete_groups and "customer_purchases" in table_row_counts:
         table_to_group["customer_purchases"] = "wp"
 
-    # سطر هدر
-    rows.append("گروه | جدول | تعداد رکورد")
-    rows.append("-" * 45)
+    if not table_stats:
+        # سطر هدر
+        rows.append("گروه | جدول | تعداد رکورد")
+        rows.append("-" * 45)
+
+        for table, count in sorted(table_row_counts.items()):
+            group = table_to_group.get(table, "-")
+            rows.append(f"{group} | {table} | {count}")
+
+        return rows
+
+    rows.append("گروه | جدول | تعداد رکورد | حجم (MB) | زمان ساخت (ثانیه)")
+    rows.append("-" * 70)
 
     for table, count in sorted(table_row_counts.items()):
         group = table_to_group.get(table, "-")
-        rows.append(f"{group} | {table} | {count}")
+        stat = table_stats.get(table, {})
+        size = stat.get("byte_size")
+        seconds = stat.get("build_seconds")
+        size_txt = f"{size / (1024 * 1024):.2f}" if size is not None else "-"
+        seconds_txt = f"{seconds:.2f}" if seconds is not None else "-"
+        rows.append(f"{group} | {table} | {count} | {size_txt} | {seconds_txt}")
 
     return rows
 
@@ -169,8 +354,13 @@ def write_output_readme(
     table_row_counts: dict[str, int] = None,
     rfm_from_shamsi_date: str = "0",
     excel_files: list[str] = None,
+    table_stats: dict[str, dict] = None,
 ) -> Path:
-    """فایل README داخل پوشه خروجی با تاریخ، نام فایل، حجم، وضعیت لیست‌ها و آمار دیتابیس موقت."""
+    """
+    فایل README داخل پوشه خروجی با تاریخ، نام فایل، حجم، وضعیت لیست‌ها و آمار دیتابیس موقت.
+    table_stats: محتوای جدول _stats (تعداد ردیف، حجم و زمان ساخت)؛ اگر table_row_counts
+    داده نشود، تعدادها هم از همین آمار خوانده می‌شوند.
+    """
     readme_path = folder / "README.txt"
     shamsi_date = get_shamsi_date()
     lines = [
@@ -191,12 +381,20 @@ def write_output_readme(
     else:
         lines.append("RFM از تاریخ شمسی: از ابتدا")
 
+    if table_row_counts is None and table_stats:
+        table_row_counts = {
+            name: stat["row_count"] for name, stat in table_stats.items() if stat.get("row_count") is not None
+        }
+
     if table_row_counts and complete_groups and table_groups:
         lines.append("")
         lines.append("دیتابیس موقت:")
         lines.append(f"  تعداد جدول‌ها: {len(table_row_counts)}")
         lines.append("")
-        lines.extend("  " + row for row in _format_table_stats(table_row_counts, table_groups, complete_groups))
+        lines.extend(
+            "  " + row
+            for row in _format_table_stats(table_row_counts, table_groups, complete_groups, table_stats)
+        )
 
     if excel_files:
         lines.append("")